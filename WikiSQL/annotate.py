@@ -6,7 +6,7 @@ import ujson as json
 from stanza.nlp.corenlp import CoreNLPClient
 from tqdm import tqdm
 import copy
-from lib.common import count_lines, detokenize
+from lib.common import count_lines, detokenize, open_file
 from lib.query import Query
 
 
@@ -99,7 +99,7 @@ if __name__ == '__main__':
         fout = os.path.join(args.dout, split) + '.jsonl'
 
         print('annotating {}'.format(fsplit))
-        with open(fsplit) as fs, open(ftable) as ft, open(fout, 'wt') as fo:
+        with open_file(fsplit) as fs, open_file(ftable) as ft, open_file(fout, 'wt') as fo:
             print('loading tables')
             tables = {}
             for line in tqdm(ft, total=count_lines(ftable)):
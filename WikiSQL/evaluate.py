@@ -1,10 +1,61 @@
 #!/usr/bin/env python
+import sys
 import json
 from argparse import ArgumentParser
 from tqdm import tqdm
 from lib.dbengine import DBEngine
 from lib.query import Query
-from lib.common import count_lines
+from lib.common import count_lines, open_file
+
+
+def execute_grouped(engine, jobs):
+    # runs (table_id, query) jobs grouped by table so each table is looked up/read once, and returns the
+    # results (or the exceptions raised) in job order
+    groups = {}
+    for i, (table_id, query) in enumerate(jobs):
+        groups.setdefault(table_id, []).append(i)
+    results = [None] * len(jobs)
+    with tqdm(total=len(jobs)) as bar:
+        for table_id, indices in groups.items():
+            out = engine.execute_batch(table_id, [jobs[i][1] for i in indices], lower=True)
+            for i, result in zip(indices, out):
+                results[i] = result
+            bar.update(len(indices))
+    return results
+
+
+def grade_batched(engine, fs, fp, ordered=False):
+    jobs = []
+    examples = []
+    for ls, lp in zip(fs, fp):
+        eg = json.loads(ls)
+        ep = json.loads(lp)
+        qg = Query.from_dict(eg['sql'], ordered=ordered)
+        jobs.append((eg['table_id'], qg))
+        gold = len(jobs) - 1
+        pred = ep.get('error', None)
+        qp = None
+        if not ep.get('error', None):
+            try:
+                qp = Query.from_dict(ep['query'], ordered=ordered)
+                jobs.append((eg['table_id'], qp))
+                pred = len(jobs) - 1
+            except Exception as e:
+                pred = repr(e)
+        examples.append((gold, pred, qg, qp))
+    results = execute_grouped(engine, jobs)
+    grades, exact_match = [], []
+    for gold, pred, qg, qp in examples:
+        gold = results[gold]
+        if isinstance(gold, Exception):
+            raise gold
+        if qp is not None:
+            pred = results[pred]
+            if isinstance(pred, Exception):
+                pred = repr(pred)
+        grades.append(pred == gold)
+        exact_match.append(qp == qg)
+    return grades, exact_match
 
 
 if __name__ == '__main__':
@@ -13,30 +64,45 @@ if __name__ == '__main__':
     parser.add_argument('db_file', help='source database for the prediction')
     parser.add_argument('pred_file', help='predictions by the model')
     parser.add_argument('--ordered', action='store_true', help='whether the exact match should consider the order of conditions')
+    parser.add_argument('--engine', choices=['sqlite', 'columnar'], default='sqlite', help='execute queries in SQLite or in the in-process numpy engine (same results)')
+    parser.add_argument('--backend', choices=['records', 'sqlite3'], default='records', help='connection used by the sqlite engine: records/SQLAlchemy or raw sqlite3 (same results)')
+    parser.add_argument('--batched', action='store_true', help='execute gold and predicted queries grouped by table, reading each table once (same results)')
+    parser.add_argument('--catalog', choices=['lazy', 'eager'], default='lazy', help='read each table schema on first use or all schemas up front (same results)')
+    parser.add_argument('--stats', action='store_true', help='print statement cache hit rates to stderr')
     args = parser.parse_args()
 
-    engine = DBEngine(args.db_file)
+    if args.engine == 'columnar':
+        from lib.columnar import ColumnarEngine
+        engine = ColumnarEngine(args.db_file)
+    else:
+        engine = DBEngine(args.db_file, catalog=args.catalog, backend=args.backend)
     exact_match = []
-    with open(args.source_file) as fs, open(args.pred_file) as fp:
-        grades = []
-        for ls, lp in tqdm(zip(fs, fp), total=count_lines(args.source_file)):
-            eg = json.loads(ls)
-            ep = json.loads(lp)
-            qg = Query.from_dict(eg['sql'], ordered=args.ordered)
-            gold = engine.execute_query(eg['table_id'], qg, lower=True)
-            pred = ep.get('error', None)
-            qp = None
-            if not ep.get('error', None):
-                try:
-                    qp = Query.from_dict(ep['query'], ordered=args.ordered)
-                    pred = engine.execute_query(eg['table_id'], qp, lower=True)
-                except Exception as e:
-                    pred = repr(e)
-            correct = pred == gold
-            match = qp == qg
-            grades.append(correct)
-            exact_match.append(match)
+    with open_file(args.source_file) as fs, open_file(args.pred_file) as fp:
+        if args.batched:
+            grades, exact_match = grade_batched(engine, fs, fp, ordered=args.ordered)
+        else:
+            grades = []
+            for ls, lp in tqdm(zip(fs, fp), total=count_lines(args.source_file)):
+                eg = json.loads(ls)
+                ep = json.loads(lp)
+                qg = Query.from_dict(eg['sql'], ordered=args.ordered)
+                gold = engine.execute_query(eg['table_id'], qg, lower=True)
+                pred = ep.get('error', None)
+                qp = None
+                if not ep.get('error', None):
+                    try:
+                        qp = Query.from_dict(ep['query'], ordered=args.ordered)
+                        pred = engine.execute_query(eg['table_id'], qp, lower=True)
+                    except Exception as e:
+                        pred = repr(e)
+                correct = pred == gold
+                match = qp == qg
+                grades.append(correct)
+                exact_match.append(match)
         print(json.dumps({
             'ex_accuracy': sum(grades) / len(grades),
             'lf_accuracy': sum(exact_match) / len(exact_match),
             }, indent=2))
+        if args.stats:
+            print('statement cache: {hits} hits, {misses} misses ({hit_rate:.2%} hit rate)'.format(
+                **engine.statement_cache_info()), file=sys.stderr)
@@ -0,0 +1,298 @@
+import operator
+import os
+import re
+import sqlite3
+from collections import OrderedDict
+from functools import lru_cache
+from urllib.parse import quote
+import numpy as np
+from lib.dbengine import condition_value, parse_schema, table_name
+from lib.query import Query
+
+
+# In-process engine for WikiSQL queries: each table is loaded once from the database into typed column
+# arrays and queries run as numpy masks and aggregations. Results match DBEngine.execute, which means
+# following SQLite's comparison rules: NULL never matches, numbers < text < blobs across storage classes,
+# a bound number compared with a TEXT column is compared as SQLite's text rendering of it, and a bound
+# string compared with a numeric column is converted if it looks like a number. Conversions whose exact
+# output depends on the SQLite build (real <-> text) and SUM/AVG over anything but plain numbers are
+# delegated to an in-memory sqlite3 connection and memoized, so those stay bit-identical too.
+# Rows are returned in rowid order, which is what DBEngine returns on the official (unindexed) databases.
+
+NULL, NUMBER, TEXT, BLOB = range(4)
+TEXT_AFFINITY, NUMERIC_AFFINITY, NO_AFFINITY = range(3)
+
+compare_ops = {'=': operator.eq, '>': operator.gt, '<': operator.lt}
+
+# SUM/AVG since SQLite 3.43 use Kahan-Babuska-Neumaier summation for floats, before that a plain running sum
+compensated_sum = sqlite3.sqlite_version_info >= (3, 43, 0)
+
+sqlite_space = ' \t\n\v\f\r'
+int_re = re.compile(r'[+-]?[0-9]+')
+real_re = re.compile(r'[+-]?(?:[0-9]+\.?[0-9]*|\.[0-9]+)(?:[eE][+-]?[0-9]+)?')
+int64_min, int64_max = -(1 << 63), (1 << 63) - 1
+float_exact = 1 << 53
+
+
+def column_affinity(col_type):
+    # SQLite's rules for the declared type; INTEGER/REAL/NUMERIC affinities compare the same way
+    t = col_type.upper()
+    if 'INT' in t:
+        return NUMERIC_AFFINITY
+    if 'CHAR' in t or 'CLOB' in t or 'TEXT' in t:
+        return TEXT_AFFINITY
+    if 'BLOB' in t or not t:
+        return NO_AFFINITY
+    return NUMERIC_AFFINITY
+
+
+def storage_class(value):
+    if value is None:
+        return NULL
+    if isinstance(value, (int, float)):
+        return NUMBER
+    if isinstance(value, str):
+        return TEXT
+    return BLOB
+
+
+class SQLiteValues:
+    # conversions that are delegated to SQLite itself
+
+    def __init__(self, cache_size=1 << 16):
+        self.conn = sqlite3.connect(':memory:', check_same_thread=False)
+        self.conn.execute('CREATE TABLE v (x)')
+        self.to_text = lru_cache(cache_size)(self._to_text)
+        self.to_real = lru_cache(cache_size)(self._to_real)
+
+    def _to_text(self, value):
+        return self.conn.execute('SELECT CAST(? AS TEXT)', (value,)).fetchone()[0]
+
+    def _to_real(self, value):
+        return self.conn.execute('SELECT CAST(? AS REAL)', (value,)).fetchone()[0]
+
+    def numeric(self, text):
+        # the number a string converts to under numeric affinity, or None if it does not look like one
+        t = text.strip(sqlite_space)
+        if int_re.fullmatch(t):
+            i = int(t)
+            if int64_min <= i <= int64_max:
+                return i
+            return self.to_real(text)
+        if real_re.fullmatch(t):
+            return self.to_real(text)
+        return None
+
+    def aggregate(self, agg, values):
+        with self.conn:
+            self.conn.execute('DELETE FROM v')
+            self.conn.executemany('INSERT INTO v VALUES (?)', [(v,) for v in values])
+            return self.conn.execute('SELECT {}(x) FROM v'.format(agg)).fetchone()[0]
+
+
+class Column:
+
+    def __init__(self, values, col_type):
+        n = len(values)
+        self.affinity = column_affinity(col_type)
+        self.values = np.empty(n, dtype=object)
+        self.values[:] = values
+        self.kinds = np.fromiter((storage_class(v) for v in values), dtype=np.int8, count=n)
+        self.is_kind = [self.kinds == k for k in range(4)]
+        self.has_kind = [bool(m.any()) for m in self.is_kind]
+        self.is_int = np.fromiter((isinstance(v, int) for v in values), dtype=bool, count=n)
+        self.nums = np.array([v if k == NUMBER else np.nan for v, k in zip(values, self.kinds)], dtype=np.float64)
+        self.exact = all(-float_exact <= v <= float_exact for v in self.values[self.is_int])
+        self.texts = np.empty(n, dtype=object)
+        self.texts[:] = [v if k == TEXT else '' for v, k in zip(values, self.kinds)]
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def compare(self, op, param):
+        # rows where `column op param` holds, with param already converted by the column affinity
+        kind = storage_class(param)
+        out = np.zeros(len(self), dtype=bool)
+        if kind == NULL:
+            return out
+        for k in (NUMBER, TEXT, BLOB):
+            if not self.has_kind[k]:
+                continue
+            if k != kind:
+                if (k < kind) == (op == '<') and op != '=':
+                    out |= self.is_kind[k]
+            elif k == NUMBER and self.exact and (isinstance(param, float) or -float_exact <= param <= float_exact):
+                out |= self.is_kind[k] & compare_ops[op](self.nums, param)
+            elif k == TEXT:
+                out |= self.is_kind[k] & compare_ops[op](self.texts, param)
+            else:
+                for i in np.flatnonzero(self.is_kind[k]):
+                    out[i] = compare_ops[op](self.values[i], param)
+        return out
+
+
+class ColumnarTable:
+
+    def __init__(self, name, schema, names, rows):
+        self.name = name
+        self.schema = schema
+        self.num_rows = len(rows)
+        self.columns = {}
+        for i, c in enumerate(names):
+            self.columns[c] = Column([r[i] for r in rows], schema.get(c, ''))
+
+
+class ColumnarEngine:
+
+    def __init__(self, fdb, max_tables=256):
+        self.conn = sqlite3.connect('file:{}?mode=ro'.format(quote(os.path.abspath(fdb))), uri=True)
+        self.sqlite = SQLiteValues()
+        # loaded tables, least recently used first; at most max_tables are kept (None keeps every table)
+        self.tables = OrderedDict()
+        self.max_tables = max_tables
+        # parsed aggregation/operators per query shape, keyed like DBEngine.statements
+        self.plans = {}
+        self.plan_hits = self.plan_misses = 0
+
+    def execute_query(self, table_id, query, *args, **kwargs):
+        return self.execute(table_id, query.sel_index, query.agg_index, query.conditions, *args, **kwargs)
+
+    def read_table(self, table_id):
+        table_info = self.conn.execute('SELECT sql from sqlite_master WHERE tbl_name = ?', (table_id,)).fetchall()[0][0]
+        schema = parse_schema(table_info)
+        cursor = self.conn.execute('SELECT * FROM "{}" ORDER BY rowid'.format(table_id.replace('"', '""')))
+        names = [d[0] for d in cursor.description]
+        return ColumnarTable(table_id, schema, names, cursor.fetchall())
+
+    def load_table(self, table_id):
+        table_id = table_name(table_id)
+        table = self.tables.get(table_id)
+        if table is None:
+            table = self.tables[table_id] = self.read_table(table_id)
+            if self.max_tables is not None and len(self.tables) > self.max_tables:
+                self.tables.popitem(last=False)
+        else:
+            self.tables.move_to_end(table_id)
+        return table
+
+    def execute(self, table_id, select_index, aggregation_index, conditions, lower=True):
+        return self.execute_on(self.load_table(table_id), select_index, aggregation_index, conditions, lower)
+
+    def execute_batch(self, table_id, queries, lower=True):
+        # runs several queries on one table, reading it once without caching it (a batch visits each table once);
+        # returns each result or the exception it raised
+        table_id = table_name(table_id)
+        try:
+            table = self.tables.get(table_id) or self.read_table(table_id)
+        except Exception as e:
+            return [e] * len(queries)
+        results = []
+        for query in queries:
+            try:
+                results.append(self.execute_on(table, query.sel_index, query.agg_index, query.conditions, lower))
+            except Exception as e:
+                results.append(e)
+        return results
+
+    def execute_on(self, table, select_index, aggregation_index, conditions, lower=True):
+        schema = table.schema
+        key = (table.name, select_index, aggregation_index, tuple((col_index, op) for col_index, op, _ in conditions))
+        plan = self.plans.get(key)
+        if plan is None:
+            self.plan_misses += 1
+            plan = self.plans[key] = self.build_plan(select_index, aggregation_index, conditions)
+        else:
+            self.plan_hits += 1
+        select, agg, where = plan
+        where_map = {}
+        for col_index, op, val in conditions:
+            where_map['col{}'.format(col_index)] = condition_value(val, schema['col{}'.format(col_index)], lower)
+
+        # errors SQLite would raise when preparing and binding the statement
+        if any(op == 'OP' for _, op in where):
+            raise sqlite3.OperationalError('near "OP": syntax error')
+        if select not in table.columns:
+            raise sqlite3.OperationalError('no such column: {}'.format(select))
+        for col, val in where_map.items():
+            self.check_binding(col, val)
+
+        mask = np.ones(table.num_rows, dtype=bool)
+        for col, op in where:
+            column = table.columns[col]
+            mask &= column.compare(op, self.convert(where_map[col], column.affinity))
+        return self.aggregate(table.columns[select], agg, mask)
+
+    @staticmethod
+    def build_plan(select_index, aggregation_index, conditions):
+        agg = Query.agg_ops[aggregation_index]
+        where = [('col{}'.format(col_index), Query.cond_ops[op]) for col_index, op, _ in conditions]
+        return 'col{}'.format(select_index), agg, where
+
+    @staticmethod
+    def check_binding(col, val):
+        if isinstance(val, int) and not int64_min <= val <= int64_max:
+            raise OverflowError('Python int too large to convert to SQLite INTEGER')
+        if val is not None and not isinstance(val, (int, float, str, bytes)):
+            raise sqlite3.ProgrammingError("Error binding parameter :{} - type '{}' is not supported".format(col, type(val).__name__))
+
+    def convert(self, val, affinity):
+        if isinstance(val, float) and val != val:
+            return None  # SQLite binds NaN as NULL
+        if isinstance(val, bool):
+            val = int(val)
+        if affinity == TEXT_AFFINITY and isinstance(val, (int, float)):
+            return str(val) if isinstance(val, int) else self.sqlite.to_text(val)
+        if affinity == NUMERIC_AFFINITY and isinstance(val, str):
+            num = self.sqlite.numeric(val)
+            return val if num is None else num
+        return val
+
+    def aggregate(self, column, agg, mask):
+        if not agg:
+            return column.values[mask].tolist()
+        kinds = column.kinds[mask]
+        present = kinds[kinds != NULL]
+        if agg == 'COUNT':
+            return [len(present)]
+        if not len(present):
+            return [None]
+        if agg in ('MAX', 'MIN'):
+            kind = present.max() if agg == 'MAX' else present.min()
+            rows = np.flatnonzero(mask & column.is_kind[kind])
+            if kind == NUMBER and column.exact:
+                nums = column.nums[rows]
+                return [column.values[rows[nums.argmax() if agg == 'MAX' else nums.argmin()]]]
+            values = column.values[rows].tolist()
+            return [max(values) if agg == 'MAX' else min(values)]
+        # SUM / AVG
+        rows = mask & (column.kinds != NULL)
+        values = column.values[rows]
+        if (present == NUMBER).all():
+            ints = column.is_int[rows]
+            if ints.all():
+                total = sum(values.tolist())
+                if int64_min <= total <= int64_max:
+                    if agg == 'SUM':
+                        return [total]
+                    if compensated_sum:
+                        return [float(total) / len(values)]
+                    return [float(np.cumsum(values.astype(np.float64))[-1]) / len(values)]
+            elif not ints.any() and not compensated_sum:
+                # running float sum in row order, like sumStep (np.sum would sum pairwise); sumStep starts
+                # from 0.0, which only shows in the sign of an all -0.0 sum
+                total = float(np.cumsum(column.nums[rows])[-1]) + 0.0
+                return [total if agg == 'SUM' else total / len(values)]
+        return [self.sqlite.aggregate(agg, values.tolist())]
+
+    def close(self):
+        self.conn.close()
+        self.sqlite.conn.close()
+
+    def statement_cache_info(self):
+        total = self.plan_hits + self.plan_misses
+        return {
+            'hits': self.plan_hits,
+            'misses': self.plan_misses,
+            'hit_rate': self.plan_hits / total if total else 0.0,
+            'size': len(self.plans),
+        }
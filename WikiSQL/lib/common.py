@@ -1,8 +1,133 @@
+import io
+import queue
+import sqlite3
+import threading
+
+
+compressed_suffixes = ('.bz2', '.gz', '.xz', '.zst')
+
+
+def open_compressed(fname, mode):
+    # binary stream for a compressed file (suffix matched case-insensitively), or None if the suffix is not one
+    # of compressed_suffixes; also used by the repo's wikisql_io
+    suffix = str(fname).lower()
+    if suffix.endswith('.bz2'):
+        import bz2
+        return bz2.open(fname, mode)
+    if suffix.endswith('.gz'):
+        import gzip
+        return gzip.open(fname, mode)
+    if suffix.endswith('.xz'):
+        import lzma
+        return lzma.open(fname, mode)
+    if suffix.endswith('.zst'):
+        try:
+            import zstandard
+        except ImportError as e:
+            raise ImportError('reading or writing .zst files requires zstandard: pip install zstandard') from e
+        return zstandard.open(fname, mode)
+    return None
+
+
+class ThreadedReader(io.RawIOBase):
+    # decompresses in a background thread so parsing overlaps with decompression;
+    # also used by the repo's wikisql_io.open_text
+
+    def __init__(self, raw, block_size=1 << 20, max_blocks=8):
+        super().__init__()
+        self.raw = raw
+        self.block_size = block_size
+        self.blocks = queue.Queue(max_blocks)
+        self.stopped = threading.Event()
+        self.error = None
+        self.block = memoryview(b'')
+        self.eof = False
+        self.thread = threading.Thread(target=self._fill, daemon=True)
+        self.thread.start()
+
+    def _put(self, block):
+        while not self.stopped.is_set():
+            try:
+                self.blocks.put(block, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _fill(self):
+        try:
+            while True:
+                block = self.raw.read(self.block_size)
+                if not self._put(block) or not block:
+                    return
+        except BaseException as e:
+            self.error = e
+            self._put(None)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buf):
+        if not len(self.block):
+            if self.eof:
+                return 0
+            block = self.blocks.get()
+            if block is None:
+                # the producer failed and has exited; put the marker back so every later read raises too
+                self.blocks.put(None)
+                raise self.error
+            if not block:
+                self.eof = True
+                return 0
+            self.block = memoryview(block)
+        n = min(len(buf), len(self.block))
+        buf[:n] = self.block[:n]
+        self.block = self.block[n:]
+        return n
+
+    def close(self):
+        if not self.closed:
+            self.stopped.set()
+            while self.thread.is_alive():
+                try:
+                    self.blocks.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            self.raw.close()
+        super().close()
+
+
+def open_file(fname, mode='rt'):
+    fname = str(fname)
+    mode = mode.replace('t', '')
+    raw = open_compressed(fname, mode + 'b')
+    if raw is None:
+        return open(fname, mode)
+    if mode == 'r':
+        raw = io.BufferedReader(ThreadedReader(raw), buffer_size=1 << 20)
+    return io.TextIOWrapper(raw, encoding='utf-8')
+
+
 def count_lines(fname):
-    with open(fname) as f:
+    with open_file(fname) as f:
         return sum(1 for line in f)
 
 
+def query_rows(db, sql, **params):
+    # rows from a records Database/Connection, or plain tuples from a raw sqlite3 connection; both support row[i]
+    if isinstance(db, sqlite3.Connection):
+        return db.execute(sql, params).fetchall()
+    return db.query(sql, **params).all()
+
+
+def execute_sql(db, sql, **params):
+    # statements without result rows (CREATE/INSERT/DROP) on either kind of connection
+    if isinstance(db, sqlite3.Connection):
+        db.execute(sql, params)
+    else:
+        db.query(sql, **params)
+
+
 def detokenize(tokens):
     ret = ''
     for g, a in zip(tokens['gloss'], tokens['after']):
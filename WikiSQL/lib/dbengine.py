@@ -1,50 +1,179 @@
-import records
 import re
-from babel.numbers import parse_decimal, NumberFormatError
+import sqlite3
+from collections import OrderedDict
+from functools import lru_cache
+from babel.numbers import get_decimal_symbol, get_group_symbol, parse_decimal, NumberFormatError
+from lib.common import query_rows
 from lib.query import Query
 
 
 schema_re = re.compile(r'\((.+)\)')
 num_re = re.compile(r'[-+]?\d*\.\d+|\d+')
+# plain numbers that Decimal (and so parse_decimal) and float() read identically once group symbols are removed
+plain_number_re = re.compile(r'[-+]?(?:[0-9]+\.?[0-9]*|\.[0-9]+)(?:[eE][-+]?[0-9]+)?')
+group_symbol = None
+# query shapes whose SQL text is kept; the least recently used shape is dropped beyond this
+max_statements = 1 << 16
+
+
+def table_name(table_id):
+    if not table_id.startswith('table'):
+        table_id = 'table_{}'.format(table_id.replace('-', '_'))
+    return table_id
+
+
+def parse_schema(table_info):
+    schema_str = schema_re.findall(table_info)[0]
+    schema = {}
+    for tup in schema_str.split(', '):
+        c, t = tup.split()
+        schema[c] = t
+    return schema
+
+
+def decimal_value(val):
+    try:
+        return float(parse_decimal(val))
+    except NumberFormatError as e:
+        return float(num_re.findall(val)[0])
+
+
+def plain_number_group_symbol():
+    # babel's group symbol for the default locale if its decimal symbol is '.', else '' (no fast path);
+    # read once, like the memo below, so changing babel's default locale later is not picked up
+    global group_symbol
+    if group_symbol is None:
+        try:
+            group_symbol = get_group_symbol() if get_decimal_symbol() == '.' else ''
+        except Exception:
+            group_symbol = ''
+    return group_symbol
+
+
+@lru_cache(maxsize=1 << 16)
+def real_value(val):
+    group = plain_number_group_symbol()
+    if group:
+        plain = val.replace(group, '')
+        if plain_number_re.fullmatch(plain):
+            # float() and float(Decimal()) both round correctly, so this is what parse_decimal would give
+            return float(plain)
+    return decimal_value(val)
+
+
+def condition_value(val, col_type, lower=True):
+    if lower and isinstance(val, str):
+        val = val.lower()
+    if col_type == 'real' and not isinstance(val, (int, float)):
+        val = real_value(val) if isinstance(val, str) else decimal_value(val)
+    return val
 
 
 class DBEngine:
 
-    def __init__(self, fdb):
-        self.db = records.Database('sqlite:///{}'.format(fdb))
-        self.conn = self.db.get_connection()
+    def __init__(self, fdb, catalog='lazy', backend='records', max_statements=max_statements):
+        # 'records' runs queries through records/SQLAlchemy; 'sqlite3' on a raw sqlite3 connection with tuple rows,
+        # with the same results (SQL errors are raised as sqlite3 exceptions instead of SQLAlchemy's wrappers)
+        if backend == 'sqlite3':
+            self.db = None
+            self.conn = sqlite3.connect(fdb, cached_statements=1024)
+        elif backend == 'records':
+            import records
+            self.db = records.Database('sqlite:///{}'.format(fdb))
+            self.conn = self.db.get_connection()
+        else:
+            raise ValueError('unknown backend: {}'.format(backend))
+        self.backend = backend
+        # schema catalog: table_id -> (table name, column types), filled on first use of each table ('lazy'),
+        # or from one read of sqlite_master up front ('eager'); None looks the schema up on every query
+        self.catalog = catalog
+        self.tables = {}
+        self.table_sql = None
+        if catalog == 'eager':
+            self.load_catalog()
+        # SQL text per query shape (table, sel, agg, cond columns/ops), LRU up to max_statements shapes;
+        # values are always bound parameters
+        self.statements = OrderedDict()
+        self.max_statements = max_statements
+        self.statement_hits = self.statement_misses = 0
 
     def execute_query(self, table_id, query, *args, **kwargs):
         return self.execute(table_id, query.sel_index, query.agg_index, query.conditions, *args, **kwargs)
 
     def execute(self, table_id, select_index, aggregation_index, conditions, lower=True):
-        if not table_id.startswith('table'):
-            table_id = 'table_{}'.format(table_id.replace('-', '_'))
-        table_info = self.conn.query('SELECT sql from sqlite_master WHERE tbl_name = :name', name=table_id).all()[0].sql
-        schema_str = schema_re.findall(table_info)[0]
-        schema = {}
-        for tup in schema_str.split(', '):
-            c, t = tup.split()
-            schema[c] = t
+        table_id, schema = self.lookup(table_id)
+        return self.execute_on(table_id, schema, select_index, aggregation_index, conditions, lower)
+
+    def execute_batch(self, table_id, queries, lower=True):
+        # runs several queries on one table, looking the table up once; returns each result or the exception it raised
+        try:
+            table_id, schema = self.lookup(table_id)
+        except Exception as e:
+            return [e] * len(queries)
+        results = []
+        for query in queries:
+            try:
+                results.append(self.execute_on(table_id, schema, query.sel_index, query.agg_index, query.conditions, lower))
+            except Exception as e:
+                results.append(e)
+        return results
+
+    def lookup(self, table_id):
+        entry = self.tables.get(table_id)
+        if entry is None:
+            name = table_name(table_id)
+            entry = name, self.table_schema(name)
+            if self.catalog:
+                self.tables[table_id] = entry
+        return entry
+
+    def load_catalog(self):
+        self.table_sql = {}
+        for row in query_rows(self.conn, 'SELECT tbl_name, sql FROM sqlite_master'):
+            self.table_sql.setdefault(row[0], row[1])
+
+    def table_schema(self, table_id):
+        table_info = self.table_sql.get(table_id) if self.table_sql is not None else None
+        if table_info is None:
+            table_info = query_rows(self.conn, 'SELECT sql from sqlite_master WHERE tbl_name = :name', name=table_id)[0][0]
+        return parse_schema(table_info)
+
+    def execute_on(self, table_id, schema, select_index, aggregation_index, conditions, lower=True):
+        key = (table_id, select_index, aggregation_index, tuple((col_index, op) for col_index, op, _ in conditions))
+        query = self.statements.get(key)
+        if query is None:
+            self.statement_misses += 1
+            query = self.statements[key] = self.build_statement(table_id, select_index, aggregation_index, conditions)
+            if len(self.statements) > self.max_statements:
+                self.statements.popitem(last=False)
+        else:
+            self.statements.move_to_end(key)
+            self.statement_hits += 1
+        where_map = {}
+        for col_index, op, val in conditions:
+            where_map['col{}'.format(col_index)] = condition_value(val, schema['col{}'.format(col_index)], lower)
+        out = query_rows(self.conn, query, **where_map)
+        return [o[0] for o in out]
+
+    @staticmethod
+    def build_statement(table_id, select_index, aggregation_index, conditions):
         select = 'col{}'.format(select_index)
         agg = Query.agg_ops[aggregation_index]
         if agg:
             select = '{}({})'.format(agg, select)
         where_clause = []
-        where_map = {}
-        for col_index, op, val in conditions:
-            if lower and isinstance(val, str):
-                val = val.lower()
-            if schema['col{}'.format(col_index)] == 'real' and not isinstance(val, (int, float)):
-                try:
-                    val = float(parse_decimal(val))
-                except NumberFormatError as e:
-                    val = float(num_re.findall(val)[0])
+        for col_index, op, _ in conditions:
             where_clause.append('col{} {} :col{}'.format(col_index, Query.cond_ops[op], col_index))
-            where_map['col{}'.format(col_index)] = val
         where_str = ''
         if where_clause:
             where_str = 'WHERE ' + ' AND '.join(where_clause)
-        query = 'SELECT {} AS result FROM {} {}'.format(select, table_id, where_str)
-        out = self.conn.query(query, **where_map)
-        return [o.result for o in out]
+        return 'SELECT {} AS result FROM {} {}'.format(select, table_id, where_str)
+
+    def statement_cache_info(self):
+        total = self.statement_hits + self.statement_misses
+        return {
+            'hits': self.statement_hits,
+            'misses': self.statement_misses,
+            'hit_rate': self.statement_hits / total if total else 0.0,
+            'size': len(self.statements),
+        }
@@ -1,6 +1,5 @@
 from lib.common import detokenize
 from collections import defaultdict
-from copy import deepcopy
 import re
 
 
@@ -77,158 +76,117 @@ class Query:
 
     @classmethod
     def from_sequence(cls, sequence, table, lowercase=True):
-        sequence = deepcopy(sequence)
-        if 'symend' in sequence['words']:
-            end = sequence['words'].index('symend')
-            for k, v in sequence.items():
-                sequence[k] = v[:end]
-        terms = [{'gloss': g, 'word': w, 'after': a} for  g, w, a in zip(sequence['gloss'], sequence['words'], sequence['after'])]
-        headers = [detokenize(h) for h in table['header']]
-
-        # lowercase everything and truncate sequence
-        if lowercase:
-            headers = [h.lower() for h in headers]
-            for i, t in enumerate(terms):
-                for k, v in t.items():
-                    t[k] = v.lower()
-        headers_no_whitespcae = [re.sub(re_whitespace, '', h) for h in headers]
+        tokens = SequenceTokens(sequence, table, lowercase)
 
         # get select
-        if 'symselect' != terms.pop(0)['word']:
+        if 'symselect' != tokens.pop(0):
             raise Exception('Missing symselect operator')
 
         # get aggregation
-        if 'symagg' != terms.pop(0)['word']:
+        if 'symagg' != tokens.pop(1):
             raise Exception('Missing symagg operator')
-        agg_op = terms.pop(0)['word']
+        agg_op = tokens.pop(2)
+        i = 3
 
         if agg_op == 'symcol':
             agg_op = ''
         else:
-            if 'symcol' != terms.pop(0)['word']:
+            if 'symcol' != tokens.pop(3):
                 raise Exception('Missing aggregation column')
+            i = 4
         try:
             agg_op = cls.agg_ops.index(agg_op.upper())
         except Exception as e:
             raise Exception('Invalid agg op {}'.format(agg_op))
-        
-        def find_column(name):
-            return headers_no_whitespcae.index(re.sub(re_whitespace, '', name))
-
-        def flatten(tokens):
-            ret = {'words': [], 'after': [], 'gloss': []}
-            for t in tokens:
-                ret['words'].append(t['word'])
-                ret['after'].append(t['after'])
-                ret['gloss'].append(t['gloss'])
-            return ret
-        where_index = [i for i, t in enumerate(terms) if t['word'] == 'symwhere']
-        where_index = where_index[0] if where_index else len(terms)
-        flat = flatten(terms[:where_index])
+
+        where_index = tokens.find('symwhere', i)
         try:
-            agg_col = find_column(detokenize(flat))
+            agg_col = tokens.find_column(i, where_index)
         except Exception as e:
-            raise Exception('Cannot find aggregation column {}'.format(flat['words']))
-        where_terms = terms[where_index+1:]
+            raise Exception('Cannot find aggregation column {}'.format(tokens.words[i:where_index]))
+        return cls(agg_col, agg_op, cls.parse_conditions(tokens, where_index + 1))
 
-        # get conditions
+    @classmethod
+    def from_partial_sequence(cls, agg_col, agg_op, sequence, table, lowercase=True):
+        tokens = SequenceTokens(sequence, table, lowercase)
+        return cls(agg_col, agg_op, cls.parse_conditions(tokens, tokens.find('symwhere', 0) + 1))
+
+    @classmethod
+    def parse_conditions(cls, tokens, i):
+        # conditions from position i: symcol <col> symop <op> symcond <val> [symand ...]
+        words = tokens.words
+        n = len(words)
         conditions = []
-        while where_terms:
-            t = where_terms.pop(0)
-            flat = flatten(where_terms)
-            if t['word'] != 'symcol':
-                raise Exception('Missing conditional column {}'.format(flat['words']))
-            try:
-                op_index = flat['words'].index('symop')
-                col_tokens = flatten(where_terms[:op_index])
-            except Exception as e:
-                raise Exception('Missing conditional operator {}'.format(flat['words']))
-            cond_op = where_terms[op_index+1]['word']
+        while i < n:
+            t = words[i]
+            i += 1
+            if t != 'symcol':
+                raise Exception('Missing conditional column {}'.format(words[i:]))
+            op_index = tokens.find('symop', i)
+            if op_index == n:
+                raise Exception('Missing conditional operator {}'.format(words[i:]))
+            cond_op = words[op_index+1]
             try:
                 cond_op = cls.cond_ops.index(cond_op.upper())
             except Exception as e:
                 raise Exception('Invalid cond op {}'.format(cond_op))
             try:
-                cond_col = find_column(detokenize(col_tokens))
+                cond_col = tokens.find_column(i, op_index)
             except Exception as e:
-                raise Exception('Cannot find conditional column {}'.format(col_tokens['words']))
-            try:
-                val_index = flat['words'].index('symcond')
-            except Exception as e:
-                raise Exception('Cannot find conditional value {}'.format(flat['words']))
+                raise Exception('Cannot find conditional column {}'.format(words[i:op_index]))
+            val_index = tokens.find('symcond', i)
+            if val_index == n:
+                raise Exception('Cannot find conditional value {}'.format(words[i:]))
 
-            where_terms = where_terms[val_index+1:]
-            flat = flatten(where_terms)
-            val_end_index = flat['words'].index('symand') if 'symand' in flat['words'] else len(where_terms)
-            cond_val = detokenize(flatten(where_terms[:val_end_index]))
+            val_end_index = tokens.find('symand', val_index+1)
+            cond_val = tokens.text(val_index+1, val_end_index)
             conditions.append([cond_col, cond_op, cond_val])
-            where_terms = where_terms[val_end_index+1:]
-        q = cls(agg_col, agg_op, conditions)
-        return q
+            i = val_end_index + 1
+        return conditions
 
-    @classmethod
-    def from_partial_sequence(cls, agg_col, agg_op, sequence, table, lowercase=True):
-        sequence = deepcopy(sequence)
+
+class SequenceTokens:
+    # an annotated output sequence (gloss/words/after) cut at symend and lowercased, read with a cursor instead of
+    # copying the sequence, popping from the front and re-flattening the remaining terms for every condition
+
+    def __init__(self, sequence, table, lowercase=True):
         if 'symend' in sequence['words']:
             end = sequence['words'].index('symend')
-            for k, v in sequence.items():
-                sequence[k] = v[:end]
-        terms = [{'gloss': g, 'word': w, 'after': a} for  g, w, a in zip(sequence['gloss'], sequence['words'], sequence['after'])]
+            sequence = {k: v[:end] for k, v in sequence.items()}
+        self.gloss, self.words, self.after = [], [], []
+        for g, w, a in zip(sequence['gloss'], sequence['words'], sequence['after']):
+            self.gloss.append(g)
+            self.words.append(w)
+            self.after.append(a)
         headers = [detokenize(h) for h in table['header']]
 
-        # lowercase everything and truncate sequence
+        # lowercase everything
         if lowercase:
             headers = [h.lower() for h in headers]
-            for i, t in enumerate(terms):
-                for k, v in t.items():
-                    t[k] = v.lower()
-        headers_no_whitespcae = [re.sub(re_whitespace, '', h) for h in headers]
-
-        def find_column(name):
-            return headers_no_whitespcae.index(re.sub(re_whitespace, '', name))
-
-        def flatten(tokens):
-            ret = {'words': [], 'after': [], 'gloss': []}
-            for t in tokens:
-                ret['words'].append(t['word'])
-                ret['after'].append(t['after'])
-                ret['gloss'].append(t['gloss'])
-            return ret
-        where_index = [i for i, t in enumerate(terms) if t['word'] == 'symwhere']
-        where_index = where_index[0] if where_index else len(terms)
-        where_terms = terms[where_index+1:]
-
-        # get conditions
-        conditions = []
-        while where_terms:
-            t = where_terms.pop(0)
-            flat = flatten(where_terms)
-            if t['word'] != 'symcol':
-                raise Exception('Missing conditional column {}'.format(flat['words']))
-            try:
-                op_index = flat['words'].index('symop')
-                col_tokens = flatten(where_terms[:op_index])
-            except Exception as e:
-                raise Exception('Missing conditional operator {}'.format(flat['words']))
-            cond_op = where_terms[op_index+1]['word']
-            try:
-                cond_op = cls.cond_ops.index(cond_op.upper())
-            except Exception as e:
-                raise Exception('Invalid cond op {}'.format(cond_op))
-            try:
-                cond_col = find_column(detokenize(col_tokens))
-            except Exception as e:
-                raise Exception('Cannot find conditional column {}'.format(col_tokens['words']))
-            try:
-                val_index = flat['words'].index('symcond')
-            except Exception as e:
-                raise Exception('Cannot find conditional value {}'.format(flat['words']))
-
-            where_terms = where_terms[val_index+1:]
-            flat = flatten(where_terms)
-            val_end_index = flat['words'].index('symand') if 'symand' in flat['words'] else len(where_terms)
-            cond_val = detokenize(flatten(where_terms[:val_end_index]))
-            conditions.append([cond_col, cond_op, cond_val])
-            where_terms = where_terms[val_end_index+1:]
-        q = cls(agg_col, agg_op, conditions)
-        return q
+            for i in range(len(self.words)):
+                self.gloss[i] = self.gloss[i].lower()
+                self.words[i] = self.words[i].lower()
+                self.after[i] = self.after[i].lower()
+        self.headers_no_whitespace = [re.sub(re_whitespace, '', h) for h in headers]
+
+    def pop(self, i):
+        # the i-th term, failing like popping it off an exhausted list
+        if i >= len(self.words):
+            raise IndexError('pop from empty list')
+        return self.words[i]
+
+    def find(self, word, start):
+        # first position of word at or after start, or the end of the sequence
+        try:
+            return self.words.index(word, start)
+        except ValueError:
+            return len(self.words)
+
+    def text(self, start, end):
+        ret = ''
+        for g, a in zip(self.gloss[start:end], self.after[start:end]):
+            ret += g + a
+        return ret.strip()
+
+    def find_column(self, start, end):
+        return self.headers_no_whitespace.index(re.sub(re_whitespace, '', self.text(start, end)))
@@ -1,10 +1,13 @@
 import re
+import sqlite3
 from tabulate import tabulate
+from lib.common import execute_sql, query_rows
 from lib.query import Query
 import random
 
 
 class Table:
+    # db is a records Database/Connection or a raw sqlite3 connection
 
     schema_re = re.compile('\((.+)\)')
 
@@ -24,7 +27,7 @@ class Table:
 
     @classmethod
     def get_schema(cls, db, table_id):
-        table_infos = db.query('SELECT sql from sqlite_master WHERE tbl_name = :name', name=cls.get_id(table_id)).all()
+        table_infos = query_rows(db, 'SELECT sql from sqlite_master WHERE tbl_name = :name', name=cls.get_id(table_id))
         if table_infos:
             return table_infos[0]
         else:
@@ -38,13 +41,13 @@ class Table:
     def from_db(cls, db, table_id):
         table_info = cls.get_schema(db, table_id)
         if table_info:
-            schema_str = cls.schema_re.findall(table_info)[0] = [0].sql
+            schema_str = cls.schema_re.findall(table_info[0])[0]
             header, types = [], []
             for tup in schema_str.split(', '):
                 c, t = tup.split()
                 header.append(c)
                 types.append(t)
-            rows = [[getattr(r, h) for h in header] for r in db.query('SELECT * from {}'.format(cls.get_id(table_id)))]
+            rows = [[r[i] for i in range(len(header))] for r in query_rows(db, 'SELECT * from {}'.format(cls.get_id(table_id)))]
             return cls(table_id, header, types, rows)
         else:
             return None
@@ -57,17 +60,19 @@ class Table:
         exists = self.get_schema(db, self.table_id)
         if exists:
             if replace_existing:
-                db.query('DROP TABLE {}'.format(self.name))
+                execute_sql(db, 'DROP TABLE {}'.format(self.name))
             else:
                 return
         type_str = ', '.join(['col{} {}'.format(i, t) for i, t in enumerate(self.types)])
-        db.query('CREATE TABLE {name} ({types})'.format(name=self.name, types=type_str))
+        execute_sql(db, 'CREATE TABLE {name} ({types})'.format(name=self.name, types=type_str))
         for row in self.rows:
             value_str = ', '.join([':val{}'.format(j) for j, c in enumerate(row)])
             value_dict = {'val{}'.format(j): c for j, c in enumerate(row)}
             if lower:
                 value_dict = {k: v.lower() if isinstance(v, str) else v for k, v in value_dict.items()}
-            db.query('INSERT INTO {name} VALUES ({values})'.format(name=self.name, values=value_str), **value_dict)
+            execute_sql(db, 'INSERT INTO {name} VALUES ({values})'.format(name=self.name, values=value_str), **value_dict)
+        if isinstance(db, sqlite3.Connection):
+            db.commit()
 
     def execute_query(self, db, query, lower=True):
         sel_str = 'col{}'.format(query.sel_index) if query.sel_index >= 0 else '*'
@@ -84,10 +89,10 @@ class Table:
 
         if query.sel_index >= 0:
             query_str = 'SELECT {agg_str} AS result FROM {name} {where_str}'.format(agg_str=agg_str, name=self.name, where_str=where_str)
-            return [r.result for r in db.query(query_str, **where_map)]
+            return [r[0] for r in query_rows(db, query_str, **where_map)]
         else:
             query_str = 'SELECT {agg_str} FROM {name} {where_str}'.format(agg_str=agg_str, name=self.name, where_str=where_str)
-            return [[getattr(r, 'col{}'.format(i)) for i in range(len(self.header))] for r in db.query(query_str, **where_map)]
+            return [[r[i] for i in range(len(self.header))] for r in query_rows(db, query_str, **where_map)]
 
     def query_str(self, query):
         agg_str = self.header[query.sel_index]
@@ -1,14 +1,67 @@
 import json
+import random
 from tqdm import tqdm
 import os
 import sys
+from argparse import ArgumentParser
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from babel.numbers import parse_decimal, NumberFormatError
 from lib.query import Query
-from lib.dbengine import DBEngine
+from lib.dbengine import DBEngine, condition_value, num_re
+
+
+def reference_real(val):
+    # the coercion DBEngine applied to real columns before the fast path and memo
+    try:
+        return float(parse_decimal(val))
+    except NumberFormatError as e:
+        return float(num_re.findall(val)[0])
+
+
+def random_literal(rng):
+    r = rng.random()
+    if r < 0.4:
+        x = rng.choice([rng.uniform(-1e6, 1e6), rng.randint(-10**9, 10**9), rng.random() * 10 ** rng.randint(-30, 30)])
+        s = rng.choice(['{}', '{:,}', '{:.2f}', '{:,.3f}', '{:e}', '{:.17g}', '{:+}']).format(x)
+        if rng.random() < 0.2:
+            s = rng.choice([' ', '$', '', '\xa0']) + s + rng.choice([' ', '%', ' km', '', '.'])
+        return s
+    alphabet = '0123456789' * 3 + ',.eE+-_ \xa0\u202fxna$%١٣'
+    s = ''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 10)))
+    return rng.choice([s, s, 'nan', 'inf', '-infinity', 'snan', s.upper()])
+
+
+def check_real_coercion(n=20000, seed=0):
+    # randomized parity of condition_value on real columns with the reference babel path
+    rng = random.Random(seed)
+    literals = [random_literal(rng) for _ in range(n)]
+    literals += rng.sample(literals, n // 4)  # repeats go through the memo
+    for val in tqdm(literals):
+        try:
+            expected = repr(reference_real(val))
+        except Exception as e:
+            expected = repr(e)
+        try:
+            got = repr(condition_value(val, 'real', lower=False))
+        except Exception as e:
+            got = repr(e)
+        if got != expected:
+            raise Exception('Coercion of {!r} gave {} instead of {}'.format(val, got, expected))
 
 
 if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--coercion', type=int, default=0, metavar='N', help='also check numeric coercion of real columns on N random literals against babel (0: skip)')
+    parser.add_argument('--seed', type=int, default=0, help='seed for the random literals')
+    args = parser.parse_args()
+
+    if args.coercion > 0:
+        print('checking numeric coercion')
+        check_real_coercion(args.coercion, args.seed)
     for split in ['train', 'dev', 'test']:
+        if not (os.path.exists('data/{}.db'.format(split)) and os.path.exists('data/{}.jsonl'.format(split))):
+            print('skipping {}: data/{}.db or data/{}.jsonl not found'.format(split, split, split))
+            continue
         print('checking {}'.format(split))
         engine = DBEngine('data/{}.db'.format(split))
         n_lines = 0
@@ -8,10 +8,33 @@ import os
 import sys
 import subprocess
 import json
+from argparse import ArgumentParser
 from pathlib import Path
 
+from wikisql_io import open_text
+from wikisql_sharding import QUESTION_ID_KEY, SHARD_MODES, shard_output_path, validate_shard
+
+def parse_args():
+    """Command line options for sharded runs (everything else is asked interactively)"""
+    parser = ArgumentParser(description="WikiSQL prediction generator")
+    parser.add_argument('--shard-index', type=int, default=0, help='shard to process (0-based)')
+    parser.add_argument('--num-shards', type=int, default=1, help='total number of shards')
+    parser.add_argument('--shard-mode', choices=SHARD_MODES, default='contiguous',
+                        help='contiguous question ranges or hash by table_id')
+    db_group = parser.add_mutually_exclusive_group()
+    db_group.add_argument('--official-db', action='store_true',
+                          help='attach WikiSQL/data/<split>.db read-only instead of rebuilding tables from JSON')
+    db_group.add_argument('--compiled-db', default=None,
+                          help='open a split compiled by wikisql_compile_split.py read-only (no table building); '
+                               'like --official-db, string values are lowercase and SQL string literals are '
+                               'lowercased before execution')
+    args = parser.parse_args()
+    validate_shard(args.shard_index, args.num_shards, args.shard_mode)
+    return args
+
 def main():
     """Main function - WikiSQL complete functionality entry point"""
+    args = parse_args()
     print("🚀 WikiSQL Intelligent Query System")
     print("=" * 60)
     print("Supporting basic queries and Heavy multi-agent analysis")
@@ -63,6 +86,8 @@ def main():
         limit = 100
     
     print(f"✅ Question limit: {limit}")
+    if args.num_shards > 1:
+        print(f"✅ Shard: {args.shard_index + 1}/{args.num_shards} ({args.shard_mode})")
     
     # Step 5: Select query mode
     print(f"\n📋 Step 5: Query Mode Selection")
@@ -98,19 +123,36 @@ def main():
         print("Please ensure WikiSQL directory is in current directory")
         return
     
+    # 使用官方分割数据库时不再从JSON建表
+    assistant_options = {}
+    if args.official_db:
+        official_db = Path(wikisql_path) / "data" / f"{split}.db"
+        if official_db.exists():
+            assistant_options["attach_db"] = str(official_db)
+            print(f"✅ Using official database: {official_db}")
+        else:
+            print(f"⚠️ Official database not found, tables will be built from JSON: {official_db}")
+    elif args.compiled_db:
+        if not Path(args.compiled_db).exists():
+            print(f"❌ Compiled database not found: {args.compiled_db}")
+            print(f"   Build it with: python wikisql_compile_split.py --split {split} -o {args.compiled_db}")
+            return
+        assistant_options.update(db_path=args.compiled_db, readonly=True)
+        print(f"✅ Using compiled database (read-only): {args.compiled_db}")
+    
     try:
         # Initialize WikiSQL query assistant
         print(f"\n🔧 初始化WikiSQL查询助手...")
         
         if use_heavy:
             print("🧠 启用Heavy多智能体模式...")
-            from wikisql_heavy_simple import WikiSQLDirectLLMSimpleHeavy
-            assistant = WikiSQLDirectLLMSimpleHeavy(api_key)
+            from wikisql_heavy_integration import WikiSQLDirectLLMHeavy
+            assistant = WikiSQLDirectLLMHeavy(api_key, **assistant_options)
             print("✅ Heavy模式已启用 - 4个专门智能体并行分析")
         else:
             print("⚡ 启用标准查询模式...")
             from wikisql_llm_direct import WikiSQLDirectLLM
-            assistant = WikiSQLDirectLLM(api_key)
+            assistant = WikiSQLDirectLLM(api_key, **assistant_options)
             print("✅ 标准模式已启用")
         
         # Set local data path
@@ -132,11 +174,17 @@ def main():
             assistant.llm = new_llm
             
             # If Heavy mode, reinitialize Heavy Orchestrator with new model
-            if use_heavy and hasattr(assistant, 'heavy_orchestrator'):
+            if use_heavy and getattr(assistant, 'heavy_orchestrator', None) is not None:
                 print(f"🔄 重新初始化Heavy智能体使用 {selected_model} 模型...")
                 try:
-                    from wikisql_heavy_simple import SimpleHeavyOrchestrator
-                    assistant.heavy_orchestrator = SimpleHeavyOrchestrator(api_key, selected_model)
+                    for agent in assistant.heavy_orchestrator.agents:
+                        agent.agent = ChatGoogleGenerativeAI(
+                            model=selected_model,
+                            temperature=0.1,
+                            google_api_key=os.getenv("GOOGLE_API_KEY"),
+                            request_timeout=60,
+                            verbose=False
+                        )
                     print(f"✅ Heavy智能体已切换到 {selected_model} 模型")
                 except Exception as e:
                     print(f"⚠️ Heavy智能体模型切换失败: {e}")
@@ -145,10 +193,12 @@ def main():
         # 生成输出文件名
         mode_suffix = "heavy" if use_heavy else "normal"
         output_file = f"predictions_{split}_{limit}_{selected_model.replace('-', '_')}_{mode_suffix}.jsonl"
+        output_file = shard_output_path(output_file, args.shard_index, args.num_shards)
         
-        # 加载数据集
+        # 加载数据集（分片时只加载本分片的问题和表格）
         print(f"\n📥 加载WikiSQL数据集 ({split}, 限制: {limit})...")
-        assistant.load_wikisql_dataset(split, limit, force_download=False)
+        assistant.load_wikisql_dataset(split, limit, force_download=False, shard_index=args.shard_index,
+                                       num_shards=args.num_shards, shard_mode=args.shard_mode)
         
         # 显示数据集信息
         info = assistant.get_dataset_info()
@@ -225,10 +275,14 @@ def main():
             except Exception as e:
                 print(f"   ❌ Processing failed: {e}")
                 predictions.append({"error": str(e)})
+            
+            # 分片预测记录问题ID，供 wikisql_sharding.py 合并
+            if args.num_shards > 1:
+                predictions[-1][QUESTION_ID_KEY] = question.id
         
         # Save prediction results
         print(f"\n💾 Saving prediction results to: {output_file}")
-        with open(output_file, 'w', encoding='utf-8') as f:
+        with open_text(output_file, 'w') as f:
             for prediction in predictions:
                 f.write(json.dumps(prediction, ensure_ascii=False) + '\n')
         
@@ -236,63 +290,68 @@ def main():
         
         if result_file:
             print(f"✅ Prediction file generated successfully: {result_file}")
+            if args.num_shards > 1:
+                # evaluate.py 按行号对应标准答案，单个分片只能在合并后评估
+                print(f"   Merge all shards with: python wikisql_sharding.py <shard files> -o <merged file>")
+                print(f"   Evaluate the merged file, not this shard: python WikiSQL/evaluate.py "
+                      f"WikiSQL/data/{split}.jsonl WikiSQL/data/{split}.db <merged file>")
+            else:
+                # 7. Try running official evaluator
+                print(f"\n🔍 Attempting to run official evaluator...")
             
-            # 7. Try running official evaluator
-            print(f"\n🔍 Attempting to run official evaluator...")
-            
-            # Use confirmed existing paths
-            evaluate_script = Path("WikiSQL") / "evaluate.py"
-            source_file = Path("WikiSQL") / "data" / f"{split}.jsonl"
-            db_file = Path("WikiSQL") / "data" / f"{split}.db"
-            predictions_file = Path(result_file).absolute()
+                # Use confirmed existing paths
+                evaluate_script = Path("WikiSQL") / "evaluate.py"
+                source_file = Path("WikiSQL") / "data" / f"{split}.jsonl"
+                db_file = Path("WikiSQL") / "data" / f"{split}.db"
+                predictions_file = Path(result_file).absolute()
             
-            print(f"📁 Checking files:")
-            print(f"  evaluate.py: {'✅' if evaluate_script.exists() else '❌'} {evaluate_script}")
-            print(f"  {split}.jsonl: {'✅' if source_file.exists() else '❌'} {source_file}")
-            print(f"  {split}.db: {'✅' if db_file.exists() else '❌'} {db_file}")
-            print(f"  Prediction file: {'✅' if predictions_file.exists() else '❌'} {predictions_file}")
+                print(f"📁 Checking files:")
+                print(f"  evaluate.py: {'✅' if evaluate_script.exists() else '❌'} {evaluate_script}")
+                print(f"  {split}.jsonl: {'✅' if source_file.exists() else '❌'} {source_file}")
+                print(f"  {split}.db: {'✅' if db_file.exists() else '❌'} {db_file}")
+                print(f"  Prediction file: {'✅' if predictions_file.exists() else '❌'} {predictions_file}")
             
-            if evaluate_script.exists() and source_file.exists() and db_file.exists():
-                try:
-                    cmd = [
-                        sys.executable,
-                        str(evaluate_script.absolute()),
-                        str(source_file.absolute()),
-                        str(db_file.absolute()),
-                        str(predictions_file)
-                    ]
+                if evaluate_script.exists() and source_file.exists() and db_file.exists():
+                    try:
+                        cmd = [
+                            sys.executable,
+                            str(evaluate_script.absolute()),
+                            str(source_file.absolute()),
+                            str(db_file.absolute()),
+                            str(predictions_file)
+                        ]
                     
-                    print(f"🚀 Running command: {' '.join(cmd)}")
+                        print(f"🚀 Running command: {' '.join(cmd)}")
                     
-                    result = subprocess.run(
-                        cmd,
-                        capture_output=True,
-                        text=True,
-                        timeout=300,
-                        encoding='utf-8'
-                    )
+                        result = subprocess.run(
+                            cmd,
+                            capture_output=True,
+                            text=True,
+                            timeout=300,
+                            encoding='utf-8'
+                        )
                     
-                    if result.returncode == 0:
-                        print("✅ Official evaluator ran successfully!")
-                        print("📊 Evaluation results:")
-                        print(result.stdout)
-                    else:
-                        print(f"⚠️ Official evaluator failed:")
-                        print(f"Error output: {result.stderr}")
+                        if result.returncode == 0:
+                            print("✅ Official evaluator ran successfully!")
+                            print("📊 Evaluation results:")
+                            print(result.stdout)
+                        else:
+                            print(f"⚠️ Official evaluator failed:")
+                            print(f"Error output: {result.stderr}")
                         
-                        # Use custom validator as fallback
-                        print(f"\n🔄 Using custom validator as fallback...")
-                        print(f"Run command: python run_validation.py")
+                            # Use custom validator as fallback
+                            print(f"\n🔄 Using custom validator as fallback...")
+                            print(f"Run command: python run_validation.py")
                         
-                except subprocess.TimeoutExpired:
-                    print("⚠️ Official evaluator timed out")
-                    print(f"💡 Can run manually: python run_validation.py")
-                except Exception as e:
-                    print(f"⚠️ Failed to run official evaluator: {e}")
-                    print(f"💡 Can run manually: python run_validation.py")
-            else:
-                print(f"⚠️ Missing required evaluation files:")
-                print(f"💡 Can use custom validator: python run_validation.py")
+                    except subprocess.TimeoutExpired:
+                        print("⚠️ Official evaluator timed out")
+                        print(f"💡 Can run manually: python run_validation.py")
+                    except Exception as e:
+                        print(f"⚠️ Failed to run official evaluator: {e}")
+                        print(f"💡 Can run manually: python run_validation.py")
+                else:
+                    print(f"⚠️ Missing required evaluation files:")
+                    print(f"💡 Can use custom validator: python run_validation.py")
             
             # 8. Usage instructions
             print(f"\n💡 Usage instructions:")
@@ -301,7 +360,7 @@ def main():
             print(f"Success: {{\"query\": {{\"sel\": 0, \"agg\": 0, \"conds\": []}}}}")
             print(f"Failure: {{\"error\": \"error message\"}}")
             
-            if wikisql_path:
+            if wikisql_path and args.num_shards == 1:
                 print(f"\nManual evaluation command:")
                 print(f"cd {wikisql_path}")
                 abs_result_path = Path(result_file).absolute()
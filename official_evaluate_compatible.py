@@ -10,10 +10,14 @@ import sys
 from argparse import ArgumentParser
 from tqdm import tqdm
 from pathlib import Path
+from urllib.parse import quote
+
+from wikisql_io import open_text
+from wikisql_statement_cache import SQLITE_CACHED_STATEMENTS, StatementCache, statement_key
 
 def count_lines(filename):
-    """计算文件行数"""
-    with open(filename, 'r', encoding='utf-8') as f:
+    """计算文件行数（支持压缩文件）"""
+    with open_text(filename) as f:
         return sum(1 for _ in f)
 
 class CompatibleDBEngine:
@@ -24,29 +28,29 @@ class CompatibleDBEngine:
         self.db_file = db_file
         print(f"Connecting to database: {db_file}")
         
-        # 测试连接
+        # 持久连接: 相同SQL文本的预编译语句由sqlite3在连接上复用
         try:
-            conn = sqlite3.connect(db_file)
-            conn.close()
+            # 只读打开，官方分割数据库和编译好的分割数据库 (wikisql_compile_split.py) 均可
+            self.conn = sqlite3.connect(f"file:{quote(str(Path(db_file).resolve()))}?mode=ro", uri=True,
+                                        cached_statements=SQLITE_CACHED_STATEMENTS)
             print("Database connection successful")
         except Exception as e:
             print(f"Database connection failed: {e}")
             raise
+        
+        self._table_names = None  # 数据库中的表名，首次查找时读取
+        self._columns = {}  # 表名 -> 列信息
+        self.statement_cache = StatementCache()
     
     def execute_query(self, table_id, query, lower=True):
         """执行查询"""
+        sql, params = None, ()
         try:
-            conn = sqlite3.connect(self.db_file)
-            cursor = conn.cursor()
-            
-            # 构建SQL查询
-            sql = self._build_sql(table_id, query)
+            # 构建SQL查询（形状相同的查询复用缓存的语句，条件值作为参数绑定）
+            sql, params = self._build_sql(table_id, query)
             
             # 执行查询
-            cursor.execute(sql)
-            result = cursor.fetchall()
-            
-            conn.close()
+            result = self.conn.execute(sql, params).fetchall()
             
             # 处理结果
             if lower:
@@ -65,11 +69,20 @@ class CompatibleDBEngine:
                 return result
                 
         except Exception as e:
-            print(f"Query execution failed: {sql}, error: {e}")
+            print(f"Query execution failed: {sql} {list(params)}, error: {e}")
             return None
     
     def _build_sql(self, table_id, query):
-        """构建SQL查询"""
+        """构建参数化SQL查询，返回 (SQL, 参数)"""
+        conds = query.get('conds', [])
+        key = statement_key(table_id, query.get('sel', 0), query.get('agg', 0), conds or [])
+        sql, bound = self.statement_cache.get_or_build(key, lambda: self._build_statement(table_id, query))
+        # 条件值按字符串绑定，与内联为带引号的字符串字面量等价
+        params = tuple(str(cond[2]) for cond, use in zip(conds or [], bound) if use)
+        return sql, params
+    
+    def _build_statement(self, table_id, query):
+        """生成查询形状对应的SQL，返回 (SQL, 每个条件是否生成了占位符)"""
         # 获取表名
         table_name = self._get_table_name(table_id)
         
@@ -97,50 +110,38 @@ class CompatibleDBEngine:
         
         # 构建WHERE部分
         where_parts = []
-        if conds:
-            for cond in conds:
-                if len(cond) >= 3:
-                    cond_col = cond[0]
-                    cond_op = cond[1]
-                    cond_val = cond[2]
-                    
-                    if cond_col < len(columns):
-                        cond_col_name = columns[cond_col][1]
-                        
-                        # 操作符映射
-                        ops = ['=', '>', '<']
-                        if cond_op < len(ops):
-                            op = ops[cond_op]
-                            # 处理SQL注入
-                            escaped_val = str(cond_val).replace("'", "''")
-                            where_parts.append(f"{cond_col_name} {op} '{escaped_val}'")
+        bound = []
+        # 操作符映射
+        ops = ['=', '>', '<']
+        for cond in conds or []:
+            if len(cond) >= 3 and cond[0] < len(columns) and cond[1] < len(ops):
+                where_parts.append(f"{columns[cond[0]][1]} {ops[cond[1]]} ?")
+                bound.append(True)
+            else:
+                bound.append(False)
         
         # 组装SQL
         sql = f"SELECT {select_part} FROM {table_name}"
         if where_parts:
             sql += f" WHERE {' AND '.join(where_parts)}"
         
-        return sql
+        return sql, tuple(bound)
     
     def _get_table_name(self, table_id):
         """获取表名"""
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
+        if self._table_names is None:
+            cursor = self.conn.execute("SELECT name FROM sqlite_master WHERE type='table'")
+            self._table_names = [name for (name,) in cursor.fetchall()]
         
         # 查找匹配的表名
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-        tables = cursor.fetchall()
-        
         table_name = None
-        for (name,) in tables:
+        for name in self._table_names:
             if table_id in name or name.endswith(table_id.replace('-', '_')):
                 table_name = name
                 break
         
-        if not table_name and tables:
-            table_name = tables[0][0]  # 使用第一个表作为默认
-        
-        conn.close()
+        if not table_name and self._table_names:
+            table_name = self._table_names[0]  # 使用第一个表作为默认
         
         if not table_name:
             raise Exception(f"Table not found: {table_id}")
@@ -149,17 +150,12 @@ class CompatibleDBEngine:
     
     def _get_columns(self, table_name):
         """获取列信息"""
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
-        
-        cursor.execute(f"PRAGMA table_info({table_name})")
-        columns = cursor.fetchall()
-        
-        conn.close()
-        
-        if not columns:
-            raise Exception(f"Table {table_name} has no column info")
-        
+        columns = self._columns.get(table_name)
+        if columns is None:
+            columns = self.conn.execute(f"PRAGMA table_info({table_name})").fetchall()
+            if not columns:
+                raise Exception(f"Table {table_name} has no column info")
+            self._columns[table_name] = columns
         return columns
 
 class CompatibleQuery:
@@ -223,7 +219,7 @@ def main():
     
     print("Starting evaluation...")
     
-    with open(args.source_file, encoding='utf-8') as fs, open(args.pred_file, encoding='utf-8') as fp:
+    with open_text(args.source_file) as fs, open_text(args.pred_file) as fp:
         total_lines = count_lines(args.source_file)
         
         for ls, lp in tqdm(zip(fs, fp), total=total_lines, desc="Progress"):
@@ -278,6 +274,9 @@ def main():
     print(f"Execution Accuracy: {ex_acc:.4f} ({ex_acc*100:.2f}%)")
     print(f"Logical Form Accuracy: {lf_acc:.4f} ({lf_acc*100:.2f}%)")
     print(f"Total samples: {len(execution_accuracy)}")
+    cache_stats = engine.statement_cache.stats()
+    print(f"Statement cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses "
+          f"({cache_stats['hit_rate']*100:.2f}% hit rate)")
     print("=" * 60)
 
 if __name__ == '__main__':
@@ -7,6 +7,7 @@ import os
 import sys
 from pathlib import Path
 from wikisql_validator import WikiSQLValidator
+from wikisql_io import COMPRESSED_SUFFIXES
 
 def find_wikisql_files():
     """自动查找WikiSQL相关文件"""
@@ -30,6 +31,9 @@ def find_prediction_files():
     """查找预测文件"""
     current_dir = Path(".")
     prediction_files = list(current_dir.glob("predictions_*.jsonl"))
+    # 压缩的预测文件 (.jsonl.bz2 / .jsonl.gz / .jsonl.xz / .jsonl.zst)
+    for suffix in COMPRESSED_SUFFIXES:
+        prediction_files.extend(current_dir.glob(f"predictions_*.jsonl{suffix}"))
     return prediction_files
 
 def main():
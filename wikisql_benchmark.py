@@ -0,0 +1,738 @@
+#!/usr/bin/env python3
+"""
+WikiSQL性能基准测试
+对数据加载、建表和评估等关键路径进行计时对比
+"""
+
+import os
+import gc
+import sys
+import json
+import time
+import tempfile
+import tracemalloc
+import logging
+from argparse import ArgumentParser
+from pathlib import Path
+from typing import Callable, List
+
+from wikisql_data_loader import WikiSQLDataLoader
+from wikisql_validator import import_wikisql_module
+
+# 基准测试只关心耗时，屏蔽加载过程中的INFO日志
+logging.getLogger().setLevel(logging.WARNING)
+
+
+def time_call(func: Callable, repeat: int = 1) -> List[float]:
+    """
+    多次调用函数并记录耗时
+
+    Args:
+        func: 无参数的被测函数
+        repeat: 重复次数
+
+    Returns:
+        每次调用的耗时（秒）
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def print_timing(label: str, timings: List[float]):
+    """打印计时结果"""
+    best = min(timings)
+    mean = sum(timings) / len(timings)
+    print(f"  {label:<28} best {best * 1000:9.1f} ms   mean {mean * 1000:9.1f} ms   (n={len(timings)})")
+
+
+def bench_table_cache(args):
+    """表格加载: 无缓存解析 vs 冷缓存(解析+写缓存) vs 热缓存"""
+    loader = WikiSQLDataLoader(data_dir=args.data_dir, local_wikisql_path=args.wikisql_path)
+    _, tables_file = loader.download_dataset(args.split)
+    cache_file = loader._get_cache_path(tables_file, ".tblcache")
+
+    print(f"表格文件: {tables_file} ({tables_file.stat().st_size / 1e6:.1f} MB)")
+
+    def cold():
+        if cache_file.exists():
+            cache_file.unlink()
+        loader.load_tables(tables_file, use_cache=True)
+
+    print_timing("json解析 (无缓存)", time_call(lambda: loader.load_tables(tables_file, use_cache=False), args.repeat))
+    print_timing("冷缓存 (解析+写缓存)", time_call(cold, args.repeat))
+    print_timing("热缓存", time_call(lambda: loader.load_tables(tables_file, use_cache=True), args.repeat))
+    print(f"缓存文件: {cache_file} ({cache_file.stat().st_size / 1e6:.1f} MB)")
+    same = loader.load_tables(tables_file, use_cache=True) == loader.load_tables(tables_file, use_cache=False)
+    print(f"热缓存与直接解析的表格{'一致' if same else '不一致'}")
+    print(f"边界表格缓存往返: {_check_table_cache_roundtrip()}")
+
+
+# 缓存往返的边界情况: 有行但没有列、列数不一致、空表、混合类型的单元格
+_EDGE_TABLES = [
+    {"id": "0-0", "header": [], "types": [], "rows": [[], [], []]},
+    {"id": "0-1", "header": ["a", "b"], "types": ["text", "real"], "rows": [["x", 1], ["y"], ["z", 2.5, "extra"]]},
+    {"id": "0-2", "header": ["a"], "types": ["text"], "rows": []},
+    {"id": "0-3", "header": ["a", "b"], "types": ["text", "real"], "rows": [["1", 1], [1, 1.0], [None, True]]},
+]
+
+
+def _check_table_cache_roundtrip() -> str:
+    """边界表格经冷缓存（写入）和热缓存（读取）加载后须与直接解析的结果相同（普通与紧凑结构）"""
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        tables_file = Path(tmp) / "edge.tables.jsonl"
+        with open(tables_file, 'w', encoding='utf-8') as f:
+            for table in _EDGE_TABLES:
+                f.write(json.dumps(table) + '\n')
+        for compact in (False, True):
+            loader = WikiSQLDataLoader(data_dir=tmp, compact=compact)
+            parsed = loader.load_tables(tables_file, use_cache=False)
+            for label in ("冷缓存", "热缓存"):
+                loaded = loader.load_tables(tables_file, use_cache=True)
+                for table_id, table in parsed.items():
+                    other = loaded.get(table_id)
+                    if other != table or len(other.rows) != len(table.rows):
+                        failures.append(f"{table_id} ({'紧凑' if compact else '普通'}, {label})")
+    return "通过" if not failures else "失败: " + ", ".join(failures)
+
+
+def bench_parallel_parse(args):
+    """JSONL解析: 串行 vs 进程池并行"""
+    loader = WikiSQLDataLoader(data_dir=args.data_dir, local_wikisql_path=args.wikisql_path)
+    questions_file, tables_file = loader.download_dataset(args.split)
+    workers = args.workers or os.cpu_count() or 1
+
+    print(f"问题文件: {questions_file} ({questions_file.stat().st_size / 1e6:.1f} MB)")
+    print(f"表格文件: {tables_file} ({tables_file.stat().st_size / 1e6:.1f} MB)")
+    print(f"并行进程数: {workers}")
+
+    serial = time_call(lambda: loader.load_questions(questions_file, workers=1), args.repeat)
+    parallel = time_call(lambda: loader.load_questions(questions_file, workers=workers), args.repeat)
+    print_timing("问题 串行", serial)
+    print_timing(f"问题 并行 x{workers}", parallel)
+    print(f"  加速比: {min(serial) / min(parallel):.2f}x")
+
+    serial = time_call(lambda: loader.load_tables(tables_file, use_cache=False, workers=1), args.repeat)
+    parallel = time_call(lambda: loader.load_tables(tables_file, use_cache=False, workers=workers), args.repeat)
+    print_timing("表格 串行", serial)
+    print_timing(f"表格 并行 x{workers}", parallel)
+    print(f"  加速比: {min(serial) / min(parallel):.2f}x")
+
+
+def bench_memory(args):
+    """内存占用: 普通dataclass vs 紧凑(__slots__/驻留/字典编码)表示"""
+    for compact in (False, True):
+        loader = WikiSQLDataLoader(data_dir=args.data_dir, local_wikisql_path=args.wikisql_path, compact=compact)
+        questions_file, tables_file = loader.download_dataset(args.split)
+
+        gc.collect()
+        tracemalloc.start()
+        tables = loader.load_tables(tables_file, use_cache=False)
+        tables_bytes = tracemalloc.get_traced_memory()[0]
+        questions = loader.load_questions(questions_file)
+        total_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        label = "紧凑表示" if compact else "普通dataclass"
+        print(f"  {label:<16} 表格 {len(tables):>6} 个 {tables_bytes / 1e6:8.1f} MB   "
+              f"问题 {len(questions):>6} 个 {(total_bytes - tables_bytes) / 1e6:8.1f} MB")
+        del tables, questions, loader
+
+
+def bench_download(args):
+    """数据集下载: 逐个下载 vs 并发下载（可用本地HTTP服务代替GitHub）"""
+    base_url = args.base_url.rstrip('/')
+    url_sources = [{
+        args.split: f"{base_url}/{args.split}.jsonl",
+        f"{args.split}_tables": f"{base_url}/{args.split}.tables.jsonl",
+    }]
+    print(f"下载源: {base_url}")
+
+    for workers in (1, 2):
+        def download():
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                loader = WikiSQLDataLoader(data_dir=tmp_dir, url_sources=url_sources, download_workers=workers)
+                loader.download_dataset(args.split, force_download=True)
+        print_timing(f"并发文件数 {workers}", time_call(download, args.repeat))
+
+
+def _legacy_build(manager, tables):
+    """旧的建表方式: CREATE与INSERT各开一个连接，每行一次 text() 执行"""
+    from sqlalchemy import text
+
+    for table in tables.values():
+        table_name, headers, _, create_sql, rows = manager._prepare_table(table)
+        with manager.engine.connect() as conn:
+            conn.execute(text(create_sql))
+            conn.commit()
+        column_names = ', '.join(f'"{h}"' for h in headers)
+        placeholders = ', '.join(f':{h}' for h in headers)
+        insert_sql = text(f'INSERT INTO "{table_name}" ({column_names}) VALUES ({placeholders})')
+        with manager.engine.connect() as conn:
+            for row in rows:
+                conn.execute(insert_sql, {h: (row[i] if i < len(row) and row[i] != '' else None)
+                                          for i, h in enumerate(headers)})
+            conn.commit()
+
+
+def _legacy_infer_column_type(values, declared_type="text"):
+    """旧的列类型推断: 逐个值 try int() / float()"""
+    if not values:
+        return "TEXT"
+    if declared_type.lower() == "real":
+        return "REAL"
+    int_count = float_count = 0
+    for value in values:
+        if value is None or value == "":
+            continue
+        str_value = str(value).strip()
+        if not str_value:
+            continue
+        try:
+            int(str_value)
+            int_count += 1
+            continue
+        except ValueError:
+            pass
+        try:
+            float(str_value)
+            float_count += 1
+        except ValueError:
+            pass
+    if int_count + float_count > len(values) * 0.8:
+        return "REAL" if float_count > 0 else "INTEGER"
+    return "TEXT"
+
+
+def bench_type_inference(args):
+    """列类型推断: 逐单元格 try/except vs 整列正则批量分类（结果须一致）"""
+    from wikisql_database_manager import WikiSQLDatabaseManager
+
+    loader = WikiSQLDataLoader(data_dir=args.data_dir, local_wikisql_path=args.wikisql_path)
+    _, tables_file = loader.download_dataset(args.split)
+    tables = [(table, table.rows) for table in loader.load_tables(tables_file).values()]
+    manager = WikiSQLDatabaseManager()
+    print(f"表格数: {len(tables)}, 单元格数: {sum(len(rows) * len(t.header) for t, rows in tables)}")
+
+    def legacy():
+        return [[_legacy_infer_column_type([row[i] if i < len(row) else None for row in rows],
+                                           table.types[i] if i < len(table.types) else "text")
+                 for i in range(len(table.header))] for table, rows in tables]
+
+    def batched():
+        return [manager._infer_column_types(table, rows, len(table.header)) for table, rows in tables]
+
+    print_timing("逐单元格 try/except", time_call(legacy, args.repeat))
+    print_timing("整列正则批量", time_call(batched, args.repeat))
+    mismatches = sum(a != b for a, b in zip(legacy(), batched()))
+    print(f"  结果不一致的表格: {mismatches}")
+    manager.engine.dispose()
+
+
+def bench_ingest(args):
+    """建表: 逐行插入 vs 逐表批量插入 vs 单事务批量插入(+快速建表PRAGMA)"""
+    from wikisql_database_manager import WikiSQLDatabaseManager
+
+    loader = WikiSQLDataLoader(data_dir=args.data_dir, local_wikisql_path=args.wikisql_path)
+    _, tables_file = loader.download_dataset(args.split)
+    tables = loader.load_tables(tables_file)
+    if args.tables:
+        tables = dict(list(tables.items())[:args.tables])
+    print(f"表格数: {len(tables)}, 行数: {sum(len(t.rows) for t in tables.values())}")
+
+    def build(method, fast_build=False):
+        def run():
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                db_path = ":memory:" if args.memory else os.path.join(tmp_dir, "bench.db")
+                manager = WikiSQLDatabaseManager(db_path, fast_build=fast_build)
+                method(manager)
+                manager.engine.dispose()
+        return run
+
+    def per_table(manager):
+        for table in tables.values():
+            manager.create_table_from_wikisql(table)
+
+    print_timing("逐行 text() 插入", time_call(build(lambda m: _legacy_build(m, tables)), args.repeat))
+    print_timing("逐表 executemany", time_call(build(per_table), args.repeat))
+    print_timing("单事务 executemany", time_call(build(lambda m: m.create_multiple_tables(tables)), args.repeat))
+    print_timing("单事务 + fast_build", time_call(build(lambda m: m.create_multiple_tables(tables), True), args.repeat))
+
+
+def bench_table_store(args):
+    """持久化表格库: 首次建表 vs 复用未变化的表格"""
+    from wikisql_database_manager import WikiSQLDatabaseManager
+
+    loader = WikiSQLDataLoader(data_dir=args.data_dir, local_wikisql_path=args.wikisql_path)
+    _, tables_file = loader.download_dataset(args.split)
+    tables = loader.load_tables(tables_file)
+    print(f"表格数: {len(tables)}")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "store.db")
+
+        def build():
+            manager = WikiSQLDatabaseManager(db_path)
+            manager.create_multiple_tables(tables)
+            manager.engine.dispose()
+
+        print_timing("首次建表", time_call(build, 1))
+        print_timing("复用 (新进程启动)", time_call(build, args.repeat))
+
+
+def bench_lazy_tables(args):
+    """首个查询结果的等待时间: 预先创建全部表格 vs 首次查询时建表"""
+    from wikisql_database_manager import WikiSQLDatabaseManager
+
+    loader = WikiSQLDataLoader(data_dir=args.data_dir, local_wikisql_path=args.wikisql_path)
+    _, tables_file = loader.download_dataset(args.split)
+    tables = loader.load_tables(tables_file)
+    first_id = next(iter(tables))
+    print(f"表格数: {len(tables)}")
+
+    def eager():
+        manager = WikiSQLDatabaseManager()
+        table_name = manager.create_multiple_tables(tables)[first_id]
+        manager.execute_query(f'SELECT COUNT(*) FROM "{table_name}"')
+        manager.engine.dispose()
+
+    def lazy():
+        manager = WikiSQLDatabaseManager()
+        table_name = manager.register_tables(tables)[first_id]
+        manager.execute_query(f'SELECT COUNT(*) FROM "{table_name}"')
+        manager.engine.dispose()
+
+    print_timing("预先建表后首个查询", time_call(eager, args.repeat))
+    print_timing("延迟建表首个查询", time_call(lazy, args.repeat))
+
+
+def bench_table_lru(args):
+    """遍历整个分割的所有表格: 无上限 vs LRU淘汰（表格数/内存预算）"""
+    import resource
+    from wikisql_database_manager import WikiSQLDatabaseManager
+
+    loader = WikiSQLDataLoader(data_dir=args.data_dir, local_wikisql_path=args.wikisql_path)
+    questions_file, tables_file = loader.download_dataset(args.split)
+    tables = loader.load_tables(tables_file)
+    table_ids = [q.table_id for q in loader.load_questions(questions_file) if q.table_id in tables]
+    print(f"问题数: {len(table_ids)}, 表格数: {len(tables)}")
+
+    configs = [("无上限", {}), (f"max_tables={args.max_tables}", {"max_tables": args.max_tables})]
+    if args.memory_budget_mb:
+        configs.append((f"memory_budget_mb={args.memory_budget_mb}", {"memory_budget_mb": args.memory_budget_mb}))
+
+    for label, kwargs in configs:
+        manager = WikiSQLDatabaseManager(**kwargs)
+        names = manager.register_tables(tables)
+
+        def run():
+            for table_id in table_ids:
+                manager.execute_query(f'SELECT COUNT(*) FROM "{names[table_id]}"')
+
+        print_timing(label, time_call(run, 1))
+        stats = manager.get_table_stats()
+        print(f"    数据库 {manager._db_used_bytes() / 1e6:.1f} MB, 命中 {stats['hits']}, 未命中 {stats['misses']}, "
+              f"淘汰 {stats['evictions']}, 峰值RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB")
+        manager.engine.dispose()
+
+
+def bench_official_db(args):
+    """启动建表成本: 从JSON建表 vs 只读打开/附加官方分割数据库"""
+    from wikisql_database_manager import WikiSQLDatabaseManager
+
+    loader = WikiSQLDataLoader(data_dir=args.data_dir, local_wikisql_path=args.wikisql_path)
+    _, tables_file = loader.download_dataset(args.split)
+    tables = loader.load_tables(tables_file)
+    official_db = Path(args.wikisql_path) / "data" / f"{args.split}.db"
+    print(f"表格数: {len(tables)}, 官方数据库: {official_db}")
+
+    def build(**kwargs):
+        def run():
+            manager = WikiSQLDatabaseManager(**kwargs)
+            manager.create_multiple_tables(tables)
+            manager.engine.dispose()
+        return run
+
+    print_timing("从JSON建表 (内存)", time_call(build(), args.repeat))
+    print_timing("只读打开官方数据库", time_call(build(db_path=str(official_db), readonly=True), args.repeat))
+    print_timing("附加官方数据库", time_call(build(attach_db=str(official_db)), args.repeat))
+
+
+def bench_concurrent_query(args):
+    """多线程执行查询: 单线程 vs 线程池，共享缓存内存数据库与文件数据库（结果须与单线程一致）"""
+    from concurrent.futures import ThreadPoolExecutor
+    from wikisql_database_manager import WikiSQLDatabaseManager
+
+    loader = WikiSQLDataLoader(data_dir=args.data_dir, local_wikisql_path=args.wikisql_path)
+    questions_file, tables_file = loader.download_dataset(args.split)
+    tables = loader.load_tables(tables_file)
+    table_ids = [q.table_id for q in loader.load_questions(questions_file) if q.table_id in tables]
+    print(f"问题数: {len(table_ids)}, 表格数: {len(tables)}, 线程数: {args.threads}")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for label, db_path in (("共享缓存内存库", ":memory:"), ("文件库", os.path.join(tmp_dir, "bench.db"))):
+            manager = WikiSQLDatabaseManager(db_path, concurrent=True, pool_size=args.threads,
+                                             max_tables=args.max_tables)
+            names = manager.register_tables(tables)
+            queries = [f'SELECT * FROM "{names[table_id]}" ORDER BY 1' for table_id in table_ids]
+            expected = [manager.execute_query(query) for query in queries]
+
+            def serial():
+                return [manager.execute_query(query) for query in queries]
+
+            def threaded():
+                with ThreadPoolExecutor(args.threads) as pool:
+                    return list(pool.map(manager.execute_query, queries))
+
+            print(f"  [{label}]")
+            print_timing("单线程", time_call(serial, args.repeat))
+            print_timing(f"{args.threads} 线程", time_call(threaded, args.repeat))
+            mismatches = sum(a != b for a, b in zip(expected, threaded()))
+            print(f"    结果不一致的查询: {mismatches}, 表格统计: {manager.get_table_stats()}")
+            manager.close()
+
+
+def _official_queries(args):
+    """
+    官方评估执行的查询: 分割的标准答案，以及 --pred-file 中可解析的预测
+
+    Returns:
+        (官方分割数据库文件, [(table_id, Query), ...])
+    """
+    # 官方评估代码使用仓库中的 WikiSQL/lib，数据来自 --wikisql-path
+    Query = import_wikisql_module("query").Query
+
+    data_dir = Path(args.wikisql_path) / "data"
+    queries = []
+    with open(data_dir / f"{args.split}.jsonl", 'r', encoding='utf-8') as f:
+        examples = [json.loads(line) for line in f]
+    for example in examples:
+        queries.append((example['table_id'], Query.from_dict(example['sql'])))
+    if args.pred_file:
+        with open(args.pred_file, 'r', encoding='utf-8') as f:
+            for example, line in zip(examples, f):
+                prediction = json.loads(line)
+                try:
+                    queries.append((example['table_id'], Query.from_dict(prediction['query'])))
+                except Exception:
+                    pass
+    return str(data_dir / f"{args.split}.db"), queries
+
+
+def _run_official(engine, queries) -> list:
+    """逐个执行查询，返回结果或异常类型名"""
+    results = []
+    for table_id, query in queries:
+        try:
+            results.append(engine.execute_query(table_id, query, lower=True))
+        except Exception as e:
+            results.append(type(e).__name__)
+    return results
+
+
+def bench_dbengine(args):
+    """官方DBEngine逐查询开销: 表结构目录缓存、records与原生sqlite3连接（结果须一致）"""
+    db_file, queries = _official_queries(args)
+    from lib.dbengine import DBEngine
+    print(f"查询数: {len(queries)}, 数据库: {db_file}")
+
+    expected = None
+    for label, kwargs in (("每次查询sqlite_master", {"catalog": None}),
+                          ("按表缓存结构 (lazy)", {"catalog": "lazy"}),
+                          ("一次读入结构 (eager)", {"catalog": "eager"}),
+                          ("eager + 原生sqlite3", {"catalog": "eager", "backend": "sqlite3"})):
+        results = []
+        timings = time_call(lambda: results.append(_run_official(DBEngine(db_file, **kwargs), queries)),
+                            args.repeat)
+        print_timing(label, timings)
+        print(f"    每个查询 {min(timings) / len(queries) * 1e6:.1f} µs")
+        expected = expected or results[0]
+        mismatches = sum(a != b for a, b in zip(expected, results[-1]))
+        print(f"    与第一项结果不一致的查询: {mismatches}")
+
+
+def _legacy_terms(sequence, table, lowercase):
+    """原 Query.from_sequence 的预处理: 深拷贝、截断到symend、逐词典小写化"""
+    import re
+    from copy import deepcopy
+    from lib.common import detokenize
+    from lib.query import re_whitespace
+
+    sequence = deepcopy(sequence)
+    if 'symend' in sequence['words']:
+        end = sequence['words'].index('symend')
+        for k, v in sequence.items():
+            sequence[k] = v[:end]
+    terms = [{'gloss': g, 'word': w, 'after': a} for g, w, a in
+             zip(sequence['gloss'], sequence['words'], sequence['after'])]
+    headers = [detokenize(h) for h in table['header']]
+    if lowercase:
+        headers = [h.lower() for h in headers]
+        for t in terms:
+            for k, v in t.items():
+                t[k] = v.lower()
+    headers_no_whitespace = [re.sub(re_whitespace, '', h) for h in headers]
+
+    def find_column(name):
+        return headers_no_whitespace.index(re.sub(re_whitespace, '', name))
+
+    return terms, find_column
+
+
+def _legacy_flatten(tokens):
+    ret = {'words': [], 'after': [], 'gloss': []}
+    for t in tokens:
+        ret['words'].append(t['word'])
+        ret['after'].append(t['after'])
+        ret['gloss'].append(t['gloss'])
+    return ret
+
+
+def _legacy_conditions(Query, where_terms, find_column) -> list:
+    """原实现的条件解析: 每个条件 pop(0) 并重新 flatten 剩余词项"""
+    from lib.common import detokenize
+
+    conditions = []
+    while where_terms:
+        t = where_terms.pop(0)
+        flat = _legacy_flatten(where_terms)
+        if t['word'] != 'symcol':
+            raise Exception('Missing conditional column {}'.format(flat['words']))
+        try:
+            op_index = flat['words'].index('symop')
+            col_tokens = _legacy_flatten(where_terms[:op_index])
+        except Exception:
+            raise Exception('Missing conditional operator {}'.format(flat['words']))
+        cond_op = where_terms[op_index + 1]['word']
+        try:
+            cond_op = Query.cond_ops.index(cond_op.upper())
+        except Exception:
+            raise Exception('Invalid cond op {}'.format(cond_op))
+        try:
+            cond_col = find_column(detokenize(col_tokens))
+        except Exception:
+            raise Exception('Cannot find conditional column {}'.format(col_tokens['words']))
+        try:
+            val_index = flat['words'].index('symcond')
+        except Exception:
+            raise Exception('Cannot find conditional value {}'.format(flat['words']))
+        where_terms = where_terms[val_index + 1:]
+        flat = _legacy_flatten(where_terms)
+        val_end_index = flat['words'].index('symand') if 'symand' in flat['words'] else len(where_terms)
+        conditions.append([cond_col, cond_op, detokenize(_legacy_flatten(where_terms[:val_end_index]))])
+        where_terms = where_terms[val_end_index + 1:]
+    return conditions
+
+
+def _legacy_from_sequence(Query, sequence, table, lowercase=True):
+    """原 Query.from_sequence（深拷贝 + pop(0) + 每个条件重新 flatten）"""
+    from lib.common import detokenize
+
+    terms, find_column = _legacy_terms(sequence, table, lowercase)
+    if 'symselect' != terms.pop(0)['word']:
+        raise Exception('Missing symselect operator')
+    if 'symagg' != terms.pop(0)['word']:
+        raise Exception('Missing symagg operator')
+    agg_op = terms.pop(0)['word']
+    if agg_op == 'symcol':
+        agg_op = ''
+    elif 'symcol' != terms.pop(0)['word']:
+        raise Exception('Missing aggregation column')
+    try:
+        agg_op = Query.agg_ops.index(agg_op.upper())
+    except Exception:
+        raise Exception('Invalid agg op {}'.format(agg_op))
+    where_index = [i for i, t in enumerate(terms) if t['word'] == 'symwhere']
+    where_index = where_index[0] if where_index else len(terms)
+    flat = _legacy_flatten(terms[:where_index])
+    try:
+        agg_col = find_column(detokenize(flat))
+    except Exception:
+        raise Exception('Cannot find aggregation column {}'.format(flat['words']))
+    return Query(agg_col, agg_op, _legacy_conditions(Query, terms[where_index + 1:], find_column))
+
+
+def _legacy_from_partial_sequence(Query, agg_col, agg_op, sequence, table, lowercase=True):
+    """原 Query.from_partial_sequence"""
+    terms, find_column = _legacy_terms(sequence, table, lowercase)
+    where_index = [i for i, t in enumerate(terms) if t['word'] == 'symwhere']
+    where_index = where_index[0] if where_index else len(terms)
+    return Query(agg_col, agg_op, _legacy_conditions(Query, terms[where_index + 1:], find_column))
+
+
+def _parse_outcome(parse) -> tuple:
+    """解析结果 (sel, agg, conds) 或异常类型与消息"""
+    try:
+        query = parse()
+        return query.sel_index, query.agg_index, query.conditions
+    except Exception as e:
+        return type(e).__name__, str(e)
+
+
+def bench_query_parse(args):
+    """从标注的输出序列重建查询: 原实现 vs 单遍游标解析（结果和错误信息须一致）"""
+    Query = import_wikisql_module("query").Query
+
+    annotated_file = args.annotated_file or str(Path(args.wikisql_path) / "annotated" / f"{args.split}.jsonl")
+    with open(annotated_file, 'r', encoding='utf-8') as f:
+        examples = [json.loads(line) for line in f]
+    # 每个例子的完整序列，以及按标准答案的sel/agg只解析条件的WHERE序列；--scale 把条件重复多次以观察序列变长时的开销
+    jobs = []
+    for e in examples:
+        seq, where = e['seq_output'], e['where_output']
+        if args.scale > 1 and e['query']['conds']:
+            seq = _repeat_conditions(seq, args.scale)
+            where = _repeat_conditions(where, args.scale)
+        jobs.append((seq, where, e['table'], e['query']['sel'], e['query']['agg']))
+    tokens = sum(len(seq['words']) + len(where['words']) for seq, where, *_ in jobs)
+    print(f"例子数: {len(jobs)}, 词数: {tokens}, 文件: {annotated_file}")
+
+    def legacy():
+        return [(_parse_outcome(lambda: _legacy_from_sequence(Query, seq, table)),
+                 _parse_outcome(lambda: _legacy_from_partial_sequence(Query, sel, agg, where, table)))
+                for seq, where, table, sel, agg in jobs]
+
+    def cursor():
+        return [(_parse_outcome(lambda: Query.from_sequence(seq, table)),
+                 _parse_outcome(lambda: Query.from_partial_sequence(sel, agg, where, table)))
+                for seq, where, table, sel, agg in jobs]
+
+    print_timing("deepcopy + pop(0) + flatten", time_call(legacy, args.repeat))
+    print_timing("单遍游标", time_call(cursor, args.repeat))
+    mismatches = sum(a != b for a, b in zip(legacy(), cursor()))
+    print(f"  结果或错误信息不一致的例子: {mismatches}")
+
+
+def _repeat_conditions(sequence: dict, times: int) -> dict:
+    """把序列 symwhere 之后（symend之前）的条件重复 times 次，用 symand 连接"""
+    words = sequence['words']
+    start = words.index('symwhere') + 1
+    end = words.index('symend') if 'symend' in words else len(words)
+    repeated = {}
+    for key in ('gloss', 'words', 'after'):
+        values = sequence[key]
+        joiner = ['SYMAND' if key == 'gloss' else 'symand' if key == 'words' else ' ']
+        conds = values[start:end]
+        body = conds + (joiner + conds) * (times - 1)
+        repeated[key] = values[:start] + body + values[end:]
+    return repeated
+
+
+# 在新进程中计时: 导入数据库管理器模块、创建管理器、（可选）取LangChain对象
+_IMPORT_TIME_SCRIPT = """
+import sys, time
+start = time.perf_counter()
+import wikisql_database_manager
+imported = time.perf_counter()
+manager = wikisql_database_manager.WikiSQLDatabaseManager()
+created = time.perf_counter()
+if {langchain}:
+    manager.get_langchain_db()
+print(imported - start, created - imported, time.perf_counter() - created,
+      int('langchain_community' in sys.modules))
+"""
+
+
+def bench_import_time(args):
+    """进程启动成本: 导入并创建数据库管理器（LangChain延迟导入）vs 同时创建LangChain对象"""
+    import subprocess
+
+    repo_dir = str(Path(__file__).resolve().parent)
+    for label, langchain in (("不使用LangChain", False), ("首次调用get_langchain_db", True)):
+        timings = {"导入模块": [], "创建管理器": [], "创建LangChain对象": [], "进程总耗时": []}
+        loaded = False
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            result = subprocess.run([sys.executable, "-c", _IMPORT_TIME_SCRIPT.format(langchain=langchain)],
+                                    cwd=repo_dir, capture_output=True, text=True)
+            total = time.perf_counter() - start
+            if result.returncode != 0:
+                print(f"  {label}: 失败\n{result.stderr.strip().splitlines()[-1]}")
+                break
+            import_time, create_time, langchain_time, loaded = result.stdout.split()
+            timings["导入模块"].append(float(import_time))
+            timings["创建管理器"].append(float(create_time))
+            timings["创建LangChain对象"].append(float(langchain_time))
+            timings["进程总耗时"].append(total)
+        else:
+            print(f"  [{label}] langchain_community 已导入: {bool(int(loaded))}")
+            for name, values in timings.items():
+                print_timing(name, values)
+
+
+def main():
+    """主函数"""
+    parser = ArgumentParser(description="WikiSQL性能基准测试")
+    parser.add_argument('--split', default='dev', help='数据分割 (train/dev/test)')
+    parser.add_argument('--wikisql-path', default='WikiSQL', help='本地WikiSQL项目路径')
+    parser.add_argument('--data-dir', default='data', help='数据与缓存目录')
+    parser.add_argument('--repeat', type=int, default=3, help='每项重复次数')
+    subparsers = parser.add_subparsers(dest='benchmark')
+
+    subparsers.add_parser('table-cache', help='表格二进制缓存 冷/热 加载对比').set_defaults(func=bench_table_cache)
+
+    parallel_parser = subparsers.add_parser('parallel-parse', help='串行与并行JSONL解析对比')
+    parallel_parser.add_argument('--workers', type=int, default=None, help='并行进程数，默认CPU核数')
+    parallel_parser.set_defaults(func=bench_parallel_parse)
+
+    subparsers.add_parser('memory', help='普通与紧凑数据结构的内存占用对比').set_defaults(func=bench_memory)
+
+    download_parser = subparsers.add_parser('download', help='逐个与并发下载数据集对比')
+    download_parser.add_argument('--base-url', default='https://github.com/salesforce/WikiSQL/raw/master/data',
+                                 help='数据文件所在的URL目录（如本地 python -m http.server）')
+    download_parser.set_defaults(func=bench_download)
+
+    subparsers.add_parser('type-inference', help='逐单元格与整列批量的列类型推断对比').set_defaults(
+        func=bench_type_inference)
+
+    ingest_parser = subparsers.add_parser('ingest', help='逐行与批量建表对比')
+    ingest_parser.add_argument('--tables', type=int, default=None, help='只使用前N个表格')
+    ingest_parser.add_argument('--memory', action='store_true', help='使用内存数据库而不是临时文件')
+    ingest_parser.set_defaults(func=bench_ingest)
+
+    subparsers.add_parser('table-store', help='持久化表格库 首次/复用 建表对比').set_defaults(func=bench_table_store)
+
+    subparsers.add_parser('lazy-tables', help='预先建表与延迟建表的首个查询耗时对比').set_defaults(func=bench_lazy_tables)
+
+    lru_parser = subparsers.add_parser('table-lru', help='按问题顺序遍历整个分割时的LRU表格淘汰')
+    lru_parser.add_argument('--max-tables', type=int, default=100, help='最多保留的表格数')
+    lru_parser.add_argument('--memory-budget-mb', type=float, default=None, help='数据库大小上限（MB）')
+    lru_parser.set_defaults(func=bench_table_lru)
+
+    subparsers.add_parser('official-db', help='从JSON建表与使用官方分割数据库对比').set_defaults(func=bench_official_db)
+
+    subparsers.add_parser('import-time', help='新进程中导入并创建数据库管理器的耗时').set_defaults(
+        func=bench_import_time)
+
+    concurrent_parser = subparsers.add_parser('concurrent-query', help='单线程与多线程执行查询对比')
+    concurrent_parser.add_argument('--threads', type=int, default=8, help='线程数')
+    concurrent_parser.add_argument('--max-tables', type=int, default=None, help='最多保留的表格数（同时测试并发淘汰）')
+    concurrent_parser.set_defaults(func=bench_concurrent_query)
+
+    dbengine_parser = subparsers.add_parser('dbengine', help='官方DBEngine逐查询开销（表结构目录缓存、连接后端）')
+    dbengine_parser.add_argument('--pred-file', default=None, help='同时执行的预测文件（官方evaluate.py格式）')
+    dbengine_parser.set_defaults(func=bench_dbengine)
+
+    parse_parser = subparsers.add_parser('query-parse', help='从标注的输出序列重建查询（Query.from_sequence）')
+    parse_parser.add_argument('--annotated-file', default=None,
+                              help='标注文件，默认 <wikisql-path>/annotated/<split>.jsonl')
+    parse_parser.add_argument('--scale', type=int, default=1, help='把每个例子的条件重复N次（更长的序列）')
+    parse_parser.set_defaults(func=bench_query_parse)
+
+    args = parser.parse_args()
+    if not getattr(args, 'func', None):
+        parser.print_help()
+        sys.exit(1)
+
+    print("=" * 60)
+    print(f"WikiSQL Benchmark: {args.benchmark}")
+    print("=" * 60)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+WikiSQL分割编译器
+离线把一个分割的表格 (JSONL) 编译为单个SQLite文件: 批量建表、VACUUM，并写出记录表名、行数和
+列类型的清单。默认不建索引；--index conds/all 为条件候选列建索引，此时才执行ANALYZE。
+表格布局与官方分割数据库相同（table_<id>、col0 text/real 列、字符串值小写），不建索引时
+可直接替代官方数据库交给 WikiSQL/lib/dbengine.py、列式引擎、WikiSQLDatabaseManager(readonly=True)、
+验证器和兼容评估器只读打开，每次实验不再重新建表。
+经 WikiSQLDatabaseManager 查询时，SQL中的字符串常量会转为小写以匹配小写的字符串值。
+"""
+
+import os
+import json
+import time
+import sqlite3
+import logging
+from argparse import ArgumentParser
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from wikisql_data_loader import WikiSQLDataLoader, WikiSQLQuestion, WikiSQLTable
+from wikisql_database_manager import FAST_BUILD_PRAGMAS, WikiSQLDatabaseManager
+from wikisql_validator import import_wikisql_module
+
+logger = logging.getLogger(__name__)
+
+# 编译结果清单的格式版本
+COMPILED_MANIFEST_VERSION = 1
+
+# 建索引的列: conds 只索引该分割问题条件中出现过的列；all 索引所有列；none 不建索引（默认）
+# 注意: 有索引时SQLite可能按索引顺序返回无ORDER BY查询的行，SUM/AVG的浮点累加顺序也随之改变，
+# 结果与官方（无索引）数据库不再逐项相同，官方评估的准确率可能不同；只有 none 可直接替代官方数据库
+INDEX_MODES = ("conds", "all", "none")
+
+# 行数少于该值的表格不建索引（小表全表扫描比查索引更快）
+DEFAULT_INDEX_MIN_ROWS = 32
+
+
+def compiled_manifest_path(db_file: str) -> Path:
+    """编译结果对应的清单文件，如 dev.compiled.db -> dev.compiled.manifest.json"""
+    path = Path(db_file)
+    return path.with_name(f"{path.stem}.manifest.json")
+
+
+def load_compiled_manifest(db_file: str) -> Dict[str, Any]:
+    """读取编译结果的清单"""
+    with open(compiled_manifest_path(db_file), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def condition_columns(questions: Iterable[WikiSQLQuestion]) -> Dict[str, Set[int]]:
+    """
+    统计每个表格在问题条件中出现过的列
+
+    Args:
+        questions: 问题列表
+
+    Returns:
+        table_id -> 条件列下标集合
+    """
+    columns: Dict[str, Set[int]] = {}
+    for question in questions:
+        for cond in (question.sql or {}).get('conds', []):
+            if cond and isinstance(cond[0], int):
+                columns.setdefault(question.table_id, set()).add(cond[0])
+    return columns
+
+
+def _official_layout(wikisql_table: WikiSQLTable) -> Tuple[str, List[str], List[List[Any]]]:
+    """
+    官方数据库中的建表语句和数据行（与 WikiSQL/lib/table.py 的 Table.create_table(lower=True) 一致）
+
+    Args:
+        wikisql_table: WikiSQL表格对象
+
+    Returns:
+        (CREATE TABLE语句, 列类型列表, 数据行)；字符串值转为小写，行按列数补齐/截断
+    """
+    width = len(wikisql_table.header)
+    types = [(wikisql_table.types[i] if i < len(wikisql_table.types) else "text") for i in range(width)]
+    table_name = WikiSQLDatabaseManager.official_table_name(wikisql_table.id)
+    type_str = ', '.join(f'col{i} {t}' for i, t in enumerate(types))
+    rows = []
+    # 紧凑表格的rows每次访问都会解码，只取一次
+    for row in wikisql_table.rows:
+        values = [v.lower() if isinstance(v, str) else v for v in row[:width]]
+        values.extend([None] * (width - len(values)))
+        rows.append(values)
+    return f'CREATE TABLE {table_name} ({type_str})', types, rows
+
+
+def _create_indexes(conn: sqlite3.Connection, table_name: str, columns: Iterable[int]) -> list:
+    """为表格的指定列创建单列索引，返回索引的列名"""
+    indexed = []
+    for col in sorted(columns):
+        column = f"col{col}"
+        conn.execute(f'CREATE INDEX IF NOT EXISTS "idx_{table_name}_{column}" ON "{table_name}" ("{column}")')
+        indexed.append(column)
+    return indexed
+
+
+def compile_split(split: str = "dev", output: Optional[str] = None, data_dir: str = "data",
+                  local_wikisql_path: Optional[str] = None, index_mode: str = "none",
+                  index_min_rows: int = DEFAULT_INDEX_MIN_ROWS, vacuum: bool = True) -> Dict[str, Any]:
+    """
+    把一个分割编译为优化过的只读SQLite文件
+
+    先写入临时文件，完成后再原子地替换 output，中途失败不会留下不完整的编译结果。
+
+    Args:
+        split: 数据分割 (train/dev/test)
+        output: 输出的数据库文件，默认 data_dir/{split}.compiled.db
+        data_dir: 数据与缓存目录
+        local_wikisql_path: 本地WikiSQL项目路径
+        index_mode: 建索引的列（见 INDEX_MODES；建索引后结果顺序可能与官方数据库不同）
+        index_min_rows: 行数少于该值的表格不建索引
+        vacuum: 是否执行VACUUM压缩数据库
+
+    Returns:
+        编译清单
+    """
+    if index_mode not in INDEX_MODES:
+        raise ValueError(f"无效的索引方式: {index_mode}，可选 {INDEX_MODES}")
+    start = time.perf_counter()
+    output_path = Path(output) if output else Path(data_dir) / f"{split}.compiled.db"
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = output_path.with_name(output_path.name + ".tmp")
+    if tmp_path.exists():
+        tmp_path.unlink()
+
+    loader = WikiSQLDataLoader(data_dir=data_dir, local_wikisql_path=local_wikisql_path)
+    questions_file, tables_file = loader.download_dataset(split)
+    tables = loader.load_tables(tables_file)
+    cond_columns = condition_columns(loader.load_questions(questions_file)) if index_mode == "conds" else {}
+
+    conn = sqlite3.connect(tmp_path, isolation_level=None)
+    try:
+        # 1. 按官方布局批量建表（单事务 + 快速建表PRAGMA）
+        for pragma in FAST_BUILD_PRAGMAS:
+            conn.execute(pragma)
+        conn.execute("BEGIN")
+        created, column_types, row_counts = {}, {}, {}
+        for table_id, wikisql_table in tables.items():
+            if not wikisql_table.header:
+                logger.warning(f"表格 {table_id} 没有列，跳过")
+                continue
+            create_sql, types, rows = _official_layout(wikisql_table)
+            table_name = WikiSQLDatabaseManager.official_table_name(table_id)
+            conn.execute(create_sql)
+            conn.executemany(f'INSERT INTO {table_name} VALUES ({", ".join("?" * len(types))})', rows)
+            created[table_id], column_types[table_id], row_counts[table_id] = table_name, types, len(rows)
+        conn.execute("COMMIT")
+        logger.info(f"已建表 {len(created)}/{len(tables)} 个")
+
+        # 2. 为条件候选列建索引（所有表格建完之后，sqlite_master 中每个表格的建表语句在其索引之前）
+        conn.execute("BEGIN")
+        entries = {}
+        index_count = 0
+        for table_id, table_name in created.items():
+            row_count = row_counts[table_id]
+            num_columns = len(tables[table_id].header)
+            if index_mode == "all":
+                columns = range(num_columns)
+            else:
+                columns = {c for c in cond_columns.get(table_id, ()) if 0 <= c < num_columns}
+            indexed = _create_indexes(conn, table_name, columns) if row_count >= index_min_rows else []
+            index_count += len(indexed)
+            entries[table_id] = {
+                "table_name": table_name,
+                "rows": row_count,
+                "column_types": column_types.get(table_id, []),
+                "indexes": indexed,
+            }
+        conn.execute("COMMIT")
+
+        # 3. 有索引时收集统计信息供查询规划器选择索引（无索引时不生成 sqlite_stat1，与官方数据库一致），整理并压缩文件
+        if index_count:
+            conn.execute("ANALYZE")
+        if vacuum:
+            conn.execute("VACUUM")
+    finally:
+        conn.close()
+
+    os.replace(tmp_path, output_path)
+
+    manifest = {
+        "version": COMPILED_MANIFEST_VERSION,
+        "split": split,
+        "database": output_path.name,
+        "source": {"questions": str(questions_file), "tables": str(tables_file)},
+        "index_mode": index_mode,
+        "index_min_rows": index_min_rows,
+        "table_count": len(entries),
+        "index_count": index_count,
+        "size_bytes": output_path.stat().st_size,
+        "compile_seconds": round(time.perf_counter() - start, 3),
+        "tables": entries,
+    }
+    with open(compiled_manifest_path(output_path), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+
+    logger.info(f"编译完成: {output_path} ({len(entries)} 个表格, {index_count} 个索引, "
+                f"{manifest['size_bytes'] / 1e6:.1f} MB, {manifest['compile_seconds']:.1f} 秒)")
+    if not index_count and index_mode != "none":
+        logger.warning(f"没有建任何索引: 需要索引的表格行数都少于 index_min_rows={index_min_rows}")
+    return manifest
+
+
+def check_compiled(compiled_db: str, official_db: str, questions: Iterable[WikiSQLQuestion]) -> Dict[str, int]:
+    """
+    用官方 DBEngine 在编译结果和官方数据库上分别执行标准答案查询并比较结果
+
+    Args:
+        compiled_db: 编译结果
+        official_db: 官方分割数据库
+        questions: 问题列表（使用其中的标准答案SQL）
+
+    Returns:
+        查询数和结果（或异常类型）不一致的查询数
+    """
+    DBEngine = import_wikisql_module("dbengine").DBEngine
+    Query = import_wikisql_module("query").Query
+    engines = [DBEngine(db, catalog='eager', backend='sqlite3') for db in (compiled_db, official_db)]
+
+    def run(engine, table_id, query):
+        try:
+            return engine.execute_query(table_id, query, lower=True)
+        except Exception as e:
+            return type(e).__name__
+
+    total = mismatches = 0
+    for question in questions:
+        query = Query.from_dict(question.sql)
+        compiled, official = (run(engine, question.table_id, query) for engine in engines)
+        total += 1
+        if compiled != official:
+            mismatches += 1
+            if mismatches <= 5:
+                logger.warning(f"结果不一致: {question.table_id} {query}: 编译结果 {compiled!r}, 官方 {official!r}")
+    for engine in engines:
+        engine.conn.close()
+    return {"queries": total, "mismatches": mismatches}
+
+
+def main():
+    """主函数: 编译一个WikiSQL分割"""
+    logging.basicConfig(level=logging.INFO)
+    parser = ArgumentParser(description="把WikiSQL分割编译为优化过的只读SQLite文件")
+    parser.add_argument('--split', default='dev', help='数据分割 (train/dev/test)')
+    parser.add_argument('-o', '--output', help='输出的数据库文件，默认 <data-dir>/<split>.compiled.db')
+    parser.add_argument('--data-dir', default='data', help='数据与缓存目录')
+    parser.add_argument('--wikisql-path', default=None, help='本地WikiSQL项目路径')
+    parser.add_argument('--index', choices=INDEX_MODES, default='none',
+                        help='none: 不建索引，结果与官方数据库相同; conds: 问题条件中出现过的列; all: 所有列'
+                             '（有索引时无序查询的行顺序和SUM/AVG的浮点舍入可能与官方数据库不同）')
+    parser.add_argument('--index-min-rows', type=int, default=DEFAULT_INDEX_MIN_ROWS,
+                        help='行数少于该值的表格不建索引')
+    parser.add_argument('--no-vacuum', action='store_true', help='跳过VACUUM')
+    parser.add_argument('--check-against', metavar='OFFICIAL_DB',
+                        help='编译后在编译结果和该官方数据库上执行全部标准答案查询并比较结果')
+    args = parser.parse_args()
+
+    output = args.output or str(Path(args.data_dir) / f"{args.split}.compiled.db")
+    manifest = compile_split(args.split, output, args.data_dir, args.wikisql_path,
+                             args.index, args.index_min_rows, not args.no_vacuum)
+    print(f"{output}: {manifest['table_count']} 个表格, {manifest['index_count']} 个索引, "
+          f"{manifest['size_bytes'] / 1e6:.1f} MB")
+    if not manifest['index_count'] and args.index != 'none':
+        print(f"注意: 没有建任何索引，需要索引的表格行数都少于 --index-min-rows {args.index_min_rows}")
+    print(f"清单: {compiled_manifest_path(output)}")
+    print(f"只读使用: WikiSQLDatabaseManager(db_path, readonly=True) 或 "
+          f"python generate_wikisql_predictions.py --compiled-db <file>")
+    if args.check_against:
+        loader = WikiSQLDataLoader(data_dir=args.data_dir, local_wikisql_path=args.wikisql_path)
+        questions = loader.load_questions(Path(manifest['source']['questions']))
+        check = check_compiled(output, args.check_against, questions)
+        print(f"与官方数据库比较: {check['queries']} 个标准答案查询, {check['mismatches']} 个结果不一致")
+        if check['mismatches']:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
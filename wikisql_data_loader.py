@@ -3,19 +3,137 @@ WikiSQL数据加载器
 负责下载、解析和管理WikiSQL数据集
 """
 
+import io
 import os
+import re
+import gc
+import sys
 import json
+import mmap
+import pickle
+import time
+import struct
+import hashlib
+import threading
 import requests
 import pandas as pd
-from typing import Dict, List, Optional, Tuple
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
+from itertools import accumulate, islice
 from dataclasses import dataclass
+from array import array
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from collections import OrderedDict
 from pathlib import Path
 import logging
 
+from wikisql_io import COMPRESSED_SUFFIXES, count_lines, is_compressed, open_text
+from wikisql_sharding import contiguous_range, select_shard, shard_of_table, validate_shard
+
 # 设置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 表格缓存格式: 魔数 + 元数据长度 + 元数据JSON(源文件签名、各数据段的位置) + 按8字节对齐的数据段。
+# 数据段都是定长数组，读取时直接在mmap上按偏移取视图:
+#   value_kinds/value_ints/value_floats/string_offsets/string_data  所有不重复值（字符串为UTF-8池中的区间）
+#   tables    每个表格7个整数: id、name（值编号）、列数、行数、schema偏移、单元格偏移、行长度偏移（-1表示按列存储）
+#   schema    每个表格的header和types（值编号）
+#   cells     单元格的值编号，规整表格按列连续存放，列数不一致的表格按行存放
+#   row_lengths  列数不一致的表格每行的单元格数
+TABLE_CACHE_MAGIC = b"WSQLTBL\x01"
+TABLE_CACHE_VERSION = 3
+TABLE_CACHE_ALIGN = 8
+TABLE_CACHE_TABLE_FIELDS = 7
+# (段名, array类型码)
+TABLE_CACHE_SECTIONS = (
+    ("value_kinds", 'B'),
+    ("value_ints", 'q'),
+    ("value_floats", 'd'),
+    ("string_offsets", 'Q'),
+    ("string_data", 'B'),
+    ("tables", 'q'),
+    ("schema", 'I'),
+    ("cells", 'I'),
+    ("row_lengths", 'I'),
+)
+# 值的种类: 字符串的整数字段为字符串池序号；无法用前几种表示的值以JSON字符串存储
+VALUE_STR, VALUE_INT, VALUE_FLOAT, VALUE_NONE, VALUE_BOOL, VALUE_JSON = range(6)
+
+# 表格行中 "id": "..." 字段的快速匹配，用于构建字节偏移索引和流式扫描
+# （JSON字符串内部的引号必然被转义，因此该模式只会命中键名id）
+TABLE_ID_BYTES_RE = re.compile(rb'"id":\s*"([^"]+)"')
+TABLE_ID_RE = re.compile(r'"id":\s*"([^"]+)"')
+TABLE_INDEX_VERSION = 1
+SPLIT_SNAPSHOT_VERSION = 1
+
+# 下载: 未完成的文件写入 <文件名>.part，失败后通过HTTP Range续传；
+# 每次读取的块大小在上下限之间自适应，使单次读取耗时接近目标值
+DOWNLOAD_MANIFEST_NAME = "download_manifest.json"
+DOWNLOAD_PART_SUFFIX = ".part"
+DOWNLOAD_MIN_CHUNK = 64 * 1024
+DOWNLOAD_MAX_CHUNK = 8 * 1024 * 1024
+DOWNLOAD_TARGET_READ_SECONDS = 0.25
+DOWNLOAD_RETRIES = 3
+DOWNLOAD_TIMEOUT = 30
+
+
+def _file_signature(path: Path) -> Dict[str, Any]:
+    """源文件签名（路径、大小、修改时间），用于判断缓存是否失效"""
+    stat = path.stat()
+    return {
+        "path": str(path.resolve()),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+    }
+
+
+def _sha256_file(path: Path, block_size: int = 1 << 20) -> str:
+    """计算文件的SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _verify_download(path: Path, expected: Optional[Dict[str, Any]]) -> Optional[str]:
+    """
+    按清单校验文件
+
+    Args:
+        path: 文件路径
+        expected: 清单条目 {"size": 字节数, "sha256": 十六进制摘要}，字段均可缺省
+
+    Returns:
+        校验失败的原因；通过（或没有清单条目）时返回None
+    """
+    if not expected:
+        return None
+    size = path.stat().st_size
+    if expected.get("size") is not None and size != expected["size"]:
+        return f"大小不匹配: {size} != {expected['size']}"
+    if expected.get("sha256") and _sha256_file(path) != expected["sha256"].lower():
+        return "SHA-256校验失败"
+    return None
+
+
+def _table_cache_padding(meta_len: int) -> int:
+    """表格缓存元数据之后的填充字节数，使数据区起点按8字节对齐"""
+    return -(len(TABLE_CACHE_MAGIC) + 4 + meta_len) % TABLE_CACHE_ALIGN
+
+
+@contextmanager
+def _gc_paused():
+    """批量创建大量小对象时暂停循环垃圾回收"""
+    was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if was_enabled:
+            gc.enable()
+
 @dataclass
 class WikiSQLTable:
     """WikiSQL表格数据结构"""
@@ -34,6 +152,178 @@ class WikiSQLTable:
             if len(row) != len(self.header):
                 logger.warning(f"表格 {self.id}, 行 {i}: 列数不匹配")
 
+# 紧凑表示中重复出现的header/types元组在所有表格间共享
+_SHARED_TUPLES: Dict[tuple, tuple] = {}
+
+
+def _intern_value(value):
+    """字符串驻留，其他类型原样返回"""
+    return sys.intern(value) if type(value) is str else value
+
+
+def _shared_tuple(values) -> tuple:
+    """返回内容相同的共享元组（元素为驻留字符串）"""
+    key = tuple(_intern_value(v) for v in values)
+    return _SHARED_TUPLES.setdefault(key, key)
+
+
+def _encode_column(values) -> Tuple[tuple, array]:
+    """
+    对一列做字典编码
+    
+    Args:
+        values: 列中的所有值
+        
+    Returns:
+        (不重复值元组, 每行对应的编码数组)
+    """
+    positions: Dict[Any, int] = {}
+    distinct = []
+    codes = []
+    for value in values:
+        # 用 (类型, 值) 作为键，避免 1 / 1.0 / True 被合并
+        key = (type(value), value)
+        code = positions.get(key)
+        if code is None:
+            code = positions[key] = len(distinct)
+            distinct.append(_intern_value(value))
+        codes.append(code)
+    
+    typecode = 'B' if len(distinct) <= 0xFF else 'H' if len(distinct) <= 0xFFFF else 'I'
+    return tuple(distinct), array(typecode, codes)
+
+
+def _encode_coded_column(value_codes, values: list) -> Tuple[tuple, array]:
+    """
+    对已按全局值编号存储的一列做字典编码（全局编号已区分类型，无需再按值比较）
+    
+    Args:
+        value_codes: 列中每行的全局值编号
+        values: 全局值编号 -> 值
+        
+    Returns:
+        (不重复值元组, 每行对应的编码数组)
+    """
+    positions: Dict[int, int] = {}
+    codes = [positions.setdefault(code, len(positions)) for code in value_codes]
+    typecode = 'B' if len(positions) <= 0xFF else 'H' if len(positions) <= 0xFFFF else 'I'
+    return tuple(map(values.__getitem__, positions)), array(typecode, codes)
+
+
+class CompactWikiSQLTable:
+    """
+    紧凑的WikiSQL表格数据结构
+    
+    使用__slots__，header/types为跨表共享的驻留字符串元组，
+    行数据按列做字典编码存储；.header/.rows/.types 的访问方式与WikiSQLTable一致，
+    .rows 在访问时解码生成。
+    """
+    __slots__ = ('id', 'name', 'header', 'types', '_columns', '_raw_rows', '_num_rows')
+    
+    def __init__(self, id: str, header: List[str], rows: List[List[str]], types: List[str], name: str = ""):
+        self.id = _intern_value(id)
+        self.name = name
+        self.header = _shared_tuple(header)
+        self.types = _shared_tuple(types)
+        self._num_rows = len(rows)
+        
+        if len(self.header) != len(self.types):
+            logger.warning(f"表格 {self.id}: header和types长度不匹配")
+        
+        width = len(self.header)
+        ragged = False
+        for i, row in enumerate(rows):
+            if len(row) != width:
+                logger.warning(f"表格 {self.id}, 行 {i}: 列数不匹配")
+                ragged = True
+        
+        self._columns = None
+        self._raw_rows = None
+        if not ragged:
+            try:
+                self._columns = tuple(_encode_column(column) for column in zip(*rows)) if rows else ()
+            except TypeError:
+                # 含不可哈希的单元格值，无法字典编码
+                self._columns = None
+        if self._columns is None:
+            # 列数不一致或无法编码的表格保留原始行
+            self._raw_rows = tuple(tuple(_intern_value(v) for v in row) for row in rows)
+    
+    @classmethod
+    def from_columns(cls, id: str, header: List[str], columns: List[tuple], types: List[str], name: str = "",
+                     num_rows: Optional[int] = None) -> "CompactWikiSQLTable":
+        """
+        从按列存储的数据直接构建（跳过行转置）
+        
+        Args:
+            id: 表格ID
+            header: 列名
+            columns: 每列的值序列，长度须与header一致
+            types: 列类型
+            name: 表格名称
+            num_rows: 行数，默认取第一列的长度（没有列的表格须提供）
+        """
+        num_rows = num_rows if num_rows is not None else len(columns[0]) if columns else 0
+        return cls.from_encoded(id, header, [_encode_column(column) for column in columns], types, name, num_rows)
+    
+    @classmethod
+    def from_encoded(cls, id: str, header: List[str], columns: List[Tuple[tuple, array]], types: List[str],
+                     name: str, num_rows: int) -> "CompactWikiSQLTable":
+        """
+        从已字典编码的列直接构建
+        
+        Args:
+            id: 表格ID
+            header: 列名
+            columns: 每列的 (不重复值元组, 编码数组)
+            types: 列类型
+            name: 表格名称
+            num_rows: 行数
+        """
+        table = cls.__new__(cls)
+        table.id = _intern_value(id)
+        table.name = name
+        table.header = _shared_tuple(header)
+        table.types = _shared_tuple(types)
+        table._columns = tuple(columns)
+        table._raw_rows = None
+        table._num_rows = num_rows
+        return table
+    
+    @property
+    def num_rows(self) -> int:
+        """行数（无需解码）"""
+        return self._num_rows
+    
+    def column(self, index: int) -> List[Any]:
+        """解码单列"""
+        if self._columns is None:
+            return [row[index] if index < len(row) else None for row in self._raw_rows]
+        distinct, codes = self._columns[index]
+        return [distinct[code] for code in codes]
+    
+    @property
+    def rows(self) -> List[List[Any]]:
+        """解码得到的行数据（每次访问生成新列表）"""
+        if self._columns is None:
+            return [list(row) for row in self._raw_rows]
+        if not self._columns:
+            return [[] for _ in range(self._num_rows)]
+        decoded = [[distinct[code] for code in codes] for distinct, codes in self._columns]
+        return list(map(list, zip(*decoded)))
+    
+    def __eq__(self, other):
+        if not hasattr(other, 'rows') or not hasattr(other, 'header'):
+            return NotImplemented
+        return (self.id == other.id and list(self.header) == list(other.header)
+                and list(self.types) == list(other.types) and self.name == other.name
+                and self.rows == other.rows)
+    
+    def __repr__(self):
+        return (f"CompactWikiSQLTable(id={self.id!r}, header={list(self.header)!r}, "
+                f"rows=<{self._num_rows} rows>, types={list(self.types)!r}, name={self.name!r})")
+
+
 @dataclass 
 class WikiSQLQuestion:
     """WikiSQL问题数据结构"""
@@ -82,25 +372,227 @@ class WikiSQLQuestion:
             logger.error(f"SQL重建失败: {e}")
             return str(self.sql)
 
+
+class CompactWikiSQLQuestion:
+    """紧凑的WikiSQL问题数据结构（__slots__，table_id驻留）"""
+    __slots__ = ('id', 'question', 'sql', 'table_id', 'phase')
+    
+    def __init__(self, id: str, question: str, sql: Dict, table_id: str, phase: int = 1):
+        self.id = id
+        self.question = question
+        self.sql = sql
+        self.table_id = _intern_value(table_id)
+        self.phase = phase
+    
+    get_sql_string = WikiSQLQuestion.get_sql_string
+    
+    def __eq__(self, other):
+        if not hasattr(other, 'table_id') or not hasattr(other, 'sql'):
+            return NotImplemented
+        return (self.id, self.question, self.sql, self.table_id, self.phase) == \
+            (other.id, other.question, other.sql, other.table_id, other.phase)
+    
+    def __repr__(self):
+        return (f"CompactWikiSQLQuestion(id={self.id!r}, question={self.question!r}, sql={self.sql!r}, "
+                f"table_id={self.table_id!r}, phase={self.phase!r})")
+
+
+def _parse_table_line(line: str, line_num: int, compact: bool = False) -> Optional[WikiSQLTable]:
+    """
+    解析表格文件中的一行
+    
+    Args:
+        line: JSONL行
+        line_num: 行号（从1开始，用于日志）
+        compact: 是否返回CompactWikiSQLTable
+    
+    Returns:
+        WikiSQLTable，解析失败时返回None
+    """
+    try:
+        data = json.loads(line.strip())
+        table_cls = CompactWikiSQLTable if compact else WikiSQLTable
+    
+        return table_cls(
+            id=data['id'],
+            header=data['header'],
+            rows=data['rows'],
+            types=data.get('types', ['text'] * len(data['header'])),
+            name=data.get('name', f"table_{data['id']}")
+        )
+    
+    except json.JSONDecodeError as e:
+        logger.error(f"JSON解析错误 (行 {line_num}): {e}")
+    except Exception as e:
+        logger.error(f"表格加载错误 (行 {line_num}): {e}")
+    return None
+
+
+def _parse_question_line(line: str, line_num: int, compact: bool = False) -> Optional[WikiSQLQuestion]:
+    """
+    解析问题文件中的一行
+    
+    Args:
+        line: JSONL行
+        line_num: 行号（从1开始，同时作为问题ID）
+        compact: 是否返回CompactWikiSQLQuestion
+    
+    Returns:
+        WikiSQLQuestion，解析失败时返回None
+    """
+    try:
+        data = json.loads(line.strip())
+        question_cls = CompactWikiSQLQuestion if compact else WikiSQLQuestion
+    
+        return question_cls(
+            id=str(line_num),  # 使用行号作为ID
+            question=data['question'],
+            sql=data['sql'],
+            table_id=data['table_id'],
+            phase=data.get('phase', 1)
+        )
+    
+    except json.JSONDecodeError as e:
+        logger.error(f"JSON解析错误 (行 {line_num}): {e}")
+    except Exception as e:
+        logger.error(f"问题加载错误 (行 {line_num}): {e}")
+    return None
+
+
+def _find_existing(path: Path) -> Optional[Path]:
+    """
+    查找文件，未压缩版本不存在时依次尝试压缩版本（如 dev.jsonl.bz2）
+    
+    Args:
+        path: 未压缩文件路径
+        
+    Returns:
+        存在的文件路径，都不存在时返回None
+    """
+    if path.exists():
+        return path
+    for suffix in COMPRESSED_SUFFIXES:
+        compressed = path.with_name(path.name + suffix)
+        if compressed.exists():
+            return compressed
+    return None
+
+
+def _split_jsonl_chunks(path: Path, num_chunks: int) -> List[Tuple[int, int]]:
+    """
+    将JSONL文件按字节切分为若干块，块边界对齐到换行符
+    
+    Args:
+        path: 文件路径
+        num_chunks: 期望的块数
+        
+    Returns:
+        [(起始偏移, 结束偏移), ...]，按文件顺序排列
+    """
+    size = path.stat().st_size
+    chunk_size = max(1, size // max(1, num_chunks))
+    
+    boundaries = [0]
+    with open(path, 'rb') as f:
+        while boundaries[-1] < size:
+            f.seek(min(size, boundaries[-1] + chunk_size))
+            f.readline()  # 前进到下一个换行符之后
+            end = f.tell()
+            if end <= boundaries[-1]:
+                end = size
+            boundaries.append(end)
+    
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def _parse_jsonl_chunk(path: str, start: int, end: int, kind: str, compact: bool = False) -> Tuple[int, list]:
+    """
+    解析JSONL文件中的一个字节块（在子进程中运行）
+    
+    Args:
+        path: 文件路径
+        start: 起始字节偏移（位于行首）
+        end: 结束字节偏移（位于行首或文件末尾）
+        kind: "tables" 或 "questions"
+        compact: 是否生成紧凑数据结构
+        
+    Returns:
+        (块内行数, 解析结果列表)；问题ID为块内相对行号，由调用方修正
+    """
+    parse_line = _parse_table_line if kind == "tables" else _parse_question_line
+    
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    
+    # 与串行路径一致使用通用换行符模式，保证行号相同
+    line_count = 0
+    items = []
+    for line_count, line in enumerate(io.TextIOWrapper(io.BytesIO(data), encoding='utf-8'), 1):
+        item = parse_line(line, line_count, compact)
+        if item is not None:
+            items.append(item)
+    
+    return line_count, items
+
+
+def _reshare_compact(items: list):
+    """
+    重新驻留子进程返回的紧凑结构中的字符串并共享header/types元组
+    
+    紧凑结构经pickle传回父进程后，驻留字符串和跨表共享的元组都变成了各自独立的副本
+    
+    Args:
+        items: CompactWikiSQLTable 或 CompactWikiSQLQuestion 列表（原地修改）
+    """
+    for item in items:
+        if isinstance(item, CompactWikiSQLQuestion):
+            item.table_id = _intern_value(item.table_id)
+            continue
+        item.id = _intern_value(item.id)
+        item.header = _shared_tuple(item.header)
+        item.types = _shared_tuple(item.types)
+        if item._columns is not None:
+            item._columns = tuple((tuple(map(_intern_value, distinct)), codes) for distinct, codes in item._columns)
+        else:
+            item._raw_rows = tuple(tuple(map(_intern_value, row)) for row in item._raw_rows)
+
+
 class WikiSQLDataLoader:
     """WikiSQL数据加载器"""
     
-    def __init__(self, data_dir: str = "data", local_wikisql_path: str = None):
+    def __init__(self, data_dir: str = "data", local_wikisql_path: str = None, parse_workers: int = 1,
+                 compact: bool = False, split_cache_budget_mb: Optional[float] = None,
+                 split_snapshot: bool = False, url_sources: Optional[List[Dict[str, str]]] = None,
+                 download_manifest: Union[str, Path, Dict[str, Dict[str, Any]], None] = None,
+                 download_workers: int = 2):
         """
         初始化数据加载器
         
         Args:
             data_dir: 数据存储目录
             local_wikisql_path: 本地WikiSQL项目路径（如果提供，将直接读取本地文件）
+            parse_workers: 解析JSONL时使用的进程数，1表示串行解析
+            compact: 是否使用紧凑数据结构（CompactWikiSQLTable/CompactWikiSQLQuestion）以降低内存
+            split_cache_budget_mb: 分割缓存的内存预算（按源文件大小估算），超出时按LRU淘汰整个分割；None表示不限制
+            split_snapshot: 是否将解析后的问题保存为磁盘快照，供后续进程直接加载
+            url_sources: 自定义下载源列表（键同默认源，如 "dev"、"dev_tables"），可指向本地HTTP服务
+            download_manifest: 下载清单（文件名 -> {"size", "sha256"}）或清单JSON路径；
+                None时使用 data_dir 下的 download_manifest.json（不存在则在首次下载后生成）
+            download_workers: 下载数据集时并发下载的文件数
         """
         self.data_dir = Path(data_dir)
         self.data_dir.mkdir(exist_ok=True)
+        self.parse_workers = parse_workers
+        self.compact = compact
+        self.split_cache_budget_bytes = int(split_cache_budget_mb * 1024 * 1024) if split_cache_budget_mb else None
+        self.split_snapshot = split_snapshot
         
         # 本地WikiSQL路径
         self.local_wikisql_path = Path(local_wikisql_path) if local_wikisql_path else None
         
         # WikiSQL数据集URL - 多个备用源
-        self.url_sources = [
+        self.url_sources = url_sources or [
             # 尝试main分支
             {
                 "train": "https://github.com/salesforce/WikiSQL/raw/main/data/train.jsonl",
@@ -124,27 +616,305 @@ class WikiSQLDataLoader:
         # 当前使用的URL集合
         self.urls = self.url_sources[0]
         
-        # 缓存
-        self._tables_cache: Dict[str, WikiSQLTable] = {}
-        self._questions_cache: Dict[str, List[WikiSQLQuestion]] = {}
+        # 下载清单与并发下载
+        self.download_workers = max(1, download_workers)
+        self._manifest_lock = threading.Lock()
+        if isinstance(download_manifest, dict):
+            self.download_manifest_path = None
+            self.download_manifest = dict(download_manifest)
+        else:
+            self.download_manifest_path = Path(download_manifest) if download_manifest else self.data_dir / DOWNLOAD_MANIFEST_NAME
+            self.download_manifest = self._load_download_manifest(self.download_manifest_path)
+        
+        # 分割缓存: split -> (完整问题列表, 完整表格字典, 估算字节数)，按最近使用排序
+        self._split_cache: "OrderedDict[str, Tuple[List[WikiSQLQuestion], Dict[str, WikiSQLTable], int]]" = OrderedDict()
+        
+        # 表格随机访问: 源文件路径 -> (table_id -> (字节偏移, 长度)) 以及对应的mmap
+        self._table_indexes: Dict[str, Dict[str, Tuple[int, int]]] = {}
+        self._table_mmaps: Dict[str, mmap.mmap] = {}
+        # 已校验的下载文件: 路径 -> (文件签名, 校验时的清单条目)；签名和清单条目都不变时不再计算SHA-256
+        self._verified_downloads: Dict[str, Tuple[Dict[str, Any], Optional[Dict[str, Any]]]] = {}
+        # 每个分割查找到的本地文件（没有时为None）
+        self._local_files: Dict[str, Optional[Tuple[Path, Path]]] = {}
+        
+        # get_table 按分割解析一次的表格文件: split -> (表格文件, 偏移索引, mmap)；压缩文件没有索引和mmap
+        self._table_sources: Dict[str, Tuple[Path, Optional[Dict[str, Tuple[int, int]]], Optional[mmap.mmap]]] = {}
     
-    def _get_local_file_path(self, split: str, file_type: str) -> Optional[Path]:
+    def _get_cache_path(self, source_file: Path, suffix: str) -> Path:
+        """
+        获取源文件对应的缓存文件路径
+        
+        Args:
+            source_file: 源数据文件
+            suffix: 缓存文件后缀
+            
+        Returns:
+            缓存文件路径（位于 data_dir/cache 下）
+        """
+        cache_dir = self.data_dir / "cache"
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        path_digest = hashlib.sha1(str(Path(source_file).resolve()).encode('utf-8')).hexdigest()[:10]
+        return cache_dir / f"{Path(source_file).name}.{path_digest}{suffix}"
+    
+    def _read_table_cache(self, tables_file: Path) -> Optional[Dict[str, WikiSQLTable]]:
+        """
+        读取表格缓存（mmap文件，各数据段按偏移取零拷贝视图后解码）
+        
+        Args:
+            tables_file: 表格源文件路径
+            
+        Returns:
+            表格字典；缓存不存在或已失效时返回None
+        """
+        cache_file = self._get_cache_path(tables_file, ".tblcache")
+        if not cache_file.exists():
+            return None
+        
+        try:
+            with open(cache_file, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if mm[:len(TABLE_CACHE_MAGIC)] != TABLE_CACHE_MAGIC:
+                    logger.info(f"表格缓存格式不匹配，将重建: {cache_file}")
+                    return None
+                
+                offset = len(TABLE_CACHE_MAGIC)
+                (meta_len,) = struct.unpack_from('<I', mm, offset)
+                offset += 4
+                meta = json.loads(mm[offset:offset + meta_len].decode('utf-8'))
+                base = offset + meta_len + _table_cache_padding(meta_len)
+                
+                if (meta.get("version") != TABLE_CACHE_VERSION or meta.get("byteorder") != sys.byteorder
+                        or meta.get("source") != _file_signature(tables_file)):
+                    logger.info(f"表格缓存已过期，将重建: {cache_file}")
+                    return None
+                
+                with memoryview(mm) as view, _gc_paused():
+                    sections = {}
+                    for name, typecode in TABLE_CACHE_SECTIONS:
+                        start, nbytes = meta["sections"][name]
+                        sections[name] = view[base + start:base + start + nbytes].cast(typecode)
+                    try:
+                        tables = self._decode_table_cache(sections)
+                    finally:
+                        for section in sections.values():
+                            section.release()
+            
+            logger.info(f"从缓存加载 {len(tables)} 个表格: {cache_file}")
+            return tables
+            
+        except Exception as e:
+            logger.warning(f"读取表格缓存失败，将重建: {e}")
+            return None
+    
+    def _decode_table_cache(self, sections: Dict[str, memoryview]) -> Dict[str, WikiSQLTable]:
+        """
+        将缓存数据段解码为表格
+        
+        Args:
+            sections: 段名 -> 类型化的memoryview
+            
+        Returns:
+            表格字典
+        """
+        string_offsets = sections["string_offsets"]
+        string_data = sections["string_data"]
+        value_ints = sections["value_ints"]
+        value_floats = sections["value_floats"]
+        
+        # 不重复值只解码一次，单元格按编号引用
+        values = []
+        for i, kind in enumerate(sections["value_kinds"]):
+            if kind == VALUE_STR or kind == VALUE_JSON:
+                index = value_ints[i]
+                text = str(string_data[string_offsets[index]:string_offsets[index + 1]], 'utf-8')
+                values.append(sys.intern(text) if kind == VALUE_STR else json.loads(text))
+            elif kind == VALUE_INT:
+                values.append(value_ints[i])
+            elif kind == VALUE_FLOAT:
+                values.append(value_floats[i])
+            elif kind == VALUE_BOOL:
+                values.append(bool(value_ints[i]))
+            else:
+                values.append(None)
+        
+        lookup = values.__getitem__
+        directory = sections["tables"]
+        schema = sections["schema"]
+        cells = sections["cells"]
+        row_lengths = sections["row_lengths"]
+        table_cls = CompactWikiSQLTable if self.compact else WikiSQLTable
+        
+        tables = {}
+        for pos in range(0, len(directory), TABLE_CACHE_TABLE_FIELDS):
+            id_code, name_code, num_cols, num_rows, schema_at, cells_at, lengths_at = directory[pos:pos + TABLE_CACHE_TABLE_FIELDS]
+            table_id, name = values[id_code], values[name_code]
+            header = list(map(lookup, schema[schema_at:schema_at + num_cols]))
+            types = list(map(lookup, schema[schema_at + num_cols:schema_at + 2 * num_cols]))
+            
+            if lengths_at < 0:
+                column_codes = [cells[at:at + num_rows] for at in range(cells_at, cells_at + num_cols * num_rows, num_rows)] \
+                    if num_rows else [()] * num_cols
+                if self.compact:
+                    # 紧凑表格直接由全局值编号重新编码，不经过值比较
+                    tables[table_id] = CompactWikiSQLTable.from_encoded(
+                        table_id, header, [_encode_coded_column(codes, values) for codes in column_codes],
+                        types, name, num_rows)
+                    continue
+                # 没有列的表格按行数补回空行
+                columns = [map(lookup, codes) for codes in column_codes]
+                rows = list(map(list, zip(*columns))) if num_cols else [[] for _ in range(num_rows)]
+            else:
+                rows = []
+                at = cells_at
+                for length in row_lengths[lengths_at:lengths_at + num_rows]:
+                    rows.append(list(map(lookup, cells[at:at + length])))
+                    at += length
+            
+            tables[table_id] = table_cls(
+                id=table_id,
+                header=header,
+                rows=rows,
+                types=types,
+                name=name
+            )
+        
+        return tables
+    
+    def _write_table_cache(self, tables_file: Path, tables: Dict[str, WikiSQLTable]):
+        """
+        将表格写入缓存（列数一致的表格按列存储，其余按行存储）
+        
+        Args:
+            tables_file: 表格源文件路径
+            tables: 表格字典
+        """
+        cache_file = self._get_cache_path(tables_file, ".tblcache")
+        arrays = {name: array(typecode) for name, typecode in TABLE_CACHE_SECTIONS}
+        kinds, numbers, reals, string_chunks = [], [], [], []
+        codes: Dict[Any, int] = {}
+        
+        def encode(value) -> int:
+            # 用 (类型, 值) 作为键，避免 1 / 1.0 / True 被合并；其他类型按JSON文本去重
+            value_type = type(value)
+            if value is None or isinstance(value, (str, int, float)):
+                key = (value_type, value)
+            else:
+                key = (VALUE_JSON, json.dumps(value, ensure_ascii=False))
+            code = codes.get(key)
+            if code is not None:
+                return code
+            
+            code = codes[key] = len(kinds)
+            if value_type is str:
+                kind, number, real = VALUE_STR, len(string_chunks), 0.0
+                string_chunks.append(value.encode('utf-8'))
+            elif value_type is float:
+                kind, number, real = VALUE_FLOAT, 0, value
+            elif value_type is bool:
+                kind, number, real = VALUE_BOOL, int(value), 0.0
+            elif value_type is int and -(1 << 63) <= value < (1 << 63):
+                kind, number, real = VALUE_INT, value, 0.0
+            elif value is None:
+                kind, number, real = VALUE_NONE, 0, 0.0
+            else:
+                kind, number, real = VALUE_JSON, len(string_chunks), 0.0
+                string_chunks.append(json.dumps(value, ensure_ascii=False).encode('utf-8'))
+            kinds.append(kind)
+            numbers.append(number)
+            reals.append(real)
+            return code
+        
+        def encode_many(values) -> List[int]:
+            # 已出现过的值批量查表，只有新值逐个编码
+            values = list(values)
+            try:
+                found = list(map(codes.get, zip(map(type, values), values)))
+            except TypeError:
+                return list(map(encode, values))
+            return [encode(value) if code is None else code for code, value in zip(found, values)]
+        
+        directory, schema, cells, row_lengths = arrays["tables"], arrays["schema"], arrays["cells"], arrays["row_lengths"]
+        for table in tables.values():
+            if isinstance(table, CompactWikiSQLTable) and table._columns is not None:
+                # 已按列编码的紧凑表格逐列解码，不经过行
+                num_rows = table.num_rows
+                columns = [table.column(i) for i in range(len(table._columns))]
+                rows = None
+            else:
+                # 紧凑表格每次访问 .rows 都会解码，只取一次
+                rows = table.rows
+                num_rows = len(rows)
+                width = len(table.header)
+                regular = all(len(row) == width for row in rows)
+                columns = (list(zip(*rows)) if rows else [()] * width) if regular else None
+            
+            directory.extend((encode(table.id), encode(table.name), len(table.header), num_rows, len(schema),
+                              len(cells), -1 if columns is not None else len(row_lengths)))
+            schema.extend(map(encode, table.header))
+            schema.extend(map(encode, table.types))
+            if columns is not None:
+                for column in columns:
+                    cells.extend(encode_many(column))
+            else:
+                for row in rows:
+                    row_lengths.append(len(row))
+                    cells.extend(encode_many(row))
+        arrays["value_kinds"] = array('B', kinds)
+        arrays["value_ints"] = array('q', numbers)
+        arrays["value_floats"] = array('d', reals)
+        arrays["string_offsets"] = array('Q', accumulate(map(len, string_chunks), initial=0))
+        arrays["string_data"] = array('B', b"".join(string_chunks))
+        
+        # 段位置相对于数据区起点（元数据之后按8字节对齐）
+        layout = {}
+        body = 0
+        for name, _ in TABLE_CACHE_SECTIONS:
+            nbytes = len(arrays[name]) * arrays[name].itemsize
+            layout[name] = [body, nbytes]
+            body += nbytes + (-nbytes % TABLE_CACHE_ALIGN)
+        
+        meta = json.dumps({
+            "version": TABLE_CACHE_VERSION,
+            "byteorder": sys.byteorder,
+            "source": _file_signature(tables_file),
+            "sections": layout
+        }).encode('utf-8')
+        
+        tmp_file = cache_file.with_name(cache_file.name + ".tmp")
+        try:
+            with open(tmp_file, 'wb') as f:
+                f.write(TABLE_CACHE_MAGIC)
+                f.write(struct.pack('<I', len(meta)))
+                f.write(meta)
+                f.write(b"\0" * _table_cache_padding(len(meta)))
+                for name, _ in TABLE_CACHE_SECTIONS:
+                    data = arrays[name].tobytes()
+                    f.write(data)
+                    f.write(b"\0" * (-len(data) % TABLE_CACHE_ALIGN))
+            os.replace(tmp_file, cache_file)
+            logger.info(f"表格缓存已写入: {cache_file}")
+        except Exception as e:
+            logger.warning(f"写入表格缓存失败: {e}")
+            if tmp_file.exists():
+                tmp_file.unlink()
+    
+    def _get_local_file_path(self, split: str, file_type: str, root: Optional[Path] = None) -> Optional[Path]:
         """
         获取本地WikiSQL文件路径
         
         Args:
             split: 数据分割 ("train", "dev", "test")
             file_type: 文件类型 ("questions" 或 "tables")
+            root: 本地WikiSQL项目路径，默认使用 local_wikisql_path
             
         Returns:
             本地文件路径，如果不存在返回None
         """
-        if not self.local_wikisql_path:
+        if root is None and not self.local_wikisql_path:
             # 尝试默认路径
             default_paths = [Path("WikiSQL"), Path("data"), Path(".")]
             for default_path in default_paths:
                 test_file = default_path / "data" / f"{split}.jsonl" if default_path.name != "data" else default_path / f"{split}.jsonl"
-                if test_file.exists():
+                if _find_existing(test_file):
                     self.local_wikisql_path = default_path
                     break
             
@@ -160,18 +930,20 @@ class WikiSQLDataLoader:
             return None
         
         # 检查可能的路径
+        root = root or self.local_wikisql_path
         possible_paths = [
-            self.local_wikisql_path / "data" / filename,  # WikiSQL/data/dev.jsonl
-            self.local_wikisql_path / filename,           # WikiSQL/dev.jsonl
+            root / "data" / filename,                     # WikiSQL/data/dev.jsonl
+            root / filename,                              # WikiSQL/dev.jsonl
             Path("WikiSQL") / "data" / filename,          # 默认WikiSQL/data/路径
             Path("data") / filename,                      # data/目录
             Path(filename)                                # 当前目录下的文件
         ]
         
         for path in possible_paths:
-            if path.exists():
-                logger.info(f"找到本地文件: {path}")
-                return path
+            found = _find_existing(path)
+            if found:
+                logger.info(f"找到本地文件: {found}")
+                return found
         
         return None
     
@@ -190,65 +962,252 @@ class WikiSQLDataLoader:
         
         return questions_file is not None and tables_file is not None
     
+    def _local_dataset_files(self, split: str) -> Optional[Tuple[Path, Path]]:
+        """
+        查找本地WikiSQL文件（问题文件和表格文件都存在时才使用）
+        
+        data_dir 中的下载目标文件不算本地文件，它们由 download_file 按下载清单校验。
+        查找结果按分割保存，之后只确认文件仍然存在。
+        
+        Args:
+            split: 数据分割
+            
+        Returns:
+            (问题文件路径, 表格文件路径)，没有可用的本地文件时返回None
+        """
+        if split in self._local_files:
+            found = self._local_files[split]
+            if found is None or all(path.exists() for path in found):
+                return found
+        
+        download_targets = {(self.data_dir / f"{split}.jsonl").resolve(),
+                            (self.data_dir / f"{split}.tables.jsonl").resolve()}
+        
+        # 没有设置local_wikisql_path时，除自动探测到的路径外再尝试默认路径
+        roots: List[Optional[Path]] = [None]
+        if not self.local_wikisql_path:
+            roots += [Path("WikiSQL"), Path(".")]
+        
+        found = None
+        for root in roots:
+            questions_file = self._get_local_file_path(split, "questions", root)
+            tables_file = self._get_local_file_path(split, "tables", root)
+            if questions_file is None or tables_file is None:
+                continue
+            if questions_file.resolve() in download_targets or tables_file.resolve() in download_targets:
+                continue
+            logger.info(f"使用本地WikiSQL文件: {questions_file}, {tables_file}")
+            found = (questions_file, tables_file)
+            break
+        
+        self._local_files[split] = found
+        return found
+    
+    def _load_download_manifest(self, manifest_path: Path) -> Dict[str, Dict[str, Any]]:
+        """读取下载清单，不存在或损坏时返回空清单"""
+        if not manifest_path.exists():
+            return {}
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"下载清单无法读取，已忽略: {manifest_path} ({e})")
+            return {}
+    
+    def _record_download(self, filename: str, size: int, sha256: str, replace: bool = False):
+        """
+        记录本次下载的大小和摘要，之后据此校验本地文件
+        
+        Args:
+            filename: 本地文件名
+            size: 文件大小
+            sha256: 文件摘要
+            replace: 覆盖清单中已有的条目（强制重新下载时上游文件可能已更新）；否则只记录清单中没有的文件
+        """
+        with self._manifest_lock:
+            previous = self.download_manifest.get(filename)
+            if previous is not None:
+                if not replace or previous == {"size": size, "sha256": sha256}:
+                    return
+                if previous.get("sha256") != sha256:
+                    logger.warning(f"{filename} 的内容与清单记录不同，上游文件可能已更新，已改用新的摘要: "
+                                   f"{previous.get('sha256')} ({previous.get('size')} 字节) -> {sha256} ({size} 字节)")
+            self.download_manifest[filename] = {"size": size, "sha256": sha256}
+            if self.download_manifest_path is None:
+                return
+            try:
+                tmp_path = self.download_manifest_path.with_name(self.download_manifest_path.name + ".tmp")
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(self.download_manifest, f, indent=2, sort_keys=True)
+                os.replace(tmp_path, self.download_manifest_path)
+            except OSError as e:
+                logger.warning(f"下载清单写入失败: {e}")
+    
+    def _fetch_to_part(self, url: str, part_path: Path, expected_size: Optional[int]) -> Tuple[int, str]:
+        """
+        将URL下载到 .part 文件，已有部分通过Range请求续传
+        
+        Args:
+            url: 下载URL
+            part_path: 未完成文件路径
+            expected_size: 清单中的文件大小（可为None）
+            
+        Returns:
+            (文件大小, SHA-256)
+        """
+        digest = hashlib.sha256()
+        offset = 0
+        if part_path.exists():
+            offset = part_path.stat().st_size
+            if expected_size is not None and offset > expected_size:
+                part_path.unlink()
+                offset = 0
+            elif offset:
+                # 续传时先把已下载部分计入摘要
+                with open(part_path, 'rb') as f:
+                    for block in iter(lambda: f.read(1 << 20), b''):
+                        digest.update(block)
+        
+        # 禁用传输压缩，保证Range偏移与文件字节一致
+        headers = {"Accept-Encoding": "identity"}
+        if offset:
+            headers["Range"] = f"bytes={offset}-"
+        with requests.get(url, stream=True, timeout=DOWNLOAD_TIMEOUT, headers=headers) as response:
+            if response.status_code == 416 and offset:
+                if expected_size is None or offset == expected_size:
+                    # 已完整下载，只差改名
+                    return offset, digest.hexdigest()
+                part_path.unlink()
+                raise IOError(f"续传位置无效 ({offset} 字节)，将重新下载")
+            response.raise_for_status()
+            
+            if offset and response.status_code != 206:
+                # 服务器不支持Range，从头开始
+                logger.info(f"服务器不支持断点续传，重新下载: {url}")
+                digest = hashlib.sha256()
+                offset = 0
+            elif offset:
+                logger.info(f"从 {offset} 字节处续传: {url}")
+            
+            content_length = response.headers.get('content-length')
+            total_size = offset + int(content_length) if content_length else expected_size
+            downloaded = offset
+            chunk_size = DOWNLOAD_MIN_CHUNK
+            next_report = 0.1
+            
+            with open(part_path, 'ab' if offset else 'wb') as f:
+                while True:
+                    start = time.perf_counter()
+                    chunk = response.raw.read(chunk_size)
+                    if not chunk:
+                        break
+                    elapsed = time.perf_counter() - start
+                    f.write(chunk)
+                    digest.update(chunk)
+                    downloaded += len(chunk)
+                    
+                    # 自适应块大小: 读得快则加倍，读得慢则减半
+                    if elapsed < DOWNLOAD_TARGET_READ_SECONDS / 2:
+                        chunk_size = min(chunk_size * 2, DOWNLOAD_MAX_CHUNK)
+                    elif elapsed > DOWNLOAD_TARGET_READ_SECONDS * 2:
+                        chunk_size = max(chunk_size // 2, DOWNLOAD_MIN_CHUNK)
+                    
+                    if total_size and downloaded / total_size >= next_report:
+                        logger.info(f"{part_path.name}: {downloaded / total_size * 100:.0f}% ({downloaded}/{total_size})")
+                        next_report += 0.1
+        
+        if content_length and downloaded != total_size:
+            raise IOError(f"下载不完整: {downloaded}/{total_size} 字节")
+        return downloaded, digest.hexdigest()
+    
+    def _is_verified(self, file_path: Path, filename: str) -> bool:
+        """文件自上次校验后未变化（大小和修改时间相同）且清单条目未变"""
+        verified = self._verified_downloads.get(str(file_path))
+        if verified is None:
+            return False
+        signature, expected = verified
+        try:
+            return expected == self.download_manifest.get(filename) and _file_signature(file_path) == signature
+        except OSError:
+            return False
+    
+    def _remember_verified(self, file_path: Path, filename: str):
+        """记录通过校验的文件签名"""
+        self._verified_downloads[str(file_path)] = (_file_signature(file_path), self.download_manifest.get(filename))
+    
     def download_file(self, url: str, filename: str, force_download: bool = False) -> Path:
         """
-        下载文件，支持多个备用源
+        下载文件，支持多个备用源、断点续传和清单校验
         
         Args:
             url: 下载URL
             filename: 本地文件名
-            force_download: 是否强制重新下载
+            force_download: 是否强制重新下载；不按清单校验（上游文件可能已更新），下载后覆盖清单条目
             
         Returns:
             下载文件的路径
         """
         file_path = self.data_dir / filename
+        part_path = file_path.with_name(filename + DOWNLOAD_PART_SUFFIX)
+        expected = None if force_download else self.download_manifest.get(filename)
+        if force_download and part_path.exists():
+            # 未完成的部分可能属于旧版本，不能续传
+            part_path.unlink()
         
         if file_path.exists() and not force_download:
-            logger.info(f"文件已存在: {file_path}")
-            return file_path
+            if self._is_verified(file_path, filename):
+                return file_path
+            problem = _verify_download(file_path, expected)
+            if problem is None:
+                logger.info(f"文件已存在: {file_path}")
+                self._remember_verified(file_path, filename)
+                return file_path
+            logger.warning(f"本地文件校验失败，重新下载: {file_path} ({problem})")
+        
+        # 找到URL在当前源中对应的键，以便在备用源中定位同一文件
+        url_key = next((key for key, source_url in self.urls.items() if source_url == url), None)
         
         # 尝试所有URL源
         last_error = None
         for source_idx, url_source in enumerate(self.url_sources):
-            # 找到对应的URL
-            actual_url = url
-            for key, source_url in url_source.items():
-                if url.endswith(key + ".jsonl") or key in url:
-                    actual_url = source_url
-                    break
+            actual_url = url_source.get(url_key, url) if url_key else url
             
             logger.info(f"正在下载 (源 {source_idx + 1}/{len(self.url_sources)}): {actual_url}")
             
-            try:
-                response = requests.get(actual_url, stream=True, timeout=30)
-                response.raise_for_status()
-                
-                total_size = int(response.headers.get('content-length', 0))
-                downloaded = 0
-                
-                with open(file_path, 'wb') as f:
-                    for chunk in response.iter_content(chunk_size=8192):
-                        if chunk:
-                            f.write(chunk)
-                            downloaded += len(chunk)
-                            
-                            # 简单的进度显示
-                            if total_size > 0:
-                                progress = (downloaded / total_size) * 100
-                                print(f"\r下载进度: {progress:.1f}%", end="", flush=True)
-                
-                print()  # 换行
-                logger.info(f"下载完成: {file_path}")
-                
-                # 更新当前使用的URL源
-                self.urls = url_source
-                return file_path
-                
-            except Exception as e:
-                last_error = e
-                logger.warning(f"源 {source_idx + 1} 下载失败: {e}")
-                continue
+            for attempt in range(DOWNLOAD_RETRIES):
+                try:
+                    size, sha256 = self._fetch_to_part(actual_url, part_path, expected and expected.get("size"))
+                    
+                    problem = _verify_download(part_path, expected and {"size": expected.get("size")})
+                    if problem is None and expected and expected.get("sha256") and sha256 != expected["sha256"].lower():
+                        problem = "SHA-256校验失败"
+                    if problem:
+                        # 内容错误，续传无意义
+                        part_path.unlink()
+                        raise ValueError(f"{filename} {problem}（上游文件若已更新，用 force_download 重新下载并更新清单）")
+                    
+                    os.replace(part_path, file_path)
+                    self._record_download(filename, size, sha256, replace=force_download)
+                    self._remember_verified(file_path, filename)
+                    logger.info(f"下载完成: {file_path} ({size} 字节)")
+                    
+                    # 更新当前使用的URL源
+                    self.urls = url_source
+                    return file_path
+                    
+                except ValueError as e:
+                    last_error = e
+                    logger.warning(f"源 {source_idx + 1} 下载失败: {e}")
+                    break
+                except Exception as e:
+                    # 连接中断等错误: 保留 .part 文件，下次尝试从断点续传
+                    last_error = e
+                    status = getattr(getattr(e, 'response', None), 'status_code', None)
+                    if status is not None and status < 500:
+                        # 客户端错误（如404）重试无意义
+                        logger.warning(f"源 {source_idx + 1} 下载失败: {e}")
+                        break
+                    logger.warning(f"源 {source_idx + 1} 第 {attempt + 1}/{DOWNLOAD_RETRIES} 次下载中断: {e}")
         
         # 所有源都失败了
         logger.error(f"所有下载源都失败了，最后错误: {last_error}")
@@ -258,93 +1217,304 @@ class WikiSQLDataLoader:
         """
         获取指定分割的数据集（优先使用本地文件）
         
+        没有本地文件时下载到 data_dir: 其中已有的文件按下载清单校验大小和SHA-256，
+        未完成的下载从 .part 文件续传。
+        
         Args:
             split: 数据分割 ("train", "dev", "test")
-            force_download: 是否强制重新下载
+            force_download: 是否强制重新下载（不使用本地文件和清单记录，下载后更新清单）
             
         Returns:
             (问题文件路径, 表格文件路径)
         """
         if split not in ["train", "dev", "test"]:
             raise ValueError(f"无效的split: {split}")
+        if force_download:
+            # 重新下载后文件内容可能变化，get_table 需重新确定表格文件
+            self._table_sources.pop(split, None)
         
-        # 优先检查本地文件
-        if not force_download and self._use_local_files(split):
-            logger.info(f"使用本地WikiSQL文件: {split}")
-            questions_file = self._get_local_file_path(split, "questions")
-            tables_file = self._get_local_file_path(split, "tables")
-            return questions_file, tables_file
-        
-        # 如果没有设置local_wikisql_path，尝试默认路径
-        if not self.local_wikisql_path:
-            default_paths = [Path("WikiSQL"), Path(".")]
-            for default_path in default_paths:
-                temp_loader = WikiSQLDataLoader(local_wikisql_path=str(default_path))
-                if temp_loader._use_local_files(split):
-                    logger.info(f"找到默认路径的WikiSQL文件: {default_path}")
-                    questions_file = temp_loader._get_local_file_path(split, "questions")
-                    tables_file = temp_loader._get_local_file_path(split, "tables")
-                    if questions_file and tables_file:
-                        return questions_file, tables_file
-        
-        # 如果没有本地文件或强制下载，则从网络下载
+        # 优先检查本地文件，其次是已校验且未变化的下载文件
         if not force_download:
-            raise Exception(f"本地WikiSQL数据不可用，请检查WikiSQL/data目录是否包含{split}.jsonl和{split}.tables.jsonl文件")
+            local_files = self._local_dataset_files(split)
+            if local_files is not None:
+                return local_files
+            downloaded = (self.data_dir / f"{split}.jsonl", self.data_dir / f"{split}.tables.jsonl")
+            if all(self._is_verified(path, path.name) for path in downloaded):
+                return downloaded
         
         logger.info(f"从网络下载WikiSQL数据: {split}")
         
-        # 下载问题文件
-        questions_url = self.urls[split]
-        questions_file = self.download_file(
-            questions_url, 
-            f"{split}.jsonl", 
-            force_download
-        )
-        
-        # 下载表格文件
-        tables_url = self.urls[f"{split}_tables"]
-        tables_file = self.download_file(
-            tables_url, 
-            f"{split}.tables.jsonl", 
-            force_download
-        )
+        # 并发下载问题文件和表格文件
+        with ThreadPoolExecutor(max_workers=self.download_workers) as executor:
+            questions_future = executor.submit(self.download_file, self.urls[split], f"{split}.jsonl", force_download)
+            tables_future = executor.submit(self.download_file, self.urls[f"{split}_tables"], f"{split}.tables.jsonl", force_download)
+            questions_file = questions_future.result()
+            tables_file = tables_future.result()
         
         return questions_file, tables_file
     
-    def load_tables(self, tables_file: Path) -> Dict[str, WikiSQLTable]:
+    def _parse_jsonl_parallel(self, path: Path, kind: str, workers: int) -> list:
+        """
+        使用进程池按字节块并行解析JSONL文件
+        
+        Args:
+            path: 文件路径
+            kind: "tables" 或 "questions"
+            workers: 进程数
+            
+        Returns:
+            按文件顺序合并的解析结果；问题ID与串行解析一致（文件行号）
+        """
+        chunks = _split_jsonl_chunks(path, workers * 4)
+        logger.info(f"并行解析 {path}: {len(chunks)} 个块, {workers} 个进程")
+        
+        results = []
+        line_base = 0
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunk_results = executor.map(
+                _parse_jsonl_chunk,
+                [str(path)] * len(chunks),
+                [start for start, _ in chunks],
+                [end for _, end in chunks],
+                [kind] * len(chunks),
+                [self.compact] * len(chunks)
+            )
+            for line_count, items in chunk_results:
+                if kind == "questions":
+                    for question in items:
+                        question.id = str(line_base + int(question.id))
+                if self.compact:
+                    _reshare_compact(items)
+                results.extend(items)
+                line_base += line_count
+        
+        return results
+    
+    def load_tables(self, tables_file: Path, use_cache: bool = True, workers: Optional[int] = None) -> Dict[str, WikiSQLTable]:
         """
         加载表格数据
         
         Args:
             tables_file: 表格文件路径
+            use_cache: 是否使用二进制表格缓存（按源文件路径、大小和修改时间失效）
+            workers: 解析进程数，默认使用 parse_workers
             
         Returns:
             表格ID到WikiSQLTable的映射
         """
+        tables_file = Path(tables_file)
+        workers = workers or self.parse_workers
+        
+        if use_cache:
+            cached = self._read_table_cache(tables_file)
+            if cached is not None:
+                return cached
+        
         logger.info(f"正在加载表格: {tables_file}")
         tables = {}
         
         try:
-            with open(tables_file, 'r', encoding='utf-8') as f:
-                for line_num, line in enumerate(f, 1):
-                    try:
-                        data = json.loads(line.strip())
-                        
-                        table = WikiSQLTable(
-                            id=data['id'],
-                            header=data['header'],
-                            rows=data['rows'],
-                            types=data.get('types', ['text'] * len(data['header'])),
-                            name=data.get('name', f"table_{data['id']}")
-                        )
-                        
-                        tables[table.id] = table
-                        
-                    except json.JSONDecodeError as e:
-                        logger.error(f"JSON解析错误 (行 {line_num}): {e}")
-                    except Exception as e:
-                        logger.error(f"表格加载错误 (行 {line_num}): {e}")
+            # 压缩文件无法按字节块切分，只能串行流式解析
+            if workers > 1 and not is_compressed(tables_file):
+                for table in self._parse_jsonl_parallel(tables_file, "tables", workers):
+                    tables[table.id] = table
+            else:
+                with open_text(tables_file) as f:
+                    for line_num, line in enumerate(f, 1):
+                        table = _parse_table_line(line, line_num, self.compact)
+                        if table is not None:
+                            tables[table.id] = table
+            
+            logger.info(f"成功加载 {len(tables)} 个表格")
+            
+            if use_cache:
+                self._write_table_cache(tables_file, tables)
+            
+            return tables
+            
+        except Exception as e:
+            logger.error(f"文件读取错误: {e}")
+            raise
+    
+    def get_table_index(self, tables_file: Path) -> Dict[str, Tuple[int, int]]:
+        """
+        获取表格文件的字节偏移索引（table_id -> (偏移, 长度)）
+        
+        索引以sidecar文件保存在缓存目录中，源文件变化后自动重建。
+        
+        Args:
+            tables_file: 表格文件路径
+            
+        Returns:
+            表格ID到(字节偏移, 字节长度)的映射
+        """
+        tables_file = Path(tables_file)
+        key = str(tables_file.resolve())
+        if key in self._table_indexes:
+            return self._table_indexes[key]
+        
+        index_file = self._get_cache_path(tables_file, ".idx")
+        signature = _file_signature(tables_file)
+        index = None
+        
+        if index_file.exists():
+            try:
+                with open(index_file, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if data.get("version") == TABLE_INDEX_VERSION and data.get("source") == signature:
+                    index = {table_id: tuple(entry) for table_id, entry in data["index"].items()}
+            except Exception as e:
+                logger.warning(f"读取表格索引失败，将重建: {e}")
+        
+        if index is None:
+            logger.info(f"正在构建表格索引: {tables_file}")
+            index = {}
+            offset = 0
+            with open(tables_file, 'rb') as f:
+                for line in f:
+                    match = TABLE_ID_BYTES_RE.search(line)
+                    if match:
+                        index[match.group(1).decode('utf-8')] = (offset, len(line))
+                    offset += len(line)
+            
+            tmp_file = index_file.with_name(index_file.name + ".tmp")
+            try:
+                with open(tmp_file, 'w', encoding='utf-8') as f:
+                    json.dump({"version": TABLE_INDEX_VERSION, "source": signature, "index": index}, f)
+                os.replace(tmp_file, index_file)
+                logger.info(f"表格索引已写入: {index_file} ({len(index)} 个表格)")
+            except Exception as e:
+                logger.warning(f"写入表格索引失败: {e}")
+        
+        self._table_indexes[key] = index
+        return index
+    
+    def _get_table_mmap(self, tables_file: Path) -> mmap.mmap:
+        """获取表格文件的只读mmap（每个文件只映射一次）"""
+        key = str(Path(tables_file).resolve())
+        if key not in self._table_mmaps:
+            with open(tables_file, 'rb') as f:
+                self._table_mmaps[key] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._table_mmaps[key]
+    
+    def _scan_tables(self, tables_file: Path, wanted: Set[str]) -> Dict[str, WikiSQLTable]:
+        """
+        流式扫描表格文件，只解析id命中的行（用于无法随机访问的压缩文件）
+        
+        Args:
+            tables_file: 表格文件路径
+            wanted: 需要的表格ID
+            
+        Returns:
+            表格ID到WikiSQLTable的映射
+        """
+        wanted = set(wanted)
+        tables: Dict[str, WikiSQLTable] = {}
+        with open_text(tables_file) as f:
+            for line_num, line in enumerate(f, 1):
+                match = TABLE_ID_RE.search(line)
+                if not match or match.group(1) not in wanted:
+                    continue
+                
+                table = _parse_table_line(line, line_num, self.compact)
+                if table is not None:
+                    tables[table.id] = table
+                    wanted.discard(table.id)
+                    if not wanted:
+                        break
+        return tables
+    
+    def read_table(self, tables_file: Path, table_id: str) -> Optional[WikiSQLTable]:
+        """
+        通过字节偏移索引随机读取单个表格（压缩文件退化为流式扫描）
+        
+        Args:
+            tables_file: 表格文件路径
+            table_id: 表格ID
+            
+        Returns:
+            WikiSQLTable，不存在时返回None
+        """
+        if is_compressed(tables_file):
+            return self._scan_tables(tables_file, {table_id}).get(table_id)
+        index = self.get_table_index(tables_file)
+        if table_id not in index:
+            return None
+        return self._read_indexed_table(index, self._get_table_mmap(tables_file), table_id)
+    
+    def _read_indexed_table(self, index: Dict[str, Tuple[int, int]], mm: mmap.mmap,
+                            table_id: str) -> Optional[WikiSQLTable]:
+        """按偏移索引从表格文件的mmap中解析单个表格，不存在时返回None"""
+        entry = index.get(table_id)
+        if entry is None:
+            return None
+        
+        offset, length = entry
+        return _parse_table_line(mm[offset:offset + length].decode('utf-8'), 0, self.compact)
+    
+    def get_table(self, table_id: str, split: str = "dev") -> Optional[WikiSQLTable]:
+        """
+        按需获取单个表格（不扫描、不缓存整个表格文件）
+        
+        每个分割的表格文件路径、偏移索引和mmap只在第一次调用时确定，之后的查找不再经过 download_dataset
+        
+        Args:
+            table_id: 表格ID
+            split: 数据分割
+            
+        Returns:
+            WikiSQLTable，不存在时返回None
+        """
+        source = self._table_sources.get(split)
+        if source is None:
+            _, tables_file = self.download_dataset(split)
+            if is_compressed(tables_file):
+                source = (tables_file, None, None)
+            else:
+                # 空文件无法mmap，也没有可读的表格
+                index = self.get_table_index(tables_file)
+                source = (tables_file, index, self._get_table_mmap(tables_file) if index else None)
+            self._table_sources[split] = source
+        
+        tables_file, index, mm = source
+        if index is None:
+            table = self._scan_tables(tables_file, {table_id}).get(table_id)
+        else:
+            table = self._read_indexed_table(index, mm, table_id)
+        if table is None:
+            logger.warning(f"找不到表格: {table_id}")
+        return table
+    
+    def load_tables_subset(self, tables_file: Path, table_ids: Iterable[str]) -> Dict[str, WikiSQLTable]:
+        """
+        只加载指定ID的表格（通过字节偏移索引随机读取）
+        
+        Args:
+            tables_file: 表格文件路径
+            table_ids: 需要的表格ID
+            
+        Returns:
+            表格ID到WikiSQLTable的映射
+        """
+        wanted: Set[str] = set(table_ids)
+        tables: Dict[str, WikiSQLTable] = {}
+        if not wanted:
+            return tables
+        
+        logger.info(f"正在按需加载 {len(wanted)} 个表格: {tables_file}")
+        
+        try:
+            if is_compressed(tables_file):
+                tables = self._scan_tables(tables_file, wanted)
+            else:
+                for table_id in wanted:
+                    table = self.read_table(tables_file, table_id)
+                    if table is not None:
+                        tables[table_id] = table
             
+            missing = wanted - tables.keys()
+            if missing:
+                logger.warning(f"{len(missing)} 个表格未找到: {sorted(missing)[:5]}")
             logger.info(f"成功加载 {len(tables)} 个表格")
             return tables
             
@@ -352,39 +1522,85 @@ class WikiSQLDataLoader:
             logger.error(f"文件读取错误: {e}")
             raise
     
-    def load_questions(self, questions_file: Path) -> List[WikiSQLQuestion]:
+    def _iter_question_file(self, questions_file: Path, start: int = 0, limit: Optional[int] = None,
+                            start_line: int = 0, end_line: Optional[int] = None) -> Iterator[WikiSQLQuestion]:
+        """
+        从问题文件流式读取问题
+        
+        start_line/end_line 按文件行划定读取范围；start/limit 只计算该范围内成功解析的问题，
+        无法解析的行既不计入跳过数量也不计入返回数量。
+        
+        Args:
+            questions_file: 问题文件路径
+            start: 跳过的问题数量
+            limit: 最多返回的问题数量，None或<=0表示读到范围末尾
+            start_line: 读取范围的起始行（从0开始）
+            end_line: 读取范围的结束行（不含），None表示文件末尾
+            
+        Yields:
+            WikiSQLQuestion
+        """
+        to_skip = start
+        remaining = limit if limit and limit > 0 else None
+        
+        with open_text(questions_file) as f:
+            for line_num, line in islice(enumerate(f, 1), start_line, end_line):
+                if remaining is not None and remaining <= 0:
+                    break
+                
+                question = _parse_question_line(line, line_num, self.compact)
+                if question is None:
+                    continue
+                
+                if to_skip > 0:
+                    to_skip -= 1
+                    continue
+                
+                if remaining is not None:
+                    remaining -= 1
+                yield question
+    
+    def iter_questions(self, split: str = "dev", start: int = 0, limit: Optional[int] = None,
+                       force_download: bool = False) -> Iterator[WikiSQLQuestion]:
+        """
+        流式读取问题，达到数量限制后立即停止读取文件
+        
+        Args:
+            split: 数据分割
+            start: 跳过的问题数量（只计算成功解析的问题；问题ID仍为文件中的行号）
+            limit: 最多返回的问题数量，None或<=0表示读到文件末尾
+            force_download: 是否强制重新下载
+            
+        Yields:
+            WikiSQLQuestion
+        """
+        questions_file, _ = self.download_dataset(split, force_download)
+        yield from self._iter_question_file(questions_file, start, limit)
+    
+    def load_questions(self, questions_file: Path, workers: Optional[int] = None) -> List[WikiSQLQuestion]:
         """
         加载问题数据
         
         Args:
             questions_file: 问题文件路径
+            workers: 解析进程数，默认使用 parse_workers
             
         Returns:
             WikiSQLQuestion列表
         """
         logger.info(f"正在加载问题: {questions_file}")
         questions = []
+        workers = workers or self.parse_workers
         
         try:
-            with open(questions_file, 'r', encoding='utf-8') as f:
-                for line_num, line in enumerate(f, 1):
-                    try:
-                        data = json.loads(line.strip())
-                        
-                        question = WikiSQLQuestion(
-                            id=str(line_num),  # 使用行号作为ID
-                            question=data['question'],
-                            sql=data['sql'],
-                            table_id=data['table_id'],
-                            phase=data.get('phase', 1)
-                        )
-                        
-                        questions.append(question)
-                        
-                    except json.JSONDecodeError as e:
-                        logger.error(f"JSON解析错误 (行 {line_num}): {e}")
-                    except Exception as e:
-                        logger.error(f"问题加载错误 (行 {line_num}): {e}")
+            if workers > 1 and not is_compressed(questions_file):
+                questions = self._parse_jsonl_parallel(Path(questions_file), "questions", workers)
+            else:
+                with open_text(questions_file) as f:
+                    for line_num, line in enumerate(f, 1):
+                        question = _parse_question_line(line, line_num, self.compact)
+                        if question is not None:
+                            questions.append(question)
             
             logger.info(f"成功加载 {len(questions)} 个问题")
             return questions
@@ -393,42 +1609,277 @@ class WikiSQLDataLoader:
             logger.error(f"文件读取错误: {e}")
             raise
     
-    def load_dataset(self, split: str = "dev", limit: Optional[int] = None, force_download: bool = False) -> Tuple[List[WikiSQLQuestion], Dict[str, WikiSQLTable]]:
+    def _read_questions_snapshot(self, questions_file: Path) -> Optional[List[WikiSQLQuestion]]:
+        """
+        读取问题磁盘快照
+        
+        Args:
+            questions_file: 问题源文件路径
+            
+        Returns:
+            问题列表；快照不存在或已失效时返回None
+        """
+        snapshot_file = self._get_cache_path(questions_file, ".qsnap")
+        if not snapshot_file.exists():
+            return None
+        
+        try:
+            with open(snapshot_file, 'rb') as f:
+                with _gc_paused():
+                    snapshot = pickle.load(f)
+                    if snapshot.get("version") != SPLIT_SNAPSHOT_VERSION or snapshot.get("source") != _file_signature(questions_file):
+                        logger.info(f"问题快照已过期，将重建: {snapshot_file}")
+                        return None
+                    
+                    question_cls = CompactWikiSQLQuestion if self.compact else WikiSQLQuestion
+                    questions = [
+                        question_cls(id=qid, question=text, sql=sql, table_id=table_id, phase=phase)
+                        for qid, text, sql, table_id, phase in zip(*snapshot["columns"])
+                    ]
+            
+            logger.info(f"从快照加载 {len(questions)} 个问题: {snapshot_file}")
+            return questions
+            
+        except Exception as e:
+            logger.warning(f"读取问题快照失败，将重建: {e}")
+            return None
+    
+    def _write_questions_snapshot(self, questions_file: Path, questions: List[WikiSQLQuestion]):
         """
-        加载完整数据集
+        将问题列表按列写入磁盘快照
+        
+        Args:
+            questions_file: 问题源文件路径
+            questions: 问题列表
+        """
+        snapshot_file = self._get_cache_path(questions_file, ".qsnap")
+        snapshot = {
+            "version": SPLIT_SNAPSHOT_VERSION,
+            "source": _file_signature(questions_file),
+            "columns": (
+                [q.id for q in questions],
+                [q.question for q in questions],
+                [q.sql for q in questions],
+                [q.table_id for q in questions],
+                [q.phase for q in questions],
+            )
+        }
+        
+        tmp_file = snapshot_file.with_name(snapshot_file.name + ".tmp")
+        try:
+            with open(tmp_file, 'wb') as f:
+                pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_file, snapshot_file)
+            logger.info(f"问题快照已写入: {snapshot_file}")
+        except Exception as e:
+            logger.warning(f"写入问题快照失败: {e}")
+            if tmp_file.exists():
+                tmp_file.unlink()
+    
+    def _load_split(self, split: str, force_download: bool = False) -> Tuple[List[WikiSQLQuestion], Dict[str, WikiSQLTable]]:
+        """
+        解析完整分割并放入分割缓存
+        
+        Args:
+            split: 数据分割
+            force_download: 是否强制重新下载
+            
+        Returns:
+            (完整问题列表, 完整表格字典)
+        """
+        questions_file, tables_file = self.download_dataset(split, force_download)
+        
+        questions = self._read_questions_snapshot(questions_file) if self.split_snapshot else None
+        if questions is None:
+            questions = self.load_questions(questions_file)
+            if self.split_snapshot:
+                self._write_questions_snapshot(questions_file, questions)
+        tables = self.load_tables(tables_file)
+        
+        # 以源文件大小作为内存占用的估算
+        size_estimate = Path(questions_file).stat().st_size + Path(tables_file).stat().st_size
+        self._split_cache[split] = (questions, tables, size_estimate)
+        self._split_cache.move_to_end(split)
+        self._evict_splits(keep=split)
+        
+        return questions, tables
+    
+    def _evict_splits(self, keep: Optional[str] = None):
+        """
+        超出内存预算时按LRU淘汰整个分割
+        
+        Args:
+            keep: 不淘汰的分割（刚加载的分割）
+        """
+        if self.split_cache_budget_bytes is None:
+            return
+        
+        total = sum(entry[2] for entry in self._split_cache.values())
+        for split in list(self._split_cache):
+            if total <= self.split_cache_budget_bytes:
+                break
+            if split == keep:
+                continue
+            total -= self._split_cache.pop(split)[2]
+            logger.info(f"分割缓存超出预算，已淘汰: {split}")
+    
+    def clear_cache(self, split: Optional[str] = None):
+        """
+        清除分割缓存
+        
+        Args:
+            split: 要清除的分割，None表示全部清除
+        """
+        if split is None:
+            self._split_cache.clear()
+        else:
+            self._split_cache.pop(split, None)
+    
+    def load_dataset(self, split: str = "dev", limit: Optional[int] = None, force_download: bool = False,
+                     referenced_tables_only: bool = False, offset: int = 0, shard_index: int = 0,
+                     num_shards: int = 1, shard_mode: str = "contiguous") -> Tuple[List[WikiSQLQuestion], Dict[str, WikiSQLTable]]:
+        """
+        加载数据集
+        
+        完整分割解析一次后保存在分割缓存中，之后任意offset/limit都直接切片返回；
+        分割尚未缓存且指定了limit时，只流式读取所需的行（不写入分割缓存）。
+        offset和limit在两种路径下都按成功解析的问题计数（无法解析的行不计入），
+        因此同一参数无论分割是否已缓存都返回相同的问题。
         
         Args:
             split: 数据分割
             limit: 限制加载的问题数量
             force_download: 是否强制重新下载
+            referenced_tables_only: 只返回被所选问题引用的表格
+            offset: 跳过的问题数量（按成功解析的问题计数，不是文件行号）
+            shard_index: 分片序号（从0开始）
+            num_shards: 分片总数；大于1时只返回 [offset, offset+limit) 窗口中属于该分片的问题
+            shard_mode: 分片方式，"contiguous"（连续区间）或 "hash"（按table_id哈希）
             
         Returns:
             (问题列表, 表格字典)
         """
-        # 检查缓存
-        cache_key = f"{split}_{limit}"
-        if cache_key in self._questions_cache and not force_download:
-            logger.info("使用缓存数据")
-            return self._questions_cache[cache_key], self._tables_cache
+        if num_shards > 1:
+            return self._load_shard(split, limit, force_download, referenced_tables_only, offset,
+                                    shard_index, num_shards, shard_mode)
+        
+        entry = None if force_download else self._split_cache.get(split)
+        end = offset + limit if limit and limit > 0 else None
+        
+        if entry is not None:
+            logger.info(f"使用分割缓存: {split}")
+            self._split_cache.move_to_end(split)
+            all_questions, all_tables, _ = entry
+            questions = all_questions[offset:end]
+            if referenced_tables_only:
+                tables = {q.table_id: all_tables[q.table_id] for q in questions if q.table_id in all_tables}
+            else:
+                tables = all_tables
+            return questions, tables
+        
+        if end is None:
+            self._load_split(split, force_download)
+            return self.load_dataset(split, limit, False, referenced_tables_only, offset)
         
         # 获取数据文件（优先本地，必要时下载）
         questions_file, tables_file = self.download_dataset(split, force_download)
         
-        # 加载数据
-        tables = self.load_tables(tables_file)
-        questions = self.load_questions(questions_file)
+        # 只读取所需的问题行；offset与缓存切片一样按已解析的问题跳过
+        questions = list(self._iter_question_file(questions_file, start=offset, limit=limit))
+        logger.info(f"限制问题数量为: {limit}")
+        
+        # 加载表格
+        if referenced_tables_only:
+            tables = self.load_tables_subset(tables_file, (q.table_id for q in questions))
+        else:
+            tables = self.load_tables(tables_file)
+        
+        return questions, tables
+    
+    def _load_shard(self, split: str, limit: Optional[int], force_download: bool, referenced_tables_only: bool,
+                    offset: int, shard_index: int, num_shards: int,
+                    shard_mode: str) -> Tuple[List[WikiSQLQuestion], Dict[str, WikiSQLTable]]:
+        """
+        加载一个分片；分割未缓存时只流式解析本分片需要的问题，不加载整个分割
         
-        # 应用限制
-        if limit and limit > 0:
-            questions = questions[:limit]
-            logger.info(f"限制问题数量为: {limit}")
+        连续分片的边界与分割是否已缓存无关：指定limit时按窗口内的问题序号划分，
+        否则按文件行号划分 offset 之后的全部行（无法解析的行不计入任何分片）。
         
-        # 缓存结果
-        self._questions_cache[cache_key] = questions
-        self._tables_cache.update(tables)
+        Returns:
+            (本分片问题列表, 表格字典)
+        """
+        validate_shard(shard_index, num_shards, shard_mode)
+        entry = None if force_download else self._split_cache.get(split)
+        has_limit = bool(limit and limit > 0)
+        
+        if entry is not None:
+            self._split_cache.move_to_end(split)
+            all_questions, all_tables, _ = entry
+            window = all_questions[offset:offset + limit] if has_limit else all_questions[offset:]
+            if shard_mode != "contiguous":
+                questions = select_shard(window, shard_index, num_shards, shard_mode)
+            elif has_limit:
+                start, end = contiguous_range(limit, shard_index, num_shards)
+                questions = window[start:end]
+            elif window:
+                questions_file, _ = self.download_dataset(split)
+                first_line = int(all_questions[offset - 1].id) if offset > 0 else 0
+                start_line, end_line = self._shard_line_range(questions_file, first_line, shard_index, num_shards)
+                questions = [q for q in window if start_line < int(q.id) <= end_line]
+            else:
+                questions = []
+            if referenced_tables_only:
+                tables = {q.table_id: all_tables[q.table_id] for q in questions if q.table_id in all_tables}
+            else:
+                tables = all_tables
+        else:
+            questions_file, tables_file = self.download_dataset(split, force_download)
+            
+            if shard_mode != "contiguous":
+                questions = [q for q in self._iter_question_file(questions_file, offset, limit)
+                             if shard_of_table(q.table_id, num_shards) == shard_index]
+            elif has_limit:
+                # 窗口大小已知（按问题计数）时无需读取整个文件
+                start, end = contiguous_range(limit, shard_index, num_shards)
+                questions = list(self._iter_question_file(questions_file, offset + start, end - start)) if end > start else []
+            else:
+                # 窗口为 offset 之后的全部行：先定位窗口起始行，再读取本分片的行区间
+                first_line, skipped = 0, 0
+                if offset > 0:
+                    for question in self._iter_question_file(questions_file, limit=offset):
+                        first_line, skipped = int(question.id), skipped + 1
+                if skipped < offset:
+                    questions = []
+                else:
+                    start_line, end_line = self._shard_line_range(questions_file, first_line, shard_index, num_shards)
+                    questions = list(self._iter_question_file(questions_file, start_line=start_line, end_line=end_line))
+            
+            if referenced_tables_only:
+                tables = self.load_tables_subset(tables_file, (q.table_id for q in questions))
+            else:
+                tables = self.load_tables(tables_file)
         
+        logger.info(f"分片 {shard_index + 1}/{num_shards} ({shard_mode}): {len(questions)} 个问题")
         return questions, tables
     
+    def _shard_line_range(self, questions_file: Path, first_line: int, shard_index: int,
+                          num_shards: int) -> Tuple[int, int]:
+        """
+        连续分片在问题文件中的行区间
+        
+        Args:
+            questions_file: 问题文件路径
+            first_line: 窗口起始行（从0开始）
+            shard_index: 分片序号
+            num_shards: 分片总数
+            
+        Returns:
+            [start_line, end_line) 行区间（从0开始）
+        """
+        total = max(count_lines(questions_file) - first_line, 0)
+        start, end = contiguous_range(total, shard_index, num_shards)
+        return first_line + start, first_line + end
+    
     def get_question_table_pair(self, question: WikiSQLQuestion, tables: Dict[str, WikiSQLTable]) -> Tuple[WikiSQLQuestion, Optional[WikiSQLTable]]:
         """
         获取问题对应的表格
@@ -483,7 +1934,7 @@ def main():
     
     # 加载小量数据进行测试
     print("加载dev数据集 (限制10个问题)...")
-    questions, tables = loader.load_dataset("dev", limit=10)
+    questions, tables = loader.load_dataset("dev", limit=10, referenced_tables_only=True)
     
     # 验证数据
     stats = loader.validate_dataset(questions, tables)
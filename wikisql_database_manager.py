@@ -3,39 +3,395 @@ WikiSQL数据库管理器
 负责根据WikiSQL数据动态创建和管理SQLite数据库表格
 """
 
+import re
+import json
 import sqlite3
+import uuid
+import hashlib
 import logging
-from typing import Dict, List, Optional, Any, Tuple
-from sqlalchemy import create_engine, text, MetaData, Table, Column, String, Integer, Float, Boolean
-from sqlalchemy.engine import Engine
-from langchain_community.utilities import SQLDatabase
+import threading
+from pathlib import Path
+from urllib.parse import quote
+from collections import OrderedDict
+from contextlib import contextmanager
+from itertools import zip_longest
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Any, Set, Tuple
+from sqlalchemy import create_engine, event, text, MetaData, Table, Column, String, Integer, Float, Boolean
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.pool import QueuePool
 
 from wikisql_data_loader import WikiSQLTable, WikiSQLQuestion
 
+if TYPE_CHECKING:
+    # LangChain只在 get_langchain_db() 首次调用时导入，标准流程和Heavy流程不需要它
+    from langchain_community.utilities import SQLDatabase
+
 # 设置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 快速建表配置: 关闭日志和同步、加大页缓存。崩溃时数据库可能损坏，只适用于可重建的数据库
+FAST_BUILD_PRAGMAS = (
+    "PRAGMA journal_mode=OFF",
+    "PRAGMA synchronous=OFF",
+    "PRAGMA cache_size=-262144",  # 256 MiB
+    "PRAGMA temp_store=MEMORY",
+)
+
+# 表格清单: 记录每个WikiSQL表格对应的数据库表名、内容哈希和推断的列类型，
+# 持久化数据库在后续运行中据此复用内容未变的表格（内存数据库不创建清单，也不计算内容哈希）
+MANIFEST_TABLE = "_wikisql_manifest"
+MANIFEST_VERSION = 1
+
+# 官方分割数据库 (WikiSQL/data/{split}.db): 只读且不可变地打开，并启用内存映射
+OFFICIAL_DB_SCHEMA = "official"
+OFFICIAL_DB_MMAP_SIZE = 256 * 1024 * 1024
+
+# 列类型推断: 去空白后的值逐行匹配，与 int() / float() 接受的字符串一致
+# （\d 包含Unicode数字，允许数字间的单个下划线，float另接受inf/infinity/nan）
+INT_LINE_RE = re.compile(r'^[+-]?\d+(?:_\d+)*$', re.MULTILINE)
+FLOAT_LINE_RE = re.compile(
+    r'^[+-]?(?:(?:(?:\d+(?:_\d+)*)?\.\d+(?:_\d+)*|\d+(?:_\d+)*\.?)(?:e[+-]?\d+(?:_\d+)*)?|inf(?:inity)?|nan)$',
+    re.MULTILINE | re.IGNORECASE
+)
+# 数字值超过该比例的列推断为数值类型
+NUMERIC_TYPE_THRESHOLD = 0.8
+
+# SQL中的标识符，用于找出查询引用的待创建表格（清理后的表名只含字母、数字和下划线）
+SQL_IDENTIFIER_RE = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+
+# SQL中的单引号字符串常量
+SQL_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+# FROM/JOIN 关键字，以及其后（逗号分隔）的表名和可选别名
+SQL_FROM_RE = re.compile(r'\b(?:FROM|JOIN)\s+', re.IGNORECASE)
+SQL_TABLE_REF_RE = re.compile(
+    r'("?)([A-Za-z_][A-Za-z0-9_]*)\1'
+    r'(?:\s+(?:AS\s+)?(?!(?:WHERE|JOIN|INNER|LEFT|RIGHT|FULL|CROSS|NATURAL|ON|USING|GROUP|ORDER|LIMIT|UNION|HAVING)\b)'
+    r'("?)([A-Za-z_][A-Za-z0-9_]*)\3)?',
+    re.IGNORECASE
+)
+SQL_LIST_SEPARATOR_RE = re.compile(r'\s*,\s*')
+# 左侧为带表名/别名限定的列的比较: 分组1为限定名，分组2为比较符及之前的部分，分组3为字符串常量
+SQL_QUALIFIED_COMPARISON_RE = re.compile(
+    r'("?[A-Za-z_][A-Za-z0-9_]*"?)(\s*\.\s*(?:"[^"]+"|[A-Za-z_][A-Za-z0-9_]*)\s*'
+    r'(?:==?|!=|<>|<=|>=|<|>|\bLIKE\b|\bGLOB\b)\s*)(\'(?:[^\']|\'\')*\')',
+    re.IGNORECASE
+)
+
+
+def lowercase_sql_strings(query: str, is_official: Callable[[str], bool]) -> str:
+    """
+    把与官方数据库表格的列比较的字符串常量转为小写
+
+    官方数据库中的字符串值均为小写，官方评估也把条件值转为小写后比较。查询引用的表格都来自官方数据库时，
+    所有单引号字符串常量都转为小写；同时引用了JSON建的表格时，只转换左侧列以官方表名或其别名限定的比较
+    （不带限定的列无法确定所属表格，保持原样）。双引号标识符不做修改。
+
+    Args:
+        query: SQL查询
+        is_official: 判断表名是否指向官方数据库表格
+
+    Returns:
+        转换后的SQL
+    """
+    # 字符串常量中的 FROM/JOIN 不是表引用
+    skeleton = SQL_STRING_RE.sub("''", query)
+    qualifiers: Dict[str, bool] = {}
+    for keyword in SQL_FROM_RE.finditer(skeleton):
+        pos = keyword.end()
+        while True:
+            match = SQL_TABLE_REF_RE.match(skeleton, pos)
+            if match is None:
+                break
+            official = is_official(match.group(2))
+            qualifiers[match.group(2).lower()] = official
+            if match.group(4):
+                qualifiers[match.group(4).lower()] = official
+            separator = SQL_LIST_SEPARATOR_RE.match(skeleton, match.end())
+            if separator is None:
+                break
+            pos = separator.end()
+    
+    if not any(qualifiers.values()):
+        return query
+    if all(qualifiers.values()):
+        return SQL_STRING_RE.sub(lambda m: m.group(0).lower(), query)
+    
+    def lower_if_official(match) -> str:
+        if qualifiers.get(match.group(1).strip('"').lower()):
+            return match.group(1) + match.group(2) + match.group(3).lower()
+        return match.group(0)
+    return SQL_QUALIFIED_COMPARISON_RE.sub(lower_if_official, query)
+
+
+class _ReadWriteLock:
+    """读写锁: 多个读者可同时持有；写者独占、同一线程可重入，且有写者等待时新读者让行"""
+    
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writer: Optional[int] = None
+        self._writer_depth = 0
+        self._writers_waiting = 0
+    
+    @contextmanager
+    def read(self):
+        me = threading.get_ident()
+        with self._cond:
+            if self._writer == me:
+                # 写者线程内的读取直接放行
+                nested = True
+            else:
+                nested = False
+                while self._writer is not None or self._writers_waiting:
+                    self._cond.wait()
+                self._readers += 1
+        try:
+            yield
+        finally:
+            if not nested:
+                with self._cond:
+                    self._readers -= 1
+                    if not self._readers:
+                        self._cond.notify_all()
+    
+    @contextmanager
+    def write(self):
+        me = threading.get_ident()
+        with self._cond:
+            if self._writer == me:
+                self._writer_depth += 1
+            else:
+                self._writers_waiting += 1
+                while self._writer is not None or self._readers:
+                    self._cond.wait()
+                self._writers_waiting -= 1
+                self._writer, self._writer_depth = me, 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer_depth -= 1
+                if not self._writer_depth:
+                    self._writer = None
+                    self._cond.notify_all()
+
+
 class WikiSQLDatabaseManager:
     """WikiSQL数据库管理器"""
     
-    def __init__(self, db_path: str = ":memory:"):
+    def __init__(self, db_path: str = ":memory:", fast_build: bool = False, max_tables: Optional[int] = None,
+                 memory_budget_mb: Optional[float] = None, readonly: bool = False, attach_db: Optional[str] = None,
+                 concurrent: bool = False, pool_size: int = 8):
         """
         初始化数据库管理器
         
         Args:
             db_path: 数据库路径，默认使用内存数据库
+            fast_build: 是否对每个连接启用快速建表PRAGMA配置（FAST_BUILD_PRAGMAS）
+            max_tables: 最多保留的已创建表格数，超出时按LRU删除；None表示不限制
+            memory_budget_mb: 数据库已用页面的大小上限，超出时按LRU删除表格；None表示不限制
+            readonly: 以只读、不可变方式打开 db_path（官方分割数据库），表格直接映射到已有的
+                table_<id> 表，不执行任何建表/插入
+            attach_db: 只读附加的官方分割数据库；其中已有的表格直接使用，缺少的表格仍在 db_path 中创建
+            concurrent: 多线程模式。内存数据库改用共享缓存URI（所有连接看到同一个数据库），
+                连接可跨线程使用并由连接池管理，每个线程复用自己的读连接，execute_query 可并行执行
+            pool_size: 多线程模式下连接池大小，一般设为工作线程数
+        
+        注意: 官方数据库（及 wikisql_compile_split.py 的编译结果）中的字符串值均为小写，
+        execute_query 在查询引用其中的表格时把与其列比较的字符串常量转为小写（见 lowercase_sql_strings）；
+        LangChain SQLDatabase 的查询不做此转换。建表、删表与查询之间由读写锁协调，
+        只有经 execute_query 的查询参与并行；LangChain SQLDatabase 的查询不受锁保护。
         """
         self.db_path = db_path
-        self.engine = create_engine(f"sqlite:///{db_path}")
+        self.fast_build = fast_build and not readonly
+        self.max_tables = max_tables
+        self.memory_budget_bytes = int(memory_budget_mb * 1024 * 1024) if memory_budget_mb else None
+        self.readonly = readonly
+        self.attach_db = attach_db
+        self.concurrent = concurrent
+        # 只有文件数据库能在后续运行中复用表格，才需要表格清单和内容哈希
+        self._persistent = not readonly and db_path not in (":memory:", "")
+        
+        engine_args: Dict[str, Any] = {}
+        connect_args: Dict[str, Any] = {"uri": True} if attach_db else {}
+        if concurrent:
+            # 连接由连接池在线程间分配；线程自己的读连接之外，临时连接可以溢出
+            connect_args["check_same_thread"] = False
+            engine_args.update(poolclass=QueuePool, pool_size=pool_size, max_overflow=pool_size)
+        
+        if readonly:
+            url = f"sqlite:///{self._readonly_uri(db_path)}&uri=true"
+        elif concurrent and db_path == ":memory:":
+            # 普通 :memory: 每个连接各有一个数据库；命名的共享缓存内存数据库对本进程所有连接可见
+            url = f"sqlite:///file:wikisql_{uuid.uuid4().hex}?mode=memory&cache=shared&uri=true"
+        else:
+            url = f"sqlite:///{db_path}"
+        self.engine = create_engine(url, connect_args=connect_args, **engine_args)
+        if readonly:
+            event.listen(self.engine, "connect", self._apply_mmap)
+        elif attach_db:
+            event.listen(self.engine, "connect", self._attach_official_db)
+        if self.fast_build:
+            event.listen(self.engine, "connect", self._apply_fast_build_pragmas)
+        if self.memory_budget_bytes and not readonly:
+            # 删除表格后立即释放页面（只对新建的数据库生效）
+            event.listen(self.engine, "connect", self._apply_auto_vacuum)
         self.metadata = MetaData()
         self.created_tables: Dict[str, str] = {}  # table_id -> table_name mapping
         
-        # 创建LangChain SQL数据库对象
-        self.sql_db = SQLDatabase(self.engine)
+        # 共享缓存内存数据库在最后一个连接关闭时销毁，保留一个连接直到 close()
+        self._keeper = self.engine.raw_connection() if concurrent and db_path == ":memory:" and not readonly else None
+        # 每个线程复用的读连接: 线程 -> 连接
+        self._thread_connections: Dict[threading.Thread, Connection] = {}
+        self._connections_lock = threading.Lock()
+        # 建表/删表（写）与 execute_query（读）之间的读写锁；表格记录的修改由 _state_lock 保护
+        self._db_lock = _ReadWriteLock()
+        self._state_lock = threading.RLock()
+        # 正在被查询使用的表格: table_name -> 使用中的查询数；LRU淘汰跳过这些表格
+        self._pinned: Dict[str, int] = {}
+        
+        # 官方数据库中已有的表名（只读模式为主库，附加模式为附加库）
+        self._official_tables: Set[str] = self._load_official_tables() if (readonly or attach_db) else set()
+        
+        # 列类型推断结果: content_hash -> 列类型列表（由清单预填充）
+        self._column_type_cache: Dict[str, List[str]] = {}
+        # 表格清单: table_id -> (table_name, content_hash)
+        self._manifest: Dict[str, Tuple[str, str]] = self._load_manifest() if self._persistent else {}
+        # 数据库表名 -> 当前占用该表名的table_id（已创建或清单中的表格）
+        self._table_owners: Dict[str, str] = {name: table_id for table_id, (name, _) in self._manifest.items()}
+        
+        # 延迟创建: 已登记但尚未创建的表格，首次被查询或 ensure_table 时才建表
+        self._pending: Dict[str, Tuple[WikiSQLTable, bool]] = {}  # table_id -> (table, use_col_format)
+        self._pending_names: Dict[str, str] = {}  # table_name -> table_id
+        # 未登记的table_id由此回调按需获取表格
+        self.table_resolver: Optional[Callable[[str], Optional[WikiSQLTable]]] = None
+        
+        # 已创建表格的使用顺序: table_name -> (table_id, 表格对象或None, use_col_format)
+        # 启用淘汰时被删除的表格重新登记为延迟创建；未设置table_resolver时为此保留表格对象
+        self._table_lru: "OrderedDict[str, Tuple[str, Optional[WikiSQLTable], bool]]" = OrderedDict()
+        # 每个已登记或已创建表格的列名格式: table_id -> use_col_format
+        # 表格对象随淘汰丢弃后，经 table_resolver 重建时仍使用最初的列名，已写好的SQL继续可用
+        self._col_formats: Dict[str, bool] = {}
+        self.table_stats = {"hits": 0, "misses": 0, "evictions": 0}
+        
+        # LangChain SQL数据库对象在首次 get_langchain_db() 时创建（导入和反射表结构都有开销）
+        self._sql_db: Optional["SQLDatabase"] = None
         
         logger.info(f"数据库管理器初始化完成: {db_path}")
     
+    @staticmethod
+    def _apply_fast_build_pragmas(dbapi_connection, connection_record):
+        """连接建立时应用快速建表PRAGMA"""
+        cursor = dbapi_connection.cursor()
+        for pragma in FAST_BUILD_PRAGMAS:
+            cursor.execute(pragma)
+        cursor.close()
+    
+    @staticmethod
+    def _readonly_uri(path: str) -> str:
+        """只读、不可变的SQLite URI（immutable=1 让SQLite跳过文件锁和变更检测）"""
+        return f"file:{quote(str(Path(path).resolve()))}?mode=ro&immutable=1"
+    
+    @staticmethod
+    def _apply_mmap(dbapi_connection, connection_record):
+        """连接建立时启用内存映射读取"""
+        dbapi_connection.execute(f"PRAGMA mmap_size={OFFICIAL_DB_MMAP_SIZE}")
+    
+    def _attach_official_db(self, dbapi_connection, connection_record):
+        """连接建立时只读附加官方数据库"""
+        dbapi_connection.execute(f"ATTACH DATABASE ? AS {OFFICIAL_DB_SCHEMA}", (self._readonly_uri(self.attach_db),))
+        dbapi_connection.execute(f"PRAGMA {OFFICIAL_DB_SCHEMA}.mmap_size={OFFICIAL_DB_MMAP_SIZE}")
+    
+    def _load_official_tables(self) -> Set[str]:
+        """读取官方数据库中的表名"""
+        schema = "main" if self.readonly else OFFICIAL_DB_SCHEMA
+        with self.engine.connect() as conn:
+            names = {row[0] for row in conn.execute(text(f"SELECT name FROM {schema}.sqlite_master WHERE type='table'"))}
+        logger.info(f"官方数据库中有 {len(names)} 个表格: {self.db_path if self.readonly else self.attach_db}")
+        return names
+    
+    @staticmethod
+    def official_table_name(table_id: str) -> str:
+        """官方数据库中的表名（与 WikiSQL/lib/dbengine.py 一致）"""
+        return 'table_{}'.format(table_id.replace('-', '_'))
+    
+    def is_official_table(self, table_name: str) -> bool:
+        """表名是否指向官方数据库中的表格（字符串值为小写）"""
+        return table_name.lower() in self._official_tables and table_name.lower() not in self._table_owners
+    
+    def uses_official_tables(self, query: str) -> bool:
+        """查询是否引用了官方数据库中的表格"""
+        if not self._official_tables:
+            return False
+        return any(self.is_official_table(name) for name in set(SQL_IDENTIFIER_RE.findall(query)))
+    
+    def _map_official_tables(self, wikisql_tables: List[WikiSQLTable], use_col_format: bool) -> Tuple[Dict[str, str], List[WikiSQLTable]]:
+        """
+        将官方数据库中已有的表格直接映射到表名
+        
+        Returns:
+            (table_id -> 官方表名, 官方数据库中没有、仍需创建的表格)
+        """
+        if not self._official_tables or not use_col_format:
+            # 官方表使用col0, col1...列名，原始列名格式只能新建
+            return {}, wikisql_tables
+        
+        mapped, missing = {}, []
+        for wikisql_table in wikisql_tables:
+            table_name = self.official_table_name(wikisql_table.id)
+            if table_name in self._official_tables:
+                mapped[wikisql_table.id] = table_name
+            else:
+                missing.append(wikisql_table)
+        return mapped, missing
+    
+    @staticmethod
+    def _apply_auto_vacuum(dbapi_connection, connection_record):
+        """连接建立时启用auto_vacuum"""
+        dbapi_connection.execute("PRAGMA auto_vacuum=FULL")
+    
+    @property
+    def _lru_enabled(self) -> bool:
+        return bool(self.max_tables or self.memory_budget_bytes)
+    
+    def _load_manifest(self) -> Dict[str, Tuple[str, str]]:
+        """
+        创建（如不存在）并读取表格清单，忽略数据库中已不存在的表格
+        
+        Returns:
+            table_id -> (table_name, content_hash)
+        """
+        with self.engine.connect() as conn:
+            conn.execute(text(
+                f'CREATE TABLE IF NOT EXISTS "{MANIFEST_TABLE}" ('
+                'table_id TEXT PRIMARY KEY, table_name TEXT NOT NULL, '
+                'content_hash TEXT NOT NULL, column_types TEXT NOT NULL)'
+            ))
+            conn.commit()
+            existing = {row[0] for row in conn.execute(text("SELECT name FROM sqlite_master WHERE type='table'"))}
+            rows = conn.execute(text(
+                f'SELECT table_id, table_name, content_hash, column_types FROM "{MANIFEST_TABLE}"'
+            )).fetchall()
+        
+        manifest = {}
+        for table_id, table_name, content_hash, column_types in rows:
+            self._column_type_cache[content_hash] = json.loads(column_types)
+            if table_name in existing:
+                manifest[table_id] = (table_name, content_hash)
+        if manifest:
+            logger.info(f"表格清单中有 {len(manifest)} 个可复用的表格")
+        return manifest
+    
+    @staticmethod
+    def _table_content_hash(wikisql_table: WikiSQLTable, use_col_format: bool) -> str:
+        """表格内容哈希（表头、类型、数据行及列名格式）"""
+        payload = json.dumps(
+            [MANIFEST_VERSION, use_col_format, wikisql_table.header, wikisql_table.types, wikisql_table.rows],
+            ensure_ascii=False, separators=(',', ':'), default=str
+        )
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+    
     def _map_wikisql_type_to_sql(self, wikisql_type: str) -> str:
         """
         将WikiSQL数据类型映射到SQL数据类型
@@ -54,56 +410,67 @@ class WikiSQLDatabaseManager:
         }
         return type_mapping.get(wikisql_type.lower(), 'TEXT')
     
-    def _infer_column_type(self, values: List[str], declared_type: str = "text") -> str:
+    @staticmethod
+    def _count_numeric(values: List[Any]) -> Tuple[int, int]:
         """
-        推断列的数据类型
+        统计一列中能被 int() 解析的值和只能被 float() 解析的值的个数
+        
+        把整列去空白后以换行拼接，用预编译的多行正则一次扫描完成分类，不再逐个值try/except；
+        含换行的值会破坏逐行匹配，这样的列退回逐个值解析。
         
         Args:
-            values: 列的所有值
-            declared_type: 声明的类型
+            values: 列的所有值（None和空字符串不计）
             
         Returns:
-            SQLite数据类型
+            (整数个数, 浮点数个数)
         """
-        if not values:
-            return "TEXT"
+        stripped = [str(value).strip() for value in values if value is not None and value != ""]
+        stripped = [value for value in stripped if value]
+        if not stripped:
+            return 0, 0
         
-        # 如果声明类型是real，直接返回REAL
-        if declared_type.lower() == "real":
-            return "REAL"
-        
-        # 统计不同类型的值
-        int_count = 0
-        float_count = 0
-        total_count = len(values)
+        joined = "\n".join(stripped)
+        if joined.count("\n") == len(stripped) - 1:
+            int_count = len(INT_LINE_RE.findall(joined))
+            return int_count, len(FLOAT_LINE_RE.findall(joined)) - int_count
         
-        for value in values:
-            if value is None or value == "":
-                continue
-                
-            str_value = str(value).strip()
-            if not str_value:
-                continue
-            
-            # 尝试转换为整数
+        int_count = float_count = 0
+        for value in stripped:
             try:
-                int(str_value)
+                int(value)
                 int_count += 1
                 continue
             except ValueError:
                 pass
-            
-            # 尝试转换为浮点数
             try:
-                float(str_value)
+                float(value)
                 float_count += 1
-                continue
             except ValueError:
                 pass
+        return int_count, float_count
+    
+    def _infer_column_type(self, values: List[str], declared_type: str = "text") -> str:
+        """
+        推断列的数据类型
+        
+        Args:
+            values: 列的所有值
+            declared_type: 声明的类型
+            
+        Returns:
+            SQLite数据类型
+        """
+        if not values:
+            return "TEXT"
+        
+        # 如果声明类型是real，直接返回REAL
+        if declared_type.lower() == "real":
+            return "REAL"
         
         # 根据统计结果决定类型
+        int_count, float_count = self._count_numeric(values)
         numeric_count = int_count + float_count
-        if numeric_count > total_count * 0.8:  # 80%以上是数字
+        if numeric_count > len(values) * NUMERIC_TYPE_THRESHOLD:  # 80%以上是数字
             if float_count > 0:
                 return "REAL"
             else:
@@ -111,6 +478,29 @@ class WikiSQLDatabaseManager:
         
         return "TEXT"
     
+    def _infer_column_types(self, wikisql_table: WikiSQLTable, rows: List[List[Any]],
+                            num_columns: int) -> List[str]:
+        """
+        一次推断整张表所有列的类型（按列转置后逐列批量分类）
+        
+        Args:
+            wikisql_table: WikiSQL表格对象（提供声明类型）
+            rows: 数据行，可能长短不一
+            num_columns: 列数
+            
+        Returns:
+            各列的SQLite数据类型
+        """
+        # 较短的行缺失的单元格按None处理，与逐行取值一致
+        columns = list(zip_longest(*rows)) if rows else []
+        missing = (None,) * len(rows)
+        column_types = []
+        for i in range(num_columns):
+            declared_type = wikisql_table.types[i] if i < len(wikisql_table.types) else "text"
+            column_values = columns[i] if i < len(columns) else missing
+            column_types.append(self._infer_column_type(column_values, declared_type))
+        return column_types
+    
     def _sanitize_table_name(self, table_id: str) -> str:
         """
         清理表格名称，确保符合SQL标准
@@ -170,126 +560,437 @@ class WikiSQLDatabaseManager:
         
         return clean_name
     
-    def create_table_from_wikisql(self, wikisql_table: WikiSQLTable, use_col_format: bool = True) -> str:
+    def _prepare_table(self, wikisql_table: WikiSQLTable, use_col_format: bool = True,
+                       content_hash: Optional[str] = None) -> Tuple[str, List[str], List[str], str, List[List[Any]]]:
         """
-        根据WikiSQL表格创建数据库表格
+        生成建表所需的表名、列名、列类型、CREATE语句和数据行
         
         Args:
             wikisql_table: WikiSQL表格对象
+            use_col_format: 是否使用col0, col1...列名
+            content_hash: 表格内容哈希，提供时按哈希缓存列类型推断结果
             
         Returns:
-            创建的表格名称
+            (表格名称, 列名列表, 列类型列表, CREATE TABLE语句, 数据行)
         """
         table_name = self._sanitize_table_name(wikisql_table.id)
         
-        # 如果表格已存在，先删除
-        if table_name in self.created_tables.values():
-            self.drop_table(table_name)
+        # 根据参数决定使用哪种列名格式
+        if use_col_format:
+            # 使用col0, col1, col2...格式，与官方WikiSQL保持一致
+            clean_headers = [f"col{i}" for i in range(len(wikisql_table.header))]
+            logger.debug(f"使用col格式列名: {clean_headers}")
+        else:
+            # 使用清理后的原始列名
+            clean_headers = [self._sanitize_column_name(header) for header in wikisql_table.header]
         
-        logger.info(f"正在创建表格: {table_name} (原ID: {wikisql_table.id})")
+        # 检查重复列名
+        seen_headers = set()
+        for i, header in enumerate(clean_headers):
+            original_header = header
+            counter = 1
+            while header in seen_headers:
+                header = f"{original_header}_{counter}"
+                counter += 1
+            clean_headers[i] = header
+            seen_headers.add(header)
         
-        try:
-            # 根据参数决定使用哪种列名格式
-            if use_col_format:
-                # 使用col0, col1, col2...格式，与官方WikiSQL保持一致
-                clean_headers = [f"col{i}" for i in range(len(wikisql_table.header))]
-                logger.info(f"使用col格式列名: {clean_headers}")
-            else:
-                # 使用清理后的原始列名
-                clean_headers = [self._sanitize_column_name(header) for header in wikisql_table.header]
-            
-            # 检查重复列名
-            seen_headers = set()
-            for i, header in enumerate(clean_headers):
-                original_header = header
-                counter = 1
-                while header in seen_headers:
-                    header = f"{original_header}_{counter}"
-                    counter += 1
-                clean_headers[i] = header
-                seen_headers.add(header)
-            
-            # 推断列类型
-            column_types = []
-            for i, header in enumerate(clean_headers):
-                # 获取该列的所有值
-                column_values = [row[i] if i < len(row) else None for row in wikisql_table.rows]
-                declared_type = wikisql_table.types[i] if i < len(wikisql_table.types) else "text"
-                column_type = self._infer_column_type(column_values, declared_type)
-                column_types.append(column_type)
-            
-            # 构建CREATE TABLE语句
-            column_definitions = []
-            for header, col_type in zip(clean_headers, column_types):
-                column_definitions.append(f'"{header}" {col_type}')
+        # 紧凑表格的rows每次访问都会解码，只取一次
+        rows = wikisql_table.rows
+        
+        # 推断列类型；内容相同的表格（重建、淘汰后重新创建）直接使用缓存的结果
+        column_types = self._column_type_cache.get(content_hash) if content_hash else None
+        if column_types is None:
+            column_types = self._infer_column_types(wikisql_table, rows, len(clean_headers))
+            if content_hash:
+                self._column_type_cache[content_hash] = column_types
+        
+        # 构建CREATE TABLE语句
+        column_definitions = []
+        for header, col_type in zip(clean_headers, column_types):
+            column_definitions.append(f'"{header}" {col_type}')
+        
+        create_sql = f'CREATE TABLE "{table_name}" ({", ".join(column_definitions)})'
+        return table_name, clean_headers, column_types, create_sql, rows
+    
+    def _build_tables(self, wikisql_tables: List[WikiSQLTable], use_col_format: bool = True,
+                      skip_failed: bool = False) -> Dict[str, str]:
+        """
+        在一个原生DBAPI连接、一个事务内创建表格并批量插入数据
+        
+        文件数据库中，清单中内容哈希相同的表格直接复用；新建的表格与清单记录在同一事务内写入。
+        失败的表格通过DROP TABLE清理而不是回滚（快速建表配置关闭了回滚日志，ROLLBACK不可用）。
+        建表期间独占数据库写锁。
+        
+        Args:
+            wikisql_tables: WikiSQL表格列表
+            use_col_format: 是否使用col0, col1...列名
+            skip_failed: 为True时跳过失败的表格，否则在提交已完成的表格后抛出异常
             
-            create_sql = f'''
-                CREATE TABLE "{table_name}" (
-                    {', '.join(column_definitions)}
-                )
-            '''
+        Returns:
+            table_id -> table_name 映射
+        """
+        with self._state_lock, self._db_lock.write():
+            return self._build_tables_locked(wikisql_tables, use_col_format, skip_failed)
+    
+    def _build_tables_locked(self, wikisql_tables: List[WikiSQLTable], use_col_format: bool,
+                             skip_failed: bool) -> Dict[str, str]:
+        """_build_tables 的实现，调用方持有 _state_lock 和写锁"""
+        # 官方数据库中已有的表格不需要任何建表工作
+        official, wikisql_tables = self._map_official_tables(wikisql_tables, use_col_format)
+        if official:
+            self.created_tables.update(official)
+            for table_id, table_name in official.items():
+                self._pending.pop(table_id, None)
+                self._pending_names.pop(table_name, None)
+        if self.readonly:
+            if wikisql_tables:
+                missing = [t.id for t in wikisql_tables]
+                logger.error(f"只读数据库中缺少 {len(missing)} 个表格: {missing[:10]}")
+                if not skip_failed:
+                    raise ValueError(f"只读数据库中没有表格: {missing[0]}")
+            return official
+        if not wikisql_tables:
+            return official
+        
+        created: Dict[str, str] = {}
+        built: Dict[str, Tuple[str, str]] = {}
+        failed: List[Tuple[str, str]] = []
+        displaced: List[str] = []  # 表名被本次新建表格占用的其他table_id
+        error = None
+        raw_conn = self.engine.raw_connection()
+        try:
+            cursor = raw_conn.cursor()
+            cursor.execute("BEGIN")
+            for wikisql_table in wikisql_tables:
+                table_name = None
+                try:
+                    content_hash = None
+                    if self._persistent:
+                        content_hash = self._table_content_hash(wikisql_table, use_col_format)
+                        entry = self._manifest.get(wikisql_table.id)
+                        if entry is not None and entry[1] == content_hash:
+                            # 内容未变，复用已有表格
+                            created[wikisql_table.id] = entry[0]
+                            continue
+                    
+                    table_name, headers, column_types, create_sql, rows = self._prepare_table(
+                        wikisql_table, use_col_format, content_hash)
+                    # 同名表格（上次运行留下的或本次重复创建的）先删除
+                    cursor.execute(f'DROP TABLE IF EXISTS "{table_name}"')
+                    owner = self._table_owners.get(table_name)
+                    if owner is not None and owner != wikisql_table.id:
+                        if self._persistent:
+                            cursor.execute(f'DELETE FROM "{MANIFEST_TABLE}" WHERE table_id = ?', (owner,))
+                        displaced.append(owner)
+                    cursor.execute(create_sql)
+                    self._bulk_insert(cursor, table_name, headers, rows)
+                    if self._persistent:
+                        cursor.execute(
+                            f'INSERT OR REPLACE INTO "{MANIFEST_TABLE}" (table_id, table_name, content_hash, column_types) '
+                            'VALUES (?, ?, ?, ?)',
+                            (wikisql_table.id, table_name, content_hash, json.dumps(column_types))
+                        )
+                    created[wikisql_table.id] = table_name
+                    built[wikisql_table.id] = (table_name, content_hash)
+                    logger.debug(f"表格创建成功: {table_name} ({len(rows)} 行)")
+                except Exception as e:
+                    logger.error(f"创建表格 {wikisql_table.id} 失败: {e}")
+                    if table_name:
+                        cursor.execute(f'DROP TABLE IF EXISTS "{table_name}"')
+                        if self._persistent:
+                            cursor.execute(f'DELETE FROM "{MANIFEST_TABLE}" WHERE table_id = ?', (wikisql_table.id,))
+                        failed.append((wikisql_table.id, table_name))
+                    if not skip_failed:
+                        error = e
+                        break
+            raw_conn.commit()
+        finally:
+            raw_conn.close()
+        
+        # 提交后再更新记录
+        for table_id in displaced:
+            self.created_tables.pop(table_id, None)
+            self._manifest.pop(table_id, None)
+        for table_id, table_name in failed:
+            self.created_tables.pop(table_id, None)
+            self._manifest.pop(table_id, None)
+            self._table_owners.pop(table_name, None)
+            self._table_lru.pop(table_name, None)
+        if self._persistent:
+            self._manifest.update(built)
+        self.created_tables.update(created)
+        
+        keep_object = self._lru_enabled and self.table_resolver is None
+        for wikisql_table in wikisql_tables:
+            table_name = created.get(wikisql_table.id)
+            if table_name is None:
+                continue
+            self._table_owners[table_name] = wikisql_table.id
+            self._col_formats[wikisql_table.id] = use_col_format
+            self._pending.pop(wikisql_table.id, None)
+            if self._pending_names.get(table_name) == wikisql_table.id:
+                del self._pending_names[table_name]
+            self._table_lru[table_name] = (wikisql_table.id, wikisql_table if keep_object else None, use_col_format)
+            self._table_lru.move_to_end(table_name)
+        
+        if self._lru_enabled:
+            # 本批表格都不淘汰（批量超过 max_tables 时暂时超出上限，由之后的建表淘汰）
+            self._evict_tables(keep=set(created.values()))
+        
+        if built or len(created) > len(built):
+            logger.info(f"建表完成: 新建 {len(built)} 个, 复用 {len(created) - len(built)} 个")
+        
+        if error is not None:
+            raise error
+        created.update(official)
+        return created
+    
+    def create_table_from_wikisql(self, wikisql_table: WikiSQLTable, use_col_format: bool = True) -> str:
+        """
+        根据WikiSQL表格创建数据库表格
+        
+        Args:
+            wikisql_table: WikiSQL表格对象
             
-            # 执行创建表格
-            with self.engine.connect() as conn:
-                conn.execute(text(create_sql))
-                conn.commit()
+        Returns:
+            创建的表格名称
+        """
+        logger.info(f"正在创建表格: {self._sanitize_table_name(wikisql_table.id)} (原ID: {wikisql_table.id})")
+        table_name = self._build_tables([wikisql_table], use_col_format)[wikisql_table.id]
+        logger.info(f"表格创建成功: {table_name}")
+        return table_name
+    
+    def register_tables(self, wikisql_tables: Dict[str, WikiSQLTable], use_col_format: bool = True) -> Dict[str, str]:
+        """
+        登记表格但不立即创建，首次被 execute_query 引用或 ensure_table 时才建表
+        
+        Args:
+            wikisql_tables: WikiSQL表格字典
+            use_col_format: 是否使用col0, col1...列名
             
-            # 插入数据
-            self._insert_table_data(table_name, clean_headers, wikisql_table.rows)
+        Returns:
+            table_id -> table_name 映射（表名是确定的，无需建表即可使用）
+        """
+        # 官方数据库中已有的表格直接可用
+        mapping, missing = self._map_official_tables(list(wikisql_tables.values()), use_col_format)
+        with self._state_lock:
+            self.created_tables.update(mapping)
             
-            # 记录创建的表格
-            self.created_tables[wikisql_table.id] = table_name
+            for wikisql_table in missing:
+                table_name = self._sanitize_table_name(wikisql_table.id)
+                self._pending[wikisql_table.id] = (wikisql_table, use_col_format)
+                self._pending_names[table_name] = wikisql_table.id
+                self._col_formats[wikisql_table.id] = use_col_format
+                mapping[wikisql_table.id] = table_name
+        
+        logger.info(f"已登记 {len(missing)} 个延迟创建的表格，{len(mapping) - len(missing)} 个使用官方数据库")
+        return mapping
+    
+    def ensure_table(self, table_id: str) -> Optional[str]:
+        """
+        确保表格已创建：已登记的表格立即建表，未登记的通过 table_resolver 获取
+        
+        Args:
+            table_id: WikiSQL表格ID
             
-            logger.info(f"表格创建成功: {table_name} ({len(wikisql_table.rows)} 行)")
+        Returns:
+            数据库表名；表格不可用时返回None
+        """
+        with self._state_lock:
+            return self._ensure_table_locked(table_id)
+    
+    def _ensure_table_locked(self, table_id: str) -> Optional[str]:
+        """ensure_table 的实现，调用方持有 _state_lock"""
+        pending = self._pending.get(table_id)
+        if pending is not None:
+            wikisql_table, use_col_format = pending
+        elif table_id in self.created_tables:
+            table_name = self.created_tables[table_id]
+            if table_name in self._table_lru:
+                self._table_lru.move_to_end(table_name)
+            self.table_stats["hits"] += 1
             return table_name
+        elif self.table_resolver is not None:
+            wikisql_table, use_col_format = self.table_resolver(table_id), self._col_formats.get(table_id, True)
+            if wikisql_table is None:
+                return None
+        else:
+            return None
+        
+        logger.info(f"按需创建表格: {table_id}")
+        self.table_stats["misses"] += 1
+        return self._build_tables([wikisql_table], use_col_format)[table_id]
+    
+    def _ensure_tables_for_query(self, query: str) -> Set[str]:
+        """
+        创建查询中引用的、尚未创建的已登记表格，更新已创建表格的LRU顺序并钉住这些表格
+        
+        Returns:
+            被钉住的表名，调用方用完后交给 _unpin_tables
+        """
+        if not self._pending_names and not self._table_lru:
+            return set()
+        identifiers = set(SQL_IDENTIFIER_RE.findall(query))
+        with self._state_lock:
+            pinned = identifiers & self._table_lru.keys()
+            for table_name in pinned:
+                self._table_lru.move_to_end(table_name)
+                self.table_stats["hits"] += 1
+            self._pin_tables(pinned)
+            try:
+                # 逐个建表并立即钉住，之后的建表不会淘汰同一查询先建好的表格
+                for table_name in identifiers & self._pending_names.keys():
+                    created = self._ensure_table_locked(self._pending_names[table_name])
+                    if created is not None and created not in pinned:
+                        self._pin_tables({created})
+                        pinned.add(created)
+            except Exception:
+                self._unpin_tables(pinned)
+                raise
+        return pinned
+    
+    def _pin_tables(self, table_names: Set[str]):
+        """钉住表格，使其在查询结束前不被淘汰（调用方持有 _state_lock）"""
+        for table_name in table_names:
+            self._pinned[table_name] = self._pinned.get(table_name, 0) + 1
+    
+    def _unpin_tables(self, table_names: Set[str]):
+        """释放 _ensure_tables_for_query 钉住的表格"""
+        if not table_names:
+            return
+        with self._state_lock:
+            for table_name in table_names:
+                count = self._pinned.get(table_name, 0) - 1
+                if count > 0:
+                    self._pinned[table_name] = count
+                else:
+                    self._pinned.pop(table_name, None)
+    
+    @contextmanager
+    def _query_tables(self, query: str):
+        """确保查询引用的表格已创建，并在上下文内阻止它们被淘汰"""
+        pinned = self._ensure_tables_for_query(query)
+        try:
+            yield
+        finally:
+            self._unpin_tables(pinned)
+    
+    def _db_used_bytes(self) -> int:
+        """数据库已用页面的字节数（不含空闲页）"""
+        with self.engine.connect() as conn:
+            page_count = conn.execute(text("PRAGMA page_count")).scalar()
+            freelist_count = conn.execute(text("PRAGMA freelist_count")).scalar()
+            page_size = conn.execute(text("PRAGMA page_size")).scalar()
+        return (page_count - freelist_count) * page_size
+    
+    def _evict_tables(self, keep: Set[str]):
+        """
+        超出表格数或内存预算时按LRU删除表格，被删除的表格重新登记为延迟创建
+        
+        Args:
+            keep: 不删除的表格名（刚创建的表格）；正被查询钉住的表格同样不删除
+        """
+        def over_budget() -> bool:
+            if self.max_tables and len(self._table_lru) > self.max_tables:
+                return True
+            return bool(self.memory_budget_bytes) and self._db_used_bytes() > self.memory_budget_bytes
+        
+        while over_budget():
+            victim = next((name for name in self._table_lru if name not in keep and name not in self._pinned), None)
+            if victim is None:
+                break
+            table_id, wikisql_table, use_col_format = self._table_lru.pop(victim)
+            self.drop_table(victim)
+            self.table_stats["evictions"] += 1
             
-        except Exception as e:
-            logger.error(f"创建表格失败: {e}")
-            raise
+            # 重新登记，下次被引用时再创建
+            if wikisql_table is not None:
+                self._pending[table_id] = (wikisql_table, use_col_format)
+            self._pending_names[victim] = table_id
     
-    def _insert_table_data(self, table_name: str, headers: List[str], rows: List[List[Any]]):
+    def get_table_stats(self) -> Dict[str, int]:
         """
-        插入表格数据
+        获取表格缓存统计
+        
+        Returns:
+            命中、未命中（按需建表）、淘汰次数，以及当前已创建和待创建的表格数
+        """
+        return {
+            **self.table_stats,
+            "materialized": len(self.created_tables),
+            "pending": len(self._pending_names),
+        }
+    
+    @staticmethod
+    def _normalize_rows(headers: List[str], rows: List[List[Any]]) -> List[List[Any]]:
+        """按列数补齐/截断每一行，空字符串转为NULL"""
+        width = len(headers)
+        normalized = []
+        for row in rows:
+            values = [None if value == '' else value for value in row[:width]]
+            if len(values) < width:
+                values.extend([None] * (width - len(values)))
+            normalized.append(values)
+        return normalized
+    
+    def _bulk_insert(self, cursor, table_name: str, headers: List[str], rows: List[List[Any]]):
+        """
+        使用executemany一次插入全部行；失败时清空该表并逐行插入，跳过出错的行
         
         Args:
+            cursor: DBAPI游标（调用方负责事务）
             table_name: 表格名称
             headers: 列名列表
             rows: 数据行列表
         """
         if not rows:
-            logger.info(f"表格 {table_name} 没有数据需要插入")
+            logger.debug(f"表格 {table_name} 没有数据需要插入")
             return
         
-        # 构建INSERT语句
-        placeholders = ', '.join([f':{header}' for header in headers])
         column_names = ', '.join([f'"{h}"' for h in headers])
+        placeholders = ', '.join(['?'] * len(headers))
         insert_sql = f'INSERT INTO "{table_name}" ({column_names}) VALUES ({placeholders})'
+        values = self._normalize_rows(headers, rows)
         
         try:
-            with self.engine.connect() as conn:
-                for row_idx, row in enumerate(rows):
-                    try:
-                        # 准备数据，确保长度匹配
-                        row_data = {}
-                        for i, header in enumerate(headers):
-                            value = row[i] if i < len(row) else None
-                            # 处理空值
-                            if value == '' or value is None:
-                                row_data[header] = None
-                            else:
-                                row_data[header] = value
-                        
-                        conn.execute(text(insert_sql), row_data)
-                        
-                    except Exception as e:
-                        logger.warning(f"插入第 {row_idx + 1} 行数据失败: {e}")
-                        continue
-                
-                conn.commit()
-                
-        except Exception as e:
-            logger.error(f"数据插入失败: {e}")
-            raise
+            cursor.executemany(insert_sql, values)
+            return
+        except sqlite3.Error as e:
+            logger.warning(f"表格 {table_name} 批量插入失败，改为逐行插入: {e}")
+            cursor.execute(f'DELETE FROM "{table_name}"')
+        
+        for row_idx, row_values in enumerate(values):
+            try:
+                cursor.execute(insert_sql, row_values)
+            except sqlite3.Error as e:
+                logger.warning(f"插入第 {row_idx + 1} 行数据失败: {e}")
+    
+    def _insert_table_data(self, table_name: str, headers: List[str], rows: List[List[Any]]):
+        """
+        插入表格数据（单个事务内批量插入）
+        
+        Args:
+            table_name: 表格名称
+            headers: 列名列表
+            rows: 数据行列表
+        """
+        if not rows:
+            logger.info(f"表格 {table_name} 没有数据需要插入")
+            return
+        
+        with self._db_lock.write():
+            raw_conn = self.engine.raw_connection()
+            try:
+                cursor = raw_conn.cursor()
+                cursor.execute("BEGIN")
+                self._bulk_insert(cursor, table_name, headers, rows)
+                raw_conn.commit()
+            except Exception as e:
+                logger.error(f"数据插入失败: {e}")
+                raise
+            finally:
+                raw_conn.close()
     
     def drop_table(self, table_name: str):
         """
@@ -298,18 +999,26 @@ class WikiSQLDatabaseManager:
         Args:
             table_name: 表格名称
         """
+        if self.readonly or table_name in self._official_tables:
+            raise ValueError(f"不能删除官方数据库中的表格: {table_name}")
+        
         try:
-            with self.engine.connect() as conn:
-                conn.execute(text(f'DROP TABLE IF EXISTS "{table_name}"'))
-                conn.commit()
-            
-            # 从记录中移除
-            for table_id, name in list(self.created_tables.items()):
-                if name == table_name:
-                    del self.created_tables[table_id]
-                    break
+            with self._state_lock, self._db_lock.write():
+                owner = self._table_owners.pop(table_name, None)
+                with self.engine.connect() as conn:
+                    conn.execute(text(f'DROP TABLE IF EXISTS "{table_name}"'))
+                    if owner is not None and self._persistent:
+                        conn.execute(text(f'DELETE FROM "{MANIFEST_TABLE}" WHERE table_id = :table_id'),
+                                     {"table_id": owner})
+                    conn.commit()
+                
+                # 从记录中移除
+                if owner is not None:
+                    self.created_tables.pop(owner, None)
+                    self._manifest.pop(owner, None)
+                self._table_lru.pop(table_name, None)
             
-            logger.info(f"表格已删除: {table_name}")
+            logger.debug(f"表格已删除: {table_name}")
             
         except Exception as e:
             logger.error(f"删除表格失败: {e}")
@@ -326,7 +1035,7 @@ class WikiSQLDatabaseManager:
             表格结构信息
         """
         try:
-            with self.engine.connect() as conn:
+            with self._query_tables(table_name), self._db_lock.read(), self.engine.connect() as conn:
                 # 获取表格结构
                 result = conn.execute(text(f'PRAGMA table_info("{table_name}")'))
                 columns = result.fetchall()
@@ -358,7 +1067,9 @@ class WikiSQLDatabaseManager:
         try:
             with self.engine.connect() as conn:
                 result = conn.execute(text("SELECT name FROM sqlite_master WHERE type='table'"))
-                tables = [row[0] for row in result.fetchall()]
+                tables = [row[0] for row in result.fetchall() if row[0] != MANIFEST_TABLE]
+                if self.attach_db:
+                    tables.extend(sorted(self._official_tables))
                 return tables
                 
         except Exception as e:
@@ -368,9 +1079,12 @@ class WikiSQLDatabaseManager:
     def _init_langchain_db(self):
         """重新初始化LangChain数据库连接"""
         try:
-            self.sql_db = SQLDatabase.from_uri(
+            from langchain_community.utilities import SQLDatabase
+            
+            self._sql_db = SQLDatabase.from_uri(
                 f"sqlite:///{self.db_path}",
                 include_tables=None,  # 包含所有表格
+                ignore_tables=[MANIFEST_TABLE],
                 sample_rows_in_table_info=3
             )
             logger.info("LangChain数据库连接已重新初始化")
@@ -378,53 +1092,99 @@ class WikiSQLDatabaseManager:
             logger.error(f"重新初始化LangChain数据库失败: {e}")
             raise
     
-    def get_langchain_db(self) -> SQLDatabase:
+    def get_langchain_db(self) -> "SQLDatabase":
         """
-        获取LangChain SQL数据库对象
+        获取LangChain SQL数据库对象，首次调用时导入LangChain并创建
+        
+        创建时反射数据库中已有的表格；延迟创建且尚未建好的表格不在其中。
         
         Returns:
             SQLDatabase对象
         """
-        return self.sql_db
+        if self._sql_db is None:
+            from langchain_community.utilities import SQLDatabase
+            
+            self._sql_db = SQLDatabase(self.engine, ignore_tables=[MANIFEST_TABLE])
+            logger.info("LangChain数据库对象已创建")
+        return self._sql_db
+    
+    @property
+    def sql_db(self) -> "SQLDatabase":
+        """LangChain SQL数据库对象（get_langchain_db() 的属性形式，保持兼容）"""
+        return self.get_langchain_db()
     
     def execute_query(self, query: str) -> List[Tuple]:
         """
         执行SQL查询
         
+        查询引用官方数据库中的表格时，与其列比较的字符串常量先转为小写，与表中的小写字符串值一致
+        
         Args:
             query: SQL查询语句
             
         Returns:
             查询结果
         """
+        if self.uses_official_tables(query):
+            query = lowercase_sql_strings(query, self.is_official_table)
         try:
-            with self.engine.connect() as conn:
-                result = conn.execute(text(query))
-                return result.fetchall()
+            # 查询的表格在执行结束前被钉住，其他线程的建表不会淘汰它们
+            with self._query_tables(query), self._db_lock.read():
+                if self.concurrent:
+                    conn = self._thread_connection()
+                    try:
+                        return conn.execute(text(query)).fetchall()
+                    finally:
+                        conn.rollback()
+                with self.engine.connect() as conn:
+                    result = conn.execute(text(query))
+                    return result.fetchall()
                 
         except Exception as e:
             logger.error(f"查询执行失败: {e}")
             raise
     
-    def create_multiple_tables(self, wikisql_tables: Dict[str, WikiSQLTable]) -> Dict[str, str]:
+    def _thread_connection(self) -> Connection:
+        """
+        当前线程的读连接（多线程模式），首次使用时从连接池取出并一直复用
+        
+        Returns:
+            SQLAlchemy连接
+        """
+        thread = threading.current_thread()
+        conn = self._thread_connections.get(thread)
+        if conn is None:
+            with self._connections_lock:
+                # 归还已结束线程的连接
+                for finished in [t for t in self._thread_connections if not t.is_alive()]:
+                    self._thread_connections.pop(finished).close()
+                conn = self.engine.connect()
+                self._thread_connections[thread] = conn
+        return conn
+    
+    def close(self):
+        """关闭各线程的读连接并释放连接池（共享缓存内存数据库随之销毁）"""
+        with self._connections_lock:
+            for conn in self._thread_connections.values():
+                conn.close()
+            self._thread_connections.clear()
+        if self._keeper is not None:
+            self._keeper.close()
+            self._keeper = None
+        self.engine.dispose()
+    
+    def create_multiple_tables(self, wikisql_tables: Dict[str, WikiSQLTable], use_col_format: bool = True) -> Dict[str, str]:
         """
-        批量创建表格
+        批量创建表格（一个事务内完成，失败的表格被跳过）
         
         Args:
             wikisql_tables: WikiSQL表格字典
+            use_col_format: 是否使用col0, col1...列名
             
         Returns:
             table_id -> table_name 映射
         """
-        created_mapping = {}
-        
-        for table_id, wikisql_table in wikisql_tables.items():
-            try:
-                table_name = self.create_table_from_wikisql(wikisql_table)
-                created_mapping[table_id] = table_name
-            except Exception as e:
-                logger.error(f"创建表格 {table_id} 失败: {e}")
-                continue
+        created_mapping = self._build_tables(list(wikisql_tables.values()), use_col_format, skip_failed=True)
         
         logger.info(f"批量创建完成: {len(created_mapping)}/{len(wikisql_tables)} 个表格")
         return created_mapping
@@ -361,11 +361,10 @@ class WikiSQLDirectLLMHeavy(WikiSQLDirectLLM):
     
     def _get_table_info_for_heavy(self, table_id: str) -> dict:
         """获取表格信息用于Heavy分析"""
-        if table_id not in self.current_tables:
+        table = self._get_table(table_id)
+        if table is None:
             return {}
         
-        table = self.current_tables[table_id]
-        
         return {
             "table_id": table_id,
             "headers": table.header,
@@ -0,0 +1,98 @@
+"""
+WikiSQL文件读写工具
+透明支持 .bz2 / .gz / .xz / .zst 压缩的JSONL文件，读取时在后台线程中解压
+"""
+
+import io
+import importlib.util
+from pathlib import Path
+from typing import IO, Union
+
+# 后台解压的块大小和预读块数
+DECOMPRESS_BLOCK_SIZE = 1 << 20
+DECOMPRESS_QUEUE_BLOCKS = 8
+
+# 官方WikiSQL代码中的文件工具（压缩格式识别和后台解压读取器的实现）
+WIKISQL_COMMON_FILE = Path(__file__).resolve().parent / "WikiSQL" / "lib" / "common.py"
+
+
+def _load_wikisql_common():
+    """
+    按文件路径加载 WikiSQL/lib/common.py
+
+    官方评估代码 (WikiSQL/evaluate.py) 需要独立运行，压缩文件的打开方式和后台解压读取器
+    的唯一实现放在那里；这里按文件位置加载，不依赖 sys.path 上名为 lib 的包
+    """
+    spec = importlib.util.spec_from_file_location("_wikisql_lib_common", WIKISQL_COMMON_FILE)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+_wikisql_common = _load_wikisql_common()
+
+# 支持的压缩格式后缀（不区分大小写）
+COMPRESSED_SUFFIXES = _wikisql_common.compressed_suffixes
+
+# 后台线程读取器: 在后台线程中从底层流（通常是解压流）按块读取数据放入有界队列，
+# 使解压与调用方的解析重叠进行；bz2/zlib/lzma解压时会释放GIL
+BackgroundReader = _wikisql_common.ThreadedReader
+
+
+def is_compressed(path: Union[str, Path]) -> bool:
+    """判断文件是否为支持的压缩格式（按后缀）"""
+    return str(path).lower().endswith(COMPRESSED_SUFFIXES)
+
+
+def _open_compressed_binary(path: Union[str, Path], mode: str) -> IO[bytes]:
+    """
+    以二进制模式打开压缩文件
+
+    Args:
+        path: 文件路径
+        mode: 'rb' 或 'wb'
+
+    Returns:
+        解压/压缩流
+    """
+    stream = _wikisql_common.open_compressed(path, mode)
+    if stream is None:
+        raise ValueError(f"不支持的压缩格式: {path}")
+    return stream
+
+
+def open_text(path: Union[str, Path], mode: str = 'r', encoding: str = 'utf-8',
+              background: bool = True) -> IO[str]:
+    """
+    以文本模式打开文件，压缩文件按后缀自动解压/压缩
+
+    Args:
+        path: 文件路径
+        mode: 'r'、'w' 或 'a'（压缩文件的 'a' 会追加一个新的压缩帧）
+        encoding: 文本编码
+        background: 读取压缩文件时是否在后台线程解压
+
+    Returns:
+        文本文件对象，换行处理与内置open()一致
+    """
+    mode = mode.replace('t', '')
+    if not is_compressed(path):
+        return open(path, mode, encoding=encoding)
+
+    if mode == 'r':
+        raw = _open_compressed_binary(path, 'rb')
+        if background:
+            raw = io.BufferedReader(BackgroundReader(raw, DECOMPRESS_BLOCK_SIZE, DECOMPRESS_QUEUE_BLOCKS),
+                                     buffer_size=DECOMPRESS_BLOCK_SIZE)
+        return io.TextIOWrapper(raw, encoding=encoding)
+
+    if mode in ('w', 'a'):
+        return io.TextIOWrapper(_open_compressed_binary(path, mode + 'b'), encoding=encoding)
+
+    raise ValueError(f"不支持的文件模式: {mode}")
+
+
+def count_lines(path: Union[str, Path]) -> int:
+    """统计（可能压缩的）文本文件行数"""
+    with open_text(path) as f:
+        return sum(1 for _ in f)
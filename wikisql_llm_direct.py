@@ -13,6 +13,8 @@ from pathlib import Path
 
 from wikisql_data_loader import WikiSQLDataLoader, WikiSQLQuestion, WikiSQLTable
 from wikisql_database_manager import WikiSQLDatabaseManager
+from wikisql_io import open_text
+from wikisql_sharding import QUESTION_ID_KEY
 
 # 设置日志
 logging.basicConfig(level=logging.INFO)
@@ -21,7 +23,10 @@ logger = logging.getLogger(__name__)
 class WikiSQLDirectLLM:
     """WikiSQL直接LLM查询助手 - 方案1实现"""
     
-    def __init__(self, api_key: Optional[str] = None, data_dir: str = "data", local_wikisql_path: str = None):
+    def __init__(self, api_key: Optional[str] = None, data_dir: str = "data", local_wikisql_path: str = None,
+                 db_path: str = ":memory:", lazy_tables: bool = True, max_tables: Optional[int] = None,
+                 memory_budget_mb: Optional[float] = None, readonly: bool = False, attach_db: Optional[str] = None,
+                 concurrent: bool = False):
         """
         初始化WikiSQL直接LLM查询助手
         
@@ -29,6 +34,13 @@ class WikiSQLDirectLLM:
             api_key: API密钥 (用于Gemini 2.5 Flash模型)
             data_dir: 数据存储目录
             local_wikisql_path: 本地WikiSQL项目路径
+            db_path: SQLite数据库路径；使用文件时已建好的表格在后续运行中直接复用
+            lazy_tables: 是否延迟建表（首次查询或构建提示词时才创建表格）
+            max_tables: 数据库中最多保留的表格数，超出时按LRU删除，再次使用时重新创建
+            memory_budget_mb: 数据库大小上限（MB），超出时按LRU删除表格
+            readonly: db_path 为官方分割数据库 (WikiSQL/data/{split}.db)，只读打开，不建任何表格
+            attach_db: 只读附加官方分割数据库，其中已有的表格不再重建
+            concurrent: 数据库管理器使用多线程模式，供多个线程并行处理问题时执行SQL
         """
         # 设置API密钥
         if api_key:
@@ -38,7 +50,11 @@ class WikiSQLDirectLLM:
         
         # 初始化组件
         self.data_loader = WikiSQLDataLoader(data_dir, local_wikisql_path)
-        self.db_manager = WikiSQLDatabaseManager()
+        self.db_manager = WikiSQLDatabaseManager(db_path, max_tables=max_tables, memory_budget_mb=memory_budget_mb,
+                                                 readonly=readonly, attach_db=attach_db, concurrent=concurrent)
+        self.lazy_tables = lazy_tables
+        # 未随数据集登记的表格（如 query() 指定的table_id）按需从数据加载器获取
+        self.db_manager.table_resolver = self._get_table
         
         # 初始化LLM (使用Google AI Studio)
         from langchain_google_genai import ChatGoogleGenerativeAI
@@ -51,6 +67,8 @@ class WikiSQLDirectLLM:
         )
         
         # 数据存储
+        self.current_split: str = "dev"
+        self.current_num_shards: int = 1
         self.current_questions: List[WikiSQLQuestion] = []
         self.current_tables: Dict[str, WikiSQLTable] = {}
         self.current_table_mapping: Dict[str, str] = {}  # wikisql_table_id -> db_table_name
@@ -58,25 +76,36 @@ class WikiSQLDirectLLM:
         
         logger.info("WikiSQL直接LLM查询助手初始化完成")
     
-    def load_wikisql_dataset(self, split: str = "dev", limit: Optional[int] = 10, force_download: bool = False):
+    def load_wikisql_dataset(self, split: str = "dev", limit: Optional[int] = 10, force_download: bool = False,
+                             referenced_tables_only: bool = True, shard_index: int = 0, num_shards: int = 1,
+                             shard_mode: str = "contiguous"):
         """
         加载WikiSQL数据集
         
         Args:
             split: 数据分割 ("train", "dev", "test")
-            limit: 限制加载的问题数量
+            limit: 限制加载的问题数量（分片时为所有分片合计的数量）
             force_download: 是否强制重新下载
+            referenced_tables_only: 只加载当前问题引用的表格
+            shard_index: 分片序号（从0开始）
+            num_shards: 分片总数，大于1时只加载、建表和预测本分片的问题
+            shard_mode: 分片方式，"contiguous" 或 "hash"（按table_id）
         """
         logger.info(f"正在加载WikiSQL数据集: {split} (限制: {limit})")
         
         # 加载真实数据
-        questions, tables = self.data_loader.load_dataset(split, limit, force_download)
+        questions, tables = self.data_loader.load_dataset(
+            split, limit, force_download, referenced_tables_only=referenced_tables_only,
+            shard_index=shard_index, num_shards=num_shards, shard_mode=shard_mode
+        )
         
         # 验证数据
         stats = self.data_loader.validate_dataset(questions, tables)
         logger.info(f"数据验证结果: {stats}")
         
         # 存储数据
+        self.current_split = split
+        self.current_num_shards = num_shards
         self.current_questions = questions
         self.current_tables = tables
         
@@ -85,48 +114,83 @@ class WikiSQLDirectLLM:
         
         logger.info(f"✅ 数据集加载完成: {len(questions)} 个问题, {len(tables)} 个表格")
     
+    def _get_table(self, table_id: str) -> Optional[WikiSQLTable]:
+        """
+        获取表格，未加载的表格通过数据加载器的字节偏移索引按需读取
+        
+        数据库限制了表格数或内存预算时，按需读取的表格不保存在 current_tables 中
+        （否则整个分割的表格都会留在内存里），再次需要时仍由偏移索引读取
+        
+        Args:
+            table_id: 表格ID
+            
+        Returns:
+            WikiSQLTable，不存在时返回None
+        """
+        table = self.current_tables.get(table_id)
+        if table is None:
+            try:
+                table = self.data_loader.get_table(table_id, self.current_split)
+            except Exception as e:
+                logger.error(f"按需加载表格 {table_id} 失败: {e}")
+                return None
+            bounded = self.db_manager.max_tables or self.db_manager.memory_budget_bytes
+            if table is not None and not bounded:
+                self.current_tables[table_id] = table
+        return table
+    
     def _create_database_tables(self):
         """创建数据库表格，使用col0, col1, col2...格式"""
         logger.info("正在创建数据库表格...")
         
         # 只为当前问题相关的表格创建数据库表
-        relevant_table_ids = set(q.table_id for q in self.current_questions)
-        relevant_tables = {tid: table for tid, table in self.current_tables.items() 
-                          if tid in relevant_table_ids}
+        relevant_tables = {}
+        for tid in dict.fromkeys(q.table_id for q in self.current_questions):
+            table = self._get_table(tid)
+            if table is not None:
+                relevant_tables[tid] = table
         
         logger.info(f"需要创建 {len(relevant_tables)} 个相关表格")
         
-        # 为每个表格创建数据库表，使用col格式
-        for table_id, table in relevant_tables.items():
-            try:
-                # 使用数据库管理器创建表格
-                db_table_name = self.db_manager.create_table_from_wikisql(table, use_col_format=True)
-                
-                # 存储映射关系
-                self.current_table_mapping[table_id] = db_table_name
-                
-                # 存储列名映射关系
-                column_names = [f"col{i}" for i in range(len(table.header))]
-                self.column_mapping[table_id] = {
-                    'original_headers': table.header,
-                    'db_columns': column_names,
-                    'mapping': dict(zip(table.header, column_names))
-                }
-                
-                logger.info(f"✅ 表格 {table_id} -> {db_table_name}")
-                
-            except Exception as e:
-                logger.error(f"创建表格 {table_id} 失败: {e}")
+        if self.lazy_tables:
+            # 只登记，首次查询或构建提示词时才建表
+            created = self.db_manager.register_tables(relevant_tables, use_col_format=True)
+        else:
+            # 所有表格在一个事务内批量创建，使用col格式；失败的表格被跳过
+            created = self.db_manager.create_multiple_tables(relevant_tables, use_col_format=True)
+        
+        for table_id, db_table_name in created.items():
+            table = relevant_tables[table_id]
+            
+            # 存储映射关系
+            self.current_table_mapping[table_id] = db_table_name
+            
+            # 存储列名映射关系
+            column_names = [f"col{i}" for i in range(len(table.header))]
+            self.column_mapping[table_id] = {
+                'original_headers': table.header,
+                'db_columns': column_names,
+                'mapping': dict(zip(table.header, column_names))
+            }
         
         logger.info(f"✅ 数据库表格创建完成: {len(self.current_table_mapping)} 个表格")
     
     def _build_table_context(self, table_id: str) -> str:
         """构建表格上下文信息"""
-        if table_id not in self.current_tables:
+        table = self._get_table(table_id)
+        if table is None:
             return "表格信息不可用"
         
-        table = self.current_tables[table_id]
-        db_table_name = self.current_table_mapping.get(table_id, "unknown")
+        # 延迟建表: 构建提示词时确保表格已创建，生成的SQL可立即执行
+        try:
+            db_table_name = self.db_manager.ensure_table(table_id)
+        except Exception as e:
+            logger.error(f"创建表格 {table_id} 失败: {e}")
+            db_table_name = None
+        if db_table_name:
+            self.current_table_mapping[table_id] = db_table_name
+        else:
+            db_table_name = self.current_table_mapping.get(table_id, "unknown")
         
         context_parts = []
         context_parts.append(f"表格名称: {db_table_name}")
@@ -139,13 +203,17 @@ class WikiSQLDirectLLM:
             data_type = table.types[i] if i < len(table.types) else "text"
             context_parts.append(f"  {col_name}: {header} ({data_type})")
         
-        # 数据样本
-        max_rows = min(5, len(table.rows))
+        # 数据样本；官方数据库中的字符串值为小写，样本按数据库中实际存储的值展示
+        official = self.db_manager.is_official_table(db_table_name)
+        rows = table.rows
+        max_rows = min(5, len(rows))
         if max_rows > 0:
             context_parts.append(f"\n数据样本 (前{max_rows}行):")
-            for i, row in enumerate(table.rows[:max_rows]):
-                row_data = [str(cell) for cell in row]
+            for i, row in enumerate(rows[:max_rows]):
+                row_data = [str(cell).lower() if official and isinstance(cell, str) else str(cell) for cell in row]
                 context_parts.append(f"  行{i+1}: {row_data}")
+        if official:
+            context_parts.append("注意: 该表格中的字符串值均为小写，WHERE条件中的字符串请使用小写")
         
         return "\n".join(context_parts)
     
@@ -341,7 +409,7 @@ class WikiSQLDirectLLM:
             WikiSQL格式的查询字典
         """
         try:
-            table = self.current_tables.get(question.table_id)
+            table = self._get_table(question.table_id)
             if not table:
                 logger.error(f"找不到表格: {question.table_id}")
                 return None
@@ -503,11 +571,13 @@ class WikiSQLDirectLLM:
         生成符合WikiSQL官方评估器格式的预测文件
         
         Args:
-            output_file: 输出文件路径
+            output_file: 输出文件路径（.bz2/.gz/.xz/.zst 后缀时自动压缩）
             limit: 限制处理的问题数量
             
         Returns:
             输出文件路径
+            
+        分片加载时每条预测附带 question_id，用 wikisql_sharding 合并各分片文件
         """
         if not self.current_questions:
             logger.error("没有加载问题数据")
@@ -526,7 +596,6 @@ class WikiSQLDirectLLM:
             try:
                 # 生成WikiSQL格式的预测
                 prediction = self.generate_wikisql_prediction(i)
-                predictions.append(prediction)
                 
                 # 显示进度
                 if (i + 1) % 5 == 0:
@@ -534,11 +603,15 @@ class WikiSQLDirectLLM:
                     
             except Exception as e:
                 logger.error(f"处理问题 {i+1} 失败: {e}")
-                predictions.append({"error": str(e)})
+                prediction = {"error": str(e)}
+            
+            if self.current_num_shards > 1:
+                prediction[QUESTION_ID_KEY] = question.id
+            predictions.append(prediction)
         
         # 保存预测结果
         try:
-            with open(output_file, 'w', encoding='utf-8') as f:
+            with open_text(output_file, 'w') as f:
                 for prediction in predictions:
                     f.write(json.dumps(prediction, ensure_ascii=False) + '\n')
             
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+WikiSQL数据分片
+多进程/多节点运行时按连续区间或table_id哈希划分问题，并将各分片的预测文件合并回官方评估顺序
+"""
+
+import json
+import zlib
+import logging
+from argparse import ArgumentParser
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple, TypeVar
+
+from wikisql_io import COMPRESSED_SUFFIXES, count_lines, open_text
+
+logger = logging.getLogger(__name__)
+
+# 分片方式: contiguous 按问题顺序切成连续区间; hash 按table_id的CRC32取模（同一表格的问题落在同一分片）
+SHARD_MODES = ("contiguous", "hash")
+
+# 分片预测文件中记录问题ID（源文件行号）的字段
+QUESTION_ID_KEY = "question_id"
+
+T = TypeVar("T")
+
+
+def validate_shard(shard_index: int, num_shards: int, shard_mode: str = "contiguous"):
+    """检查分片参数"""
+    if num_shards < 1:
+        raise ValueError(f"num_shards 必须 >= 1: {num_shards}")
+    if not 0 <= shard_index < num_shards:
+        raise ValueError(f"shard_index 必须在 [0, {num_shards}) 内: {shard_index}")
+    if shard_mode not in SHARD_MODES:
+        raise ValueError(f"无效的分片方式: {shard_mode}，可选 {SHARD_MODES}")
+
+
+def contiguous_range(total: int, shard_index: int, num_shards: int) -> Tuple[int, int]:
+    """
+    连续分片的区间，各分片大小相差不超过1
+
+    Args:
+        total: 问题总数
+        shard_index: 分片序号
+        num_shards: 分片总数
+
+    Returns:
+        [start, end) 区间
+    """
+    return total * shard_index // num_shards, total * (shard_index + 1) // num_shards
+
+
+def shard_of_table(table_id: str, num_shards: int) -> int:
+    """表格所属的哈希分片（CRC32，跨进程和机器稳定）"""
+    return zlib.crc32(table_id.encode('utf-8')) % num_shards
+
+
+def select_shard(questions: Sequence[T], shard_index: int, num_shards: int,
+                 shard_mode: str = "contiguous") -> List[T]:
+    """
+    从问题序列中选出指定分片
+
+    Args:
+        questions: 问题序列（需有 table_id 属性）
+        shard_index: 分片序号
+        num_shards: 分片总数
+        shard_mode: 分片方式
+
+    Returns:
+        该分片的问题，保持原有顺序
+    """
+    validate_shard(shard_index, num_shards, shard_mode)
+    if shard_mode == "contiguous":
+        start, end = contiguous_range(len(questions), shard_index, num_shards)
+        return list(questions[start:end])
+    return [q for q in questions if shard_of_table(q.table_id, num_shards) == shard_index]
+
+
+def shard_output_path(output_file: str, shard_index: int, num_shards: int) -> str:
+    """
+    分片预测文件名，如 predictions.jsonl -> predictions.shard-01-of-04.jsonl
+
+    Args:
+        output_file: 未分片时的输出文件名
+        shard_index: 分片序号
+        num_shards: 分片总数
+
+    Returns:
+        分片输出文件名（num_shards为1时原样返回）
+    """
+    if num_shards <= 1:
+        return output_file
+    path = Path(output_file)
+    compression = path.suffix if path.suffix.lower() in COMPRESSED_SUFFIXES else ""
+    base = path.name[:-len(compression)] if compression else path.name
+    stem, dot, ext = base.rpartition('.')
+    if not dot:
+        stem, ext = base, ""
+    width = len(str(num_shards - 1))
+    tag = f"shard-{shard_index:0{width}d}-of-{num_shards:0{width}d}"
+    name = f"{stem}.{tag}.{ext}" if ext else f"{stem}.{tag}"
+    return str(path.with_name(name + compression))
+
+
+def merge_shard_predictions(shard_files: Sequence[str], output_file: str, source_file: Optional[str] = None,
+                            fill_missing: bool = False, keep_ids: bool = False) -> int:
+    """
+    合并分片预测文件，按问题ID（源文件行号）恢复官方evaluate.py所需的逐行顺序
+
+    Args:
+        shard_files: 分片预测文件（每行需含 question_id）
+        output_file: 合并后的预测文件
+        source_file: 源问题文件；提供时要求覆盖其全部行。未提供时问题窗口由分片中最小和最大的ID推断，
+            要求窗口内ID连续（offset > 0 的运行从窗口起点开始，合并结果的第一行对应源文件第 min(ID) 行）
+        fill_missing: 缺失的问题写入错误预测而不是报错
+        keep_ids: 保留预测中的 question_id 字段
+
+    Returns:
+        写入的预测行数
+    """
+    predictions: Dict[int, dict] = {}
+    for shard_file in shard_files:
+        with open_text(shard_file) as f:
+            for line_num, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                prediction = json.loads(line)
+                if QUESTION_ID_KEY not in prediction:
+                    raise ValueError(f"{shard_file}:{line_num} 缺少 {QUESTION_ID_KEY} 字段")
+                question_id = int(prediction[QUESTION_ID_KEY])
+                if question_id in predictions:
+                    raise ValueError(f"问题 {question_id} 在多个分片中重复出现 ({shard_file})")
+                if not keep_ids:
+                    del prediction[QUESTION_ID_KEY]
+                predictions[question_id] = prediction
+
+    if source_file:
+        first, last = 1, count_lines(source_file)
+    else:
+        first, last = min(predictions, default=1), max(predictions, default=0)
+        if first > 1:
+            logger.info(f"问题窗口从源文件第 {first} 行开始，合并结果只包含第 {first}-{last} 行的预测")
+    total = max(last - first + 1, 0)
+    missing = [i for i in range(first, last + 1) if i not in predictions]
+    extra = [i for i in predictions if not first <= i <= last]
+    if extra:
+        raise ValueError(f"问题ID超出源文件范围: {extra[:10]}")
+    if missing:
+        if not fill_missing:
+            raise ValueError(f"缺少 {len(missing)} 个问题的预测，例如: {missing[:10]}")
+        logger.warning(f"缺少 {len(missing)} 个问题的预测，写入错误占位")
+
+    with open_text(output_file, 'w') as f:
+        for question_id in range(first, last + 1):
+            prediction = predictions.get(question_id, {"error": "missing prediction"})
+            f.write(json.dumps(prediction, ensure_ascii=False) + '\n')
+
+    logger.info(f"已合并 {len(shard_files)} 个分片, {total} 条预测 -> {output_file}")
+    return total
+
+
+def main():
+    """主函数: 合并分片预测文件"""
+    logging.basicConfig(level=logging.INFO)
+    parser = ArgumentParser(description="合并WikiSQL分片预测文件")
+    parser.add_argument('shard_files', nargs='+', help='分片预测文件')
+    parser.add_argument('-o', '--output', required=True, help='合并后的预测文件')
+    parser.add_argument('--source-file', help='源问题文件，用于检查是否覆盖全部问题（不提供时按分片中的ID范围合并）')
+    parser.add_argument('--fill-missing', action='store_true', help='缺失的问题写入错误预测')
+    parser.add_argument('--keep-ids', action='store_true', help='保留 question_id 字段')
+    args = parser.parse_args()
+
+    merge_shard_predictions(args.shard_files, args.output, args.source_file, args.fill_missing, args.keep_ids)
+
+
+if __name__ == "__main__":
+    main()
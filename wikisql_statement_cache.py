@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+WikiSQL查询语句缓存
+WikiSQL查询的形状固定: SELECT [agg](colN) FROM t WHERE colA op ? AND ...，
+按 (表, sel, agg, 条件列/操作符) 缓存生成的参数化SQL，条件值作为绑定参数传入；
+配合持久连接上sqlite3的预编译语句缓存，同一形状的查询只生成和编译一次
+"""
+
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Sequence, Tuple, TypeVar
+
+# 持久连接上sqlite3缓存的预编译语句数（sqlite3.connect 的 cached_statements，默认只有128）
+SQLITE_CACHED_STATEMENTS = 1024
+
+# 语句缓存默认保留的查询形状数
+DEFAULT_MAX_STATEMENTS = 65536
+
+T = TypeVar("T")
+
+
+def statement_key(table_id: str, sel: Any, agg: Any, conds: Sequence[Sequence[Any]]) -> Tuple[Hashable, ...]:
+    """
+    查询形状的缓存键: 条件只取列和操作符，不含值
+
+    Args:
+        table_id: 表格ID
+        sel: 选择列
+        agg: 聚合操作
+        conds: 条件列表 [[列, 操作符, 值], ...]
+
+    Returns:
+        可哈希的缓存键
+    """
+    return table_id, sel, agg, tuple(tuple(cond[:2]) if len(cond) >= 3 else (len(cond),) for cond in conds)
+
+
+class StatementCache:
+    """按查询形状缓存生成的语句（LRU），并统计命中率"""
+
+    def __init__(self, max_size: int = DEFAULT_MAX_STATEMENTS):
+        """
+        初始化语句缓存
+
+        Args:
+            max_size: 最多缓存的查询形状数，超出时淘汰最久未用的
+        """
+        self.max_size = max_size
+        self._statements: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_build(self, key: Hashable, build: Callable[[], T]) -> T:
+        """
+        取出缓存的语句，未命中时调用 build 生成并缓存
+
+        Args:
+            key: 查询形状（见 statement_key）
+            build: 无参数的语句生成函数；抛出异常时不缓存
+
+        Returns:
+            缓存或新生成的语句
+        """
+        statement = self._statements.get(key)
+        if statement is not None:
+            self._statements.move_to_end(key)
+            self.hits += 1
+            return statement
+
+        self.misses += 1
+        statement = build()
+        self._statements[key] = statement
+        if len(self._statements) > self.max_size:
+            self._statements.popitem(last=False)
+        return statement
+
+    def clear(self):
+        """清空缓存（数据库结构变化后调用），保留统计"""
+        self._statements.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        缓存统计
+
+        Returns:
+            命中数、未命中数、命中率和当前缓存的语句数
+        """
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": len(self._statements),
+        }
+
+    def __len__(self) -> int:
+        return len(self._statements)
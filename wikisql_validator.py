@@ -4,21 +4,62 @@ WikiSQL验证器 - 替代官方评估器
 解决编码问题并提供详细的评估结果
 """
 
+import sys
 import json
+import importlib
 import sqlite3
 import logging
-from typing import Dict, List, Any, Tuple
+from typing import Dict, List, Any, Sequence, Tuple
 from pathlib import Path
+from urllib.parse import quote
 import traceback
 
+from wikisql_io import open_text
+from wikisql_statement_cache import SQLITE_CACHED_STATEMENTS, StatementCache, statement_key
+
 # 设置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 执行后端: sqlite 按验证器自身的SQL规则执行；columnar 按官方评估规则（小写化、real列数值转换）
+# 在进程内的numpy列式引擎中执行，结果与官方 DBEngine 一致，适合大批量评估
+VALIDATOR_ENGINES = ("sqlite", "columnar")
+
+# 官方WikiSQL代码目录（列式引擎位于其中的 lib/columnar.py）
+WIKISQL_DIR = Path(__file__).resolve().parent / "WikiSQL"
+
+
+def import_wikisql_module(name: str):
+    """
+    导入官方代码 WikiSQL/lib 下的模块
+
+    官方代码以顶层包名 lib 互相导入，因此把 WIKISQL_DIR 放在 sys.path 最前面，
+    并确认导入的 lib 确实是 WikiSQL/lib，而不是路径上其他同名的包
+
+    Args:
+        name: 模块名，如 "dbengine"、"columnar"
+
+    Returns:
+        lib.<name> 模块
+
+    Raises:
+        ImportError: 已导入的 lib 包不是 WikiSQL/lib
+    """
+    if 'lib' not in sys.modules:
+        if str(WIKISQL_DIR) in sys.path:
+            sys.path.remove(str(WIKISQL_DIR))
+        sys.path.insert(0, str(WIKISQL_DIR))
+    lib = importlib.import_module('lib')
+    expected = (WIKISQL_DIR / 'lib').resolve()
+    if not any(Path(p).resolve() == expected for p in getattr(lib, '__path__', [])):
+        raise ImportError(f"已导入的 lib 包不是 {expected}: {getattr(lib, '__file__', None)}")
+    return importlib.import_module(f'lib.{name}')
+
+
 class WikiSQLValidator:
     """WikiSQL验证器"""
     
-    def __init__(self, source_file: str, db_file: str, predictions_file: str):
+    def __init__(self, source_file: str, db_file: str, predictions_file: str, engine: str = "sqlite"):
         """
         初始化验证器
         
@@ -26,7 +67,10 @@ class WikiSQLValidator:
             source_file: 源问题文件 (dev.jsonl)
             db_file: 数据库文件 (dev.db)
             predictions_file: 预测结果文件
+            engine: 执行后端（见 VALIDATOR_ENGINES）
         """
+        if engine not in VALIDATOR_ENGINES:
+            raise ValueError(f"无效的执行后端: {engine}，可选 {VALIDATOR_ENGINES}")
         self.source_file = Path(source_file)
         self.db_file = Path(db_file)
         self.predictions_file = Path(predictions_file)
@@ -43,6 +87,14 @@ class WikiSQLValidator:
         logger.info(f"  源文件: {self.source_file}")
         logger.info(f"  数据库: {self.db_file}")
         logger.info(f"  预测文件: {self.predictions_file}")
+        logger.info(f"  执行后端: {engine}")
+        
+        self.engine = engine
+        self._columnar = None  # 列式引擎，首次使用时加载
+        self._conn = None
+        self._table_names = None  # 数据库中的表名，首次查找时读取
+        self._columns: Dict[str, List[str]] = {}  # 表名 -> 列名
+        self.statement_cache = StatementCache()
     
     def load_source_data(self) -> List[Dict]:
         """加载源问题数据"""
@@ -50,7 +102,7 @@ class WikiSQLValidator:
         questions = []
         
         try:
-            with open(self.source_file, 'r', encoding='utf-8') as f:
+            with open_text(self.source_file) as f:
                 for line_num, line in enumerate(f, 1):
                     line = line.strip()
                     if not line:
@@ -70,7 +122,7 @@ class WikiSQLValidator:
             
             for encoding in encodings:
                 try:
-                    with open(self.source_file, 'r', encoding=encoding) as f:
+                    with open_text(self.source_file, encoding=encoding) as f:
                         questions = []
                         for line_num, line in enumerate(f, 1):
                             line = line.strip()
@@ -100,7 +152,7 @@ class WikiSQLValidator:
         predictions = []
         
         try:
-            with open(self.predictions_file, 'r', encoding='utf-8') as f:
+            with open_text(self.predictions_file) as f:
                 for line_num, line in enumerate(f, 1):
                     line = line.strip()
                     if not line:
@@ -122,106 +174,151 @@ class WikiSQLValidator:
         logger.info(f"加载了 {len(predictions)} 个预测结果")
         return predictions
     
-    def execute_sql_on_db(self, sql: str, table_id: str) -> Any:
-        """在数据库中执行SQL查询"""
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """持久的数据库连接，首次使用时打开；相同SQL文本的预编译语句在连接上复用"""
+        if self._conn is None:
+            # 只读打开，官方分割数据库和编译好的分割数据库 (wikisql_compile_split.py) 均可
+            self._conn = sqlite3.connect(f"file:{quote(str(self.db_file.resolve()))}?mode=ro", uri=True,
+                                         cached_statements=SQLITE_CACHED_STATEMENTS)
+        return self._conn
+    
+    @property
+    def columnar(self):
+        """官方规则的列式引擎 (WikiSQL/lib/columnar.py)，首次使用时加载"""
+        if self._columnar is None:
+            ColumnarEngine = import_wikisql_module("columnar").ColumnarEngine
+            self._columnar = ColumnarEngine(str(self.db_file))
+        return self._columnar
+    
+    def close(self):
+        """关闭数据库连接"""
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+        if self._columnar is not None:
+            self._columnar.close()
+            self._columnar = None
+    
+    def execute_sql_on_db(self, sql: str, table_id: str, params: Sequence[Any] = ()) -> Any:
+        """在数据库中执行SQL查询（条件值通过 params 绑定）"""
         try:
-            conn = sqlite3.connect(self.db_file)
-            cursor = conn.cursor()
-            
-            # 执行查询
-            cursor.execute(sql)
-            result = cursor.fetchall()
-            
-            conn.close()
-            return result
+            cursor = self.conn.execute(sql, params)
+            return cursor.fetchall()
             
         except Exception as e:
-            logger.error(f"SQL执行失败: {sql}, 错误: {e}")
+            logger.error(f"SQL执行失败: {sql}, 参数: {list(params)}, 错误: {e}")
             return None
     
-    def wikisql_to_sql(self, query: Dict, table_id: str) -> str:
-        """将WikiSQL格式转换为SQL语句"""
-        try:
-            # 获取表格信息
-            conn = sqlite3.connect(self.db_file)
-            cursor = conn.cursor()
-            
-            # 查找表格名称
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-            tables = cursor.fetchall()
-            
-            # 找到匹配的表格
-            table_name = None
-            for (name,) in tables:
-                if table_id in name or name.endswith(table_id.replace('-', '_')):
-                    table_name = name
-                    break
-            
-            if not table_name:
-                # 使用第一个表格作为默认
-                if tables:
-                    table_name = tables[0][0]
-                else:
-                    raise Exception("找不到任何表格")
-            
-            # 获取列信息
-            cursor.execute(f"PRAGMA table_info({table_name})")
-            columns = cursor.fetchall()
-            conn.close()
-            
+    def _find_table_name(self, table_id: str) -> str:
+        """查找表格ID对应的表名（表名列表只读取一次）"""
+        if self._table_names is None:
+            self._table_names = [name for (name,) in
+                                 self.conn.execute("SELECT name FROM sqlite_master WHERE type='table'")]
+        
+        # 找到匹配的表格
+        for name in self._table_names:
+            if table_id in name or name.endswith(table_id.replace('-', '_')):
+                return name
+        
+        # 使用第一个表格作为默认
+        if self._table_names:
+            return self._table_names[0]
+        raise Exception("找不到任何表格")
+    
+    def _get_column_names(self, table_name: str) -> List[str]:
+        """表格的列名（按表缓存）"""
+        columns = self._columns.get(table_name)
+        if columns is None:
+            columns = [row[1] for row in self.conn.execute(f"PRAGMA table_info({table_name})")]
             if not columns:
                 raise Exception(f"表格 {table_name} 没有列信息")
-            
-            # 构建SQL
-            sel_col = query.get('sel', 0)
-            agg_op = query.get('agg', 0)
-            conditions = query.get('conds', [])
-            
-            # 聚合操作映射
-            agg_ops = ['', 'MAX', 'MIN', 'COUNT', 'SUM', 'AVG']
-            
-            # 选择列
-            if sel_col < len(columns):
-                col_name = columns[sel_col][1]  # 列名
-            else:
-                col_name = columns[0][1]  # 默认第一列
-            
-            # 构建SELECT部分
-            if agg_op > 0 and agg_op < len(agg_ops):
-                select_part = f"{agg_ops[agg_op]}({col_name})"
+            self._columns[table_name] = columns
+        return columns
+    
+    def _build_statement(self, query: Dict, table_id: str) -> Tuple[str, Tuple[bool, ...]]:
+        """
+        生成查询形状对应的参数化SQL
+        
+        Returns:
+            (SQL语句, 每个条件是否生成了占位符)
+        """
+        table_name = self._find_table_name(table_id)
+        columns = self._get_column_names(table_name)
+        
+        # 构建SQL
+        sel_col = query.get('sel', 0)
+        agg_op = query.get('agg', 0)
+        conditions = query.get('conds', [])
+        
+        # 聚合操作映射
+        agg_ops = ['', 'MAX', 'MIN', 'COUNT', 'SUM', 'AVG']
+        
+        # 选择列
+        if sel_col < len(columns):
+            col_name = columns[sel_col]  # 列名
+        else:
+            col_name = columns[0]  # 默认第一列
+        
+        # 构建SELECT部分
+        if agg_op > 0 and agg_op < len(agg_ops):
+            select_part = f"{agg_ops[agg_op]}({col_name})"
+        else:
+            select_part = col_name
+        
+        # 构建WHERE部分，条件值以占位符绑定
+        where_parts = []
+        bound = []
+        # 操作符映射
+        ops = ['=', '>', '<']
+        for cond in conditions or []:
+            if len(cond) >= 3 and cond[0] < len(columns) and cond[1] < len(ops):
+                where_parts.append(f"{columns[cond[0]]} {ops[cond[1]]} ?")
+                bound.append(True)
             else:
-                select_part = col_name
-            
-            # 构建WHERE部分
-            where_parts = []
-            if conditions:
-                for cond in conditions:
-                    if len(cond) >= 3:
-                        cond_col = cond[0]
-                        cond_op = cond[1]
-                        cond_val = cond[2]
-                        
-                        if cond_col < len(columns):
-                            cond_col_name = columns[cond_col][1]
-                            
-                            # 操作符映射
-                            ops = ['=', '>', '<']
-                            if cond_op < len(ops):
-                                op = ops[cond_op]
-                                # 处理SQL注入和特殊字符
-                                escaped_val = str(cond_val).replace("'", "''")
-                                where_parts.append(f"{cond_col_name} {op} '{escaped_val}'")
-            
-            # 组装SQL
-            sql = f"SELECT {select_part} FROM {table_name}"
-            if where_parts:
-                sql += f" WHERE {' AND '.join(where_parts)}"
-            
-            return sql
+                bound.append(False)
+        
+        # 组装SQL
+        sql = f"SELECT {select_part} FROM {table_name}"
+        if where_parts:
+            sql += f" WHERE {' AND '.join(where_parts)}"
+        
+        return sql, tuple(bound)
+    
+    def wikisql_to_statement(self, query: Dict, table_id: str) -> Tuple[str, Tuple[Any, ...]]:
+        """
+        将WikiSQL格式转换为参数化SQL语句和绑定参数
+        
+        相同形状 (表, sel, agg, 条件列/操作符) 的SQL从语句缓存中取出。条件值按字符串绑定，
+        与以往内联为带引号的字符串字面量比较结果相同。
+        
+        Returns:
+            (SQL语句, 参数)；转换失败时返回 ("", ())
+        """
+        try:
+            conditions = query.get('conds', []) or []
+            key = statement_key(table_id, query.get('sel', 0), query.get('agg', 0), conditions)
+            sql, bound = self.statement_cache.get_or_build(key, lambda: self._build_statement(query, table_id))
+            params = tuple(str(cond[2]) for cond, use in zip(conditions, bound) if use)
+            return sql, params
             
         except Exception as e:
             logger.error(f"SQL转换失败: {e}")
-            return ""
+            return "", ()
+    
+    def wikisql_to_sql(self, query: Dict, table_id: str) -> str:
+        """将WikiSQL格式转换为可直接执行的SQL语句（条件值内联为字符串字面量）"""
+        sql, params = self.wikisql_to_statement(query, table_id)
+        if not params:
+            return sql
+        # 表名和列名均未加引号，语句中的 ? 只可能是占位符
+        parts = sql.split('?')
+        inlined = [parts[0]]
+        for value, part in zip(params, parts[1:]):
+            # 处理SQL注入和特殊字符
+            escaped_val = value.replace("'", "''")
+            inlined.append(f"'{escaped_val}'{part}")
+        return ''.join(inlined)
     
     def evaluate_single(self, question: Dict, prediction: Dict) -> Dict:
         """评估单个问题"""
@@ -254,20 +351,26 @@ class WikiSQLValidator:
             # 转换为SQL
             table_id = question.get("table_id", "")
             
+            if self.engine == "columnar":
+                self._evaluate_columnar(result, expected_query, predicted_query, table_id)
+                return result
+            
             try:
-                expected_sql = self.wikisql_to_sql(expected_query, table_id)
-                predicted_sql = self.wikisql_to_sql(predicted_query, table_id)
+                expected_sql, expected_params = self.wikisql_to_statement(expected_query, table_id)
+                predicted_sql, predicted_params = self.wikisql_to_statement(predicted_query, table_id)
                 
                 result["expected_sql"] = expected_sql
                 result["predicted_sql"] = predicted_sql
+                result["expected_params"] = list(expected_params)
+                result["predicted_params"] = list(predicted_params)
                 
                 # 执行SQL获取结果
                 if expected_sql:
-                    expected_result = self.execute_sql_on_db(expected_sql, table_id)
+                    expected_result = self.execute_sql_on_db(expected_sql, table_id, expected_params)
                     result["expected_result"] = expected_result
                 
                 if predicted_sql:
-                    predicted_result = self.execute_sql_on_db(predicted_sql, table_id)
+                    predicted_result = self.execute_sql_on_db(predicted_sql, table_id, predicted_params)
                     result["predicted_result"] = predicted_result
                     
                     # 比较结果
@@ -282,6 +385,21 @@ class WikiSQLValidator:
         
         return result
     
+    def _evaluate_columnar(self, result: Dict, expected_query: Dict, predicted_query: Dict, table_id: str):
+        """按官方评估规则在列式引擎中执行标准答案和预测，结果写入 result"""
+        engine = self.columnar
+        Query = import_wikisql_module("query").Query
+        try:
+            expected = Query.from_dict(expected_query)
+            predicted = Query.from_dict(predicted_query)
+            result["expected_sql"] = repr(expected)
+            result["predicted_sql"] = repr(predicted)
+            result["expected_result"] = engine.execute_query(table_id, expected, lower=True)
+            result["predicted_result"] = engine.execute_query(table_id, predicted, lower=True)
+            result["correct"] = result["expected_result"] == result["predicted_result"]
+        except Exception as e:
+            result["error"] = f"SQL执行错误: {e!r}"
+    
     def evaluate(self) -> Dict[str, Any]:
         """执行完整评估"""
         logger.info("开始评估...")
@@ -322,12 +440,19 @@ class WikiSQLValidator:
         accuracy = correct_count / min_count if min_count > 0 else 0
         error_rate = error_count / min_count if min_count > 0 else 0
         
+        if self.engine == "columnar":
+            cache_stats = self.columnar.statement_cache_info()
+        else:
+            cache_stats = self.statement_cache.stats()
+        self.close()
+        
         summary = {
             "total_questions": min_count,
             "correct_answers": correct_count,
             "errors": error_count,
             "accuracy": accuracy,
             "error_rate": error_rate,
+            "statement_cache": cache_stats,
             "results": results
         }
         
@@ -337,13 +462,15 @@ class WikiSQLValidator:
         logger.info(f"错误数量: {error_count}")
         logger.info(f"准确率: {accuracy:.4f} ({accuracy*100:.2f}%)")
         logger.info(f"错误率: {error_rate:.4f} ({error_rate*100:.2f}%)")
+        logger.info(f"语句缓存: 命中 {cache_stats['hits']}, 未命中 {cache_stats['misses']}, "
+                    f"命中率 {cache_stats['hit_rate']*100:.2f}%")
         
         return summary
     
     def save_detailed_report(self, summary: Dict, output_file: str = "evaluation_report.json"):
         """保存详细评估报告"""
         try:
-            with open(output_file, 'w', encoding='utf-8') as f:
+            with open_text(output_file, 'w') as f:
                 json.dump(summary, f, ensure_ascii=False, indent=2)
             
             logger.info(f"详细报告已保存: {output_file}")
@@ -377,20 +504,19 @@ class WikiSQLValidator:
 
 def main():
     """主函数"""
-    import sys
-    
-    if len(sys.argv) != 4:
-        print("用法: python wikisql_validator.py <source_file> <db_file> <predictions_file>")
+    if len(sys.argv) not in (4, 5):
+        print("用法: python wikisql_validator.py <source_file> <db_file> <predictions_file> [sqlite|columnar]")
         print("示例: python wikisql_validator.py data/dev.jsonl data/dev.db predictions.jsonl")
         return
     
     source_file = sys.argv[1]
     db_file = sys.argv[2]
     predictions_file = sys.argv[3]
+    engine = sys.argv[4] if len(sys.argv) == 5 else "sqlite"
     
     try:
         # 创建验证器
-        validator = WikiSQLValidator(source_file, db_file, predictions_file)
+        validator = WikiSQLValidator(source_file, db_file, predictions_file, engine)
         
         # 执行评估
         summary = validator.evaluate()